@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Catalog - Каталог библиотеки редактора (SQLite)
+
+Хранит для каждого фото, ключ - путь + mtime + размер файла:
+- настройки проявки (переживают перезапуск приложения)
+- размеры изображения и основные EXIF (камера, объектив, дата, ISO, ...)
+- ссылку на закэшированную миниатюру filmstrip
+
+Повторное открытие папки - индексированный запрос к каталогу плюс stat
+каждого файла: заголовки читаются лишь у новых и изменившихся (mtime или
+размер не совпали со строкой) файлов, в том числе отредактированных на
+месте. Пиксели при сканировании не декодируются. Миниатюры удалённых и
+изменившихся файлов удаляются из кэша.
+
+Маски кисти в каталоге не хранятся - только настройки.
+
+Автор: Fotya Tools
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+
+from PIL import Image
+
+logger = logging.getLogger('PhotoTools.catalog')
+
+# Расширения фото, которые видит библиотека редактора
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.tiff')
+
+# EXIF-теги, которые попадают в каталог: колонка -> (IFD или None, тег)
+EXIF_FIELDS = {
+    'make': (None, 0x010F),
+    'model': (None, 0x0110),
+    'taken': (0x8769, 0x9003),          # DateTimeOriginal
+    'iso': (0x8769, 0x8827),            # ISOSpeedRatings
+    'focal_length': (0x8769, 0x920A),
+    'f_number': (0x8769, 0x829D),
+    'exposure_time': (0x8769, 0x829A),
+    'lens': (0x8769, 0xA434),           # LensModel
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS photos (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    make TEXT,
+    model TEXT,
+    lens TEXT,
+    taken TEXT,
+    iso REAL,
+    focal_length REAL,
+    f_number REAL,
+    exposure_time REAL,
+    thumbnail TEXT,
+    settings TEXT
+);
+CREATE INDEX IF NOT EXISTS photos_folder ON photos (folder, path);
+'''
+
+# Путей в одном запросе WHERE path IN (...) (старые SQLite - до 999 параметров)
+QUERY_CHUNK = 500
+
+PHOTO_COLUMNS = ('path', 'folder', 'mtime', 'size', 'width', 'height') + tuple(EXIF_FIELDS) + ('thumbnail',)
+
+
+def _exif_value(value):
+    """Значение EXIF в тип, который понимает SQLite (рациональные - в float)"""
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', 'ignore')
+    if isinstance(value, str):
+        return value.strip('\x00 ').strip() or None
+    if isinstance(value, (tuple, list)):
+        return _exif_value(value[0]) if value else None
+    try:
+        return float(value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+
+
+def read_image_info(path):
+    """
+    Размеры и основные EXIF файла - только из заголовка, без декодирования.
+
+    Returns:
+        dict {width, height, make, model, lens, taken, iso, ...}
+    """
+    info = dict.fromkeys(('width', 'height') + tuple(EXIF_FIELDS))
+    with Image.open(path) as img:
+        info['width'], info['height'] = img.size
+        exif = img.getexif()
+        for column, (ifd, tag) in EXIF_FIELDS.items():
+            source = exif.get_ifd(ifd) if ifd is not None else exif
+            if tag in source:
+                info[column] = _exif_value(source[tag])
+    return info
+
+
+class Catalog:
+    """
+    Каталог фото библиотеки редактора.
+
+    Все методы, кроме thumbnail_file, вызываются из одного (главного)
+    потока: соединение SQLite к нему привязано.
+    """
+
+    def __init__(self, db_path, thumbnail_dir):
+        self.db_path = db_path
+        self.thumbnail_dir = thumbnail_dir
+        os.makedirs(thumbnail_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path)
+        self._conn.row_factory = sqlite3.Row
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    # ==================== ПАПКИ ====================
+
+    def open_folder(self, folder, extensions=IMAGE_EXTENSIONS):
+        """
+        Фото папки (по имени файла) с сохранёнными настройками.
+
+        Returns:
+            список dict {path, width, height, make, model, ..., thumbnail, settings}
+        """
+        folder = os.path.abspath(folder)
+        # mtime папки меняется только при добавлении/удалении файлов, поэтому
+        # сверяется каждый файл: правка на месте тоже должна попасть в каталог
+        self._rescan(folder, extensions)
+
+        rows = self._conn.execute('SELECT * FROM photos WHERE folder = ? ORDER BY path', (folder,))
+        return [self._photo(row) for row in rows]
+
+    def _rescan(self, folder, extensions):
+        """Сверяет каталог с диском: новые и изменённые файлы - заново, удалённые - прочь"""
+        known = {}
+        thumbnails = {}
+        for row in self._conn.execute('SELECT path, mtime, size, thumbnail FROM photos WHERE folder = ?',
+                                      (folder,)):
+            known[row['path']] = (row['mtime'], row['size'])
+            thumbnails[row['path']] = row['thumbnail']
+        on_disk = set()
+        updated = []
+        stale_thumbnails = []
+
+        for name in os.listdir(folder):
+            if not name.lower().endswith(extensions):
+                continue
+            path = os.path.join(folder, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            on_disk.add(path)
+            if known.get(path) == (stat.st_mtime, stat.st_size):
+                continue
+
+            try:
+                info = read_image_info(path)
+            except Exception as e:
+                logger.warning(f"Catalog: cannot read {name}: {e}")
+                info = dict.fromkeys(('width', 'height') + tuple(EXIF_FIELDS))
+            info.update(path=path, folder=folder, mtime=stat.st_mtime, size=stat.st_size,
+                        thumbnail=self._thumbnail_name(path, stat.st_mtime, stat.st_size))
+            updated.append(tuple(info[column] for column in PHOTO_COLUMNS))
+            if thumbnails.get(path) and thumbnails[path] != info['thumbnail']:
+                stale_thumbnails.append(thumbnails[path])
+
+        removed = [(path,) for path in known if path not in on_disk]
+        stale_thumbnails.extend(thumbnails[path] for (path,) in removed if thumbnails[path])
+        if not updated and not removed:
+            return
+
+        # Настройки переживают изменение файла: обновляются только его сведения
+        columns = ', '.join(PHOTO_COLUMNS)
+        assignments = ', '.join(f'{column} = excluded.{column}' for column in PHOTO_COLUMNS[1:])
+        with self._conn:
+            self._conn.executemany(
+                f'INSERT INTO photos ({columns}) VALUES ({", ".join("?" * len(PHOTO_COLUMNS))}) '
+                f'ON CONFLICT (path) DO UPDATE SET {assignments}', updated)
+            self._conn.executemany('DELETE FROM photos WHERE path = ?', removed)
+        self._remove_thumbnails(stale_thumbnails)
+        logger.info(f"Catalog: {folder}: {len(updated)} updated, {len(removed)} removed")
+
+    @staticmethod
+    def _photo(row):
+        photo = dict(row)
+        photo['settings'] = json.loads(photo['settings']) if photo['settings'] else None
+        return photo
+
+    # ==================== НАСТРОЙКИ ====================
+
+    def get_settings(self, paths):
+        """Сохранённые настройки для путей: dict {path: settings} (только известные)"""
+        by_abspath = {}
+        for path in paths:
+            by_abspath.setdefault(os.path.abspath(path), []).append(path)
+        keys = list(by_abspath)
+
+        result = {}
+        # Один запрос на пачку путей (не больше лимита параметров SQLite)
+        for start in range(0, len(keys), QUERY_CHUNK):
+            chunk = keys[start:start + QUERY_CHUNK]
+            rows = self._conn.execute(
+                f'SELECT path, settings FROM photos WHERE settings IS NOT NULL '
+                f'AND path IN ({", ".join("?" * len(chunk))})', chunk)
+            for row in rows:
+                for path in by_abspath[row['path']]:
+                    result[path] = json.loads(row['settings'])
+        return result
+
+    def save_settings(self, items):
+        """
+        Запоминает настройки проявки.
+
+        Args:
+            items: список (path, settings); фото вне каталога добавляются
+                   (со сведениями из заголовка файла)
+        """
+        with self._conn:
+            for path, settings in items:
+                path = os.path.abspath(path)
+                data = json.dumps(settings) if settings else None
+                cursor = self._conn.execute('UPDATE photos SET settings = ? WHERE path = ?', (data, path))
+                if cursor.rowcount == 0:
+                    self._add_photo(path, data)
+
+    def _add_photo(self, path, settings_data):
+        """Добавляет в каталог фото, открытое не через open_folder"""
+        try:
+            stat = os.stat(path)
+            info = read_image_info(path)
+        except Exception as e:
+            logger.warning(f"Catalog: cannot add {os.path.basename(path)}: {e}")
+            return
+        info.update(path=path, folder=os.path.dirname(path), mtime=stat.st_mtime, size=stat.st_size,
+                    thumbnail=self._thumbnail_name(path, stat.st_mtime, stat.st_size))
+        columns = PHOTO_COLUMNS + ('settings',)
+        values = tuple(info[column] for column in PHOTO_COLUMNS) + (settings_data,)
+        self._conn.execute(f'INSERT INTO photos ({", ".join(columns)}) '
+                           f'VALUES ({", ".join("?" * len(columns))})', values)
+
+    # ==================== МИНИАТЮРЫ ====================
+
+    @staticmethod
+    def _thumbnail_name(path, mtime, size):
+        """Имя файла миниатюры: меняется вместе с файлом фото"""
+        return hashlib.sha1(f"{path}|{mtime}|{size}".encode('utf-8')).hexdigest() + '.jpg'
+
+    def _remove_thumbnails(self, names):
+        """Удаляет из кэша миниатюры, на которые больше не ссылается каталог"""
+        for name in names:
+            try:
+                os.remove(os.path.join(self.thumbnail_dir, name))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Catalog: cannot remove thumbnail {name}: {e}")
+
+    def thumbnail_file(self, path):
+        """
+        Путь к закэшированной миниатюре фото (файла может ещё не быть).
+
+        Не обращается к базе - можно вызывать из фоновых потоков.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        return os.path.join(self.thumbnail_dir, self._thumbnail_name(path, stat.st_mtime, stat.st_size))
@@ -0,0 +1,2547 @@
+#!/usr/bin/env python3
+"""
+Develop Engine - Модуль проявки фотографий редактора
+
+Единый конвейер обработки без зависимостей от Tk:
+настройки (dict) + NumPy массив на входе, NumPy массив uint8 на выходе.
+
+Один и тот же код используется для:
+- превью в редакторе (PhotoToolsApp._do_apply_adjustments)
+- сохранения и экспорта в полном разрешении (editor_export_all и др.)
+
+Поэтому превью и экспорт всегда дают одинаковые пиксели, а скорость
+экспорта можно настраивать и измерять в одном месте.
+
+Порядок стадий:
+1. Цвет (экспозиция, яркость, контраст, насыщенность, света/тени, температура/тинт)
+2. Тоновая кривая
+3. Творческая LUT из файла .cube (с силой)
+   (1-3 запекаются в одну кэшированную 3D LUT и применяются одним проходом)
+4. Виньетка
+5. Локальные коррекции (маски)
+6. Детализация (шумоподавление, резкость, clarity)
+7. Геометрия (дисторсия, хром. аберрации, перспектива, aspect, масштаб,
+   сдвиг) - одна карта координат и один cv2.remap
+
+Автор: Fotya Tools
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+
+import numpy as np
+import cv2
+from PIL import Image
+
+# Точная реализация Darktable ashift
+try:
+    from darktable_perspective import DarktableAshift
+    DARKTABLE_ASHIFT_AVAILABLE = True
+except ImportError:
+    DARKTABLE_ASHIFT_AVAILABLE = False
+
+logger = logging.getLogger('PhotoTools.develop')
+
+
+# Максимальная сторона превью редактора (px). Все "пиксельные" параметры
+# (сдвиг, радиусы фильтров) задаются в единицах превью и масштабируются
+# при обработке в другом разрешении через pixel_scale.
+PREVIEW_MAX = 800
+
+# Уровни пирамиды превью (длинная сторона, px). Во время движения слайдера
+# рендерится наименьший уровень, заполняющий canvas, затем - PREVIEW_MAX.
+PYRAMID_LEVELS = (200, 400, PREVIEW_MAX)
+
+# Шаг сетки, на которой считаются карты геометрии во время движения
+# слайдера (черновик); затем они растягиваются билинейно до кадра
+DRAFT_MAP_STEP = 8
+
+# Высота полосы при проявке полного разрешения (develop_strips)
+STRIP_ROWS = 512
+
+# Начало полосы детализации выравнивается на эту величину, чтобы сетка
+# пирамиды pyramid_blur совпадала с сеткой всего кадра
+STRIP_ALIGN = 64
+
+# Sigma, начиная с которого размытие считается через пирамиду
+PYRAMID_BLUR_MIN_SIGMA = 6
+
+# Режимы шумоподавления: bilateral - исходный cv2.bilateralFilter,
+# guided - быстрый guided filter (цена не зависит от радиуса)
+DENOISE_MODES = ('bilateral', 'guided')
+
+# Сколько соседних фото библиотеки (в каждую сторону) готовит Prefetcher
+PREFETCH_RADIUS = 2
+
+# Примерное число пикселей кадра, по которым строится гистограмма
+HISTOGRAM_SAMPLES = 16384
+
+# Бюджет общего кэша производных плоскостей (яркость, радиус), байт;
+# плоскости больше четверти бюджета (полное разрешение) не кэшируются
+DERIVED_PLANE_CACHE_BYTES = 64 * 1024 * 1024
+
+# Сколько растушёванных масок держать в кэше feathered_mask
+FEATHER_CACHE_SIZE = 16
+
+# Сторона плитки маски кисти (TiledMask), px
+MASK_TILE = 64
+
+# Сколько последних мазков помнит TiledMask (для частичного пересчёта превью)
+MASK_CHANGE_LOG = 64
+
+# Порог, ниже которого растушёвка маски не входит в её прямоугольник
+# (при самых сильных коррекциях - меньше уровня яркости)
+MASK_BBOX_THRESHOLD = 1 / 1024
+
+# Параметры маски, от которых зависит результат локальных коррекций
+MASK_KEYS = ('feather', 'exposure', 'highlights', 'shadows', 'temperature', 'saturation')
+
+# Размер 3D LUT для цветовых коррекций (узлов по каждой оси)
+COLOR_LUT_SIZE = 33
+
+# Строк за один проход trilinear-интерполяции (ограничивает временные массивы)
+LUT_CHUNK_ROWS = 512
+
+# Значения по умолчанию для всех параметров проявки
+DEFAULT_SETTINGS = {
+    # Базовые
+    'exposure': 0.0,
+    'contrast': 1.0,
+    'highlights': 0,
+    'shadows': 0,
+    'brightness': 1.0,
+    'saturation': 1.0,
+    # Температура
+    'temperature': 0,
+    'tint': 0,
+    # Геометрия
+    'vertical': 0,
+    'horizontal': 0,
+    'rotation': 0,
+    'shift_x': 0,
+    'shift_y': 0,
+    'aspect': 0,
+    'scale': 0,
+    'perspective_algo': 'GIMP',
+    # Объектив
+    'distortion': 0,
+    'vignette': 0,
+    'chromatic': 0,
+    # Тоновая кривая
+    'curve_blacks': 0,
+    'curve_shadows': 0,
+    'curve_midtones': 0,
+    'curve_highlights': 0,
+    'curve_whites': 0,
+    # Творческая LUT (.cube): путь к файлу и сила 0..100
+    'lut_path': None,
+    'lut_strength': 100,
+    # Детализация
+    'sharpness': 0,
+    'denoise': 0,
+    'denoise_mode': 'bilateral',
+    'clarity': 0,
+}
+
+
+# Параметры, которые запекаются в цветовой 3D LUT (попиксельные операции)
+COLOR_LUT_KEYS = (
+    'exposure', 'contrast', 'highlights', 'shadows', 'brightness', 'saturation',
+    'temperature', 'tint',
+    'curve_blacks', 'curve_shadows', 'curve_midtones', 'curve_highlights', 'curve_whites',
+)
+
+# Параметры стадии детализации
+DETAIL_KEYS = ('sharpness', 'denoise', 'denoise_mode', 'clarity')
+
+# Параметры стадии геометрии
+GEOMETRY_KEYS = (
+    'vertical', 'horizontal', 'rotation', 'shift_x', 'shift_y', 'aspect', 'scale',
+    'perspective_algo', 'distortion', 'chromatic',
+)
+
+
+def normalize_settings(settings):
+    """
+    Дополняет настройки значениями по умолчанию.
+
+    Args:
+        settings: dict с настройками (может быть None или неполным)
+
+    Returns:
+        dict - полный набор настроек
+    """
+    result = dict(DEFAULT_SETTINGS)
+    if settings:
+        for key, value in settings.items():
+            if value is not None:
+                result[key] = value
+    return result
+
+
+def pixel_scale_for(width, height, preview_max=PREVIEW_MAX):
+    """
+    Во сколько раз изображение больше превью редактора.
+
+    Превью строится уменьшением длинной стороны до preview_max,
+    поэтому для полного разрешения масштаб = длинная сторона / сторона превью.
+    """
+    long_side = max(width, height)
+    preview_side = min(long_side, preview_max)
+    if preview_side <= 0:
+        return 1.0
+    return long_side / preview_side
+
+
+def load_image_array(path):
+    """Загружает файл как RGB uint8 массив (полное разрешение)"""
+    with Image.open(path) as img:
+        return np.array(img.convert("RGB"))
+
+
+def load_preview(path, preview_max=PREVIEW_MAX):
+    """
+    Загружает файл как превью редактора.
+
+    JPEG декодируется сразу в уменьшенном масштабе (draft), не меньше
+    нужного размера, и затем уменьшается LANCZOS - полный кадр не
+    распаковывается.
+
+    Returns:
+        (RGB uint8 массив с длинной стороной не больше preview_max,
+         (ширина, высота) оригинала)
+    """
+    with Image.open(path) as img:
+        size = img.size
+        if max(size) > preview_max:
+            scale = preview_max / max(size)
+            new_size = (int(size[0] * scale), int(size[1] * scale))
+            img.draft('RGB', new_size)
+            preview = img.convert("RGB").resize(new_size, Image.Resampling.LANCZOS)
+        else:
+            preview = img.convert("RGB")
+    return np.array(preview), size
+
+
+def load_thumbnail(path, size):
+    """Миниатюра файла (PIL.Image RGB), вписанная в size x size"""
+    with Image.open(path) as img:
+        # thumbnail сам декодирует JPEG в уменьшенном масштабе (draft)
+        img.thumbnail((size, size), Image.Resampling.LANCZOS)
+        return img.convert("RGB")
+
+
+def build_preview_pyramid(preview, levels=PYRAMID_LEVELS):
+    """
+    Строит пирамиду превью для прогрессивного рендера.
+
+    Args:
+        preview: массив основного превью (H, W, 3)
+        levels: длинные стороны меньших уровней
+
+    Returns:
+        dict {длинная сторона: массив}, включая само превью
+    """
+    top = max(preview.shape[:2])
+    pyramid = {top: preview}
+
+    # Каждый уровень уменьшается из предыдущего (INTER_AREA - быстро и без алиасинга)
+    current = preview
+    for level in sorted(levels, reverse=True):
+        if level >= top:
+            continue
+        h, w = current.shape[:2]
+        scale = level / max(h, w)
+        size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+        current = cv2.resize(current, size, interpolation=cv2.INTER_AREA)
+        pyramid[max(current.shape[:2])] = current
+
+    return pyramid
+
+
+def pick_pyramid_level(pyramid, target_long_side):
+    """Наименьший уровень пирамиды, длинная сторона которого не меньше target"""
+    for level in sorted(pyramid):
+        if level >= target_long_side:
+            return level
+    return max(pyramid)
+
+
+# ============================================================
+# ПРОВЕРКИ АКТИВНОСТИ СТАДИЙ
+# ============================================================
+
+def needs_color(s):
+    """Нужны ли цветовые коррекции"""
+    return (abs(s['exposure']) > 0.01 or abs(s['brightness'] - 1.0) > 0.01 or
+            abs(s['contrast'] - 1.0) > 0.01 or abs(s['saturation'] - 1.0) > 0.01 or
+            abs(s['temperature']) > 1 or abs(s['tint']) > 1 or
+            abs(s['highlights']) > 1 or abs(s['shadows']) > 1)
+
+
+def needs_curve(s):
+    """Нужна ли тоновая кривая"""
+    return (abs(s['curve_blacks']) > 1 or abs(s['curve_shadows']) > 1 or
+            abs(s['curve_midtones']) > 1 or abs(s['curve_highlights']) > 1 or
+            abs(s['curve_whites']) > 1)
+
+
+def needs_lut(s):
+    """Нужна ли творческая LUT (.cube)"""
+    return bool(s['lut_path']) and s['lut_strength'] > 0.5
+
+
+def needs_vignette(s):
+    """Нужна ли виньетка"""
+    return abs(s['vignette']) > 1
+
+
+def needs_detail(s):
+    """Нужны ли резкость / шумоподавление / clarity"""
+    return s['sharpness'] > 1 or s['denoise'] > 1 or abs(s['clarity']) > 1
+
+
+def needs_geometry(s):
+    """Нужны ли геометрические трансформации"""
+    return (abs(s['rotation']) > 0.1 or abs(s['vertical']) > 0.5 or
+            abs(s['horizontal']) > 0.5 or abs(s['aspect']) > 0.5 or s['scale'] > 0.5 or
+            abs(s['shift_x']) > 0.5 or abs(s['shift_y']) > 0.5 or abs(s['distortion']) > 1 or
+            abs(s['chromatic']) > 0.5)
+
+
+def active_masks(masks):
+    """Возвращает включённые непустые маски"""
+    result = []
+    for mask_data in masks or []:
+        if not mask_data.get('enabled', True):
+            continue
+        if mask_data['array'].max() < 0.01:
+            continue
+        result.append(mask_data)
+    return result
+
+
+# ============================================================
+# ПРОИЗВОДНЫЕ ПЛОСКОСТИ (ЯРКОСТЬ, РАДИУС)
+# Плоскости, которые нужны нескольким стадиям и маскам, считаются один
+# раз на изображение (или на размер кадра) и берутся из общего кэша.
+# ============================================================
+
+# Веса яркости Rec. 601 для cv2.transform
+LUMA_WEIGHTS = np.float32([[0.299, 0.587, 0.114]])
+
+# Кэш плоскостей: ключ -> (владелец, плоскость). Владелец (исходный массив)
+# хранится в записи, чтобы его id не мог достаться другому массиву.
+# Общий для потока рендера и UI, поэтому под замком.
+_plane_cache = {}
+_plane_cache_lock = threading.Lock()
+
+
+def luminance(arr):
+    """
+    Яркость (Rec. 601) одним cv2.transform.
+
+    Returns:
+        float32 массив (H, W) в шкале arr
+    """
+    if arr.dtype != np.float32:
+        arr = arr.astype(np.float32)
+    return cv2.transform(arr, LUMA_WEIGHTS)
+
+
+def _cached_plane(key, owner, compute):
+    """Плоскость из кэша или compute() (LRU в пределах DERIVED_PLANE_CACHE_BYTES)"""
+    with _plane_cache_lock:
+        entry = _plane_cache.pop(key, None)
+        if entry is not None and entry[0] is owner:
+            # Порядок вставки = порядок использования (LRU)
+            _plane_cache[key] = entry
+            return entry[1]
+
+    plane = compute()
+    plane.setflags(write=False)
+    if plane.nbytes <= DERIVED_PLANE_CACHE_BYTES // 4:
+        with _plane_cache_lock:
+            _plane_cache[key] = (owner, plane)
+            while sum(p.nbytes for _, p in _plane_cache.values()) > DERIVED_PLANE_CACHE_BYTES:
+                del _plane_cache[next(iter(_plane_cache))]
+    return plane
+
+
+def source_luminance(arr):
+    """
+    Яркость исходника (по идентичности массива): считается один раз на
+    изображение, пока массив не заменят.
+
+    Returns:
+        float32 массив (H, W), только для чтения
+    """
+    return _cached_plane(('luminance', id(arr)), arr, lambda: luminance(arr))
+
+
+def radius_plane(frame_w, frame_h, y0=0, x0=0, rows=None, cols=None):
+    """
+    Квадрат расстояния до центра кадра (w, h), нормированный на угол:
+    0 в центре, 1 в углах. Прямоугольник [y0, y0 + rows) x [x0, x0 + cols).
+
+    Зависит только от размера кадра, поэтому для превью (уровня пирамиды)
+    считается один раз; кадр полного разрешения - только нужной частью.
+
+    Returns:
+        float32 массив (rows, cols)
+    """
+    rows = frame_h - y0 if rows is None else rows
+    cols = frame_w - x0 if cols is None else cols
+
+    def compute(top, left, height, width):
+        Y, X = np.ogrid[top:top + height, left:left + width]
+        cx, cy = frame_w / 2, frame_h / 2
+        return (((X - cx) ** 2 + (Y - cy) ** 2) / (cx * cx + cy * cy)).astype(np.float32)
+
+    if frame_w * frame_h * 4 > DERIVED_PLANE_CACHE_BYTES // 4:
+        return compute(y0, x0, rows, cols)
+    plane = _cached_plane(('radius', frame_w, frame_h), None,
+                          lambda: compute(0, 0, frame_h, frame_w))
+    return plane[y0:y0 + rows, x0:x0 + cols]
+
+
+# ============================================================
+# ЦВЕТ, КРИВАЯ, ВИНЬЕТКА
+# ============================================================
+
+def apply_color(arr, s):
+    """
+    Глобальные цветовые коррекции.
+
+    Args:
+        arr: float32 массив (H, W, 3) в диапазоне 0..255
+        s: полный dict настроек
+
+    Returns:
+        float32 массив, обрезанный в 0..255
+    """
+    # Объединяем экспозицию и яркость в один множитель
+    color_mult = 1.0
+    if abs(s['exposure']) > 0.01:
+        color_mult *= (2 ** s['exposure'])
+    if abs(s['brightness'] - 1.0) > 0.01:
+        color_mult *= s['brightness']
+
+    if color_mult != 1.0:
+        arr = arr * color_mult
+
+    # Контраст
+    contrast = s['contrast']
+    if abs(contrast - 1.0) > 0.01:
+        arr = (arr - 128) * contrast + 128
+
+    # Яркость считается один раз; насыщенность её не меняет, а света и
+    # тени умножают пиксель на число - яркость умножается на то же
+    lum = None
+
+    # Насыщенность
+    saturation = s['saturation']
+    if abs(saturation - 1.0) > 0.01:
+        lum = luminance(arr)
+        arr = lum[:,:,np.newaxis] + (arr - lum[:,:,np.newaxis]) * saturation
+
+    # Хайлайты (света)
+    highlights = s['highlights']
+    if abs(highlights) > 1:
+        if lum is None:
+            lum = luminance(arr)
+        highlight_mask = np.clip((lum - 150) / 80, 0, 1)
+        gain = 1 + highlights / 100 * highlight_mask
+        arr = arr * gain[:,:,np.newaxis]
+        lum = lum * gain
+
+    # Тени
+    shadows = s['shadows']
+    if abs(shadows) > 1:
+        if lum is None:
+            lum = luminance(arr)
+        shadow_mask = np.clip((80 - lum) / 60, 0, 1)
+        arr = arr * (1 + shadows / 100 * shadow_mask)[:,:,np.newaxis]
+
+    # Температура и тинт
+    temp = s['temperature']
+    tint = s['tint']
+    if abs(temp) > 1 or abs(tint) > 1:
+        arr = np.array(arr, dtype=np.float32, copy=True)
+        if abs(temp) > 1:
+            arr[:,:,0] += temp * 0.6
+            arr[:,:,2] -= temp * 0.6
+        if abs(tint) > 1:
+            arr[:,:,1] -= tint * 0.5
+            arr[:,:,0] += tint * 0.2
+            arr[:,:,2] += tint * 0.2
+
+    return np.clip(arr, 0, 255).astype(np.float32, copy=False)
+
+
+def build_curve_lut(s):
+    """Строит 1D LUT (256 значений uint8) для тоновой кривой"""
+    lut = np.arange(256, dtype=np.float32)
+
+    # Чёрные (0-50)
+    if abs(s['curve_blacks']) > 1:
+        mask = lut < 50
+        lut[mask] = lut[mask] + s['curve_blacks'] * 0.5
+
+    # Тени (50-100)
+    if abs(s['curve_shadows']) > 1:
+        mask = (lut >= 30) & (lut < 100)
+        lut[mask] = lut[mask] + s['curve_shadows'] * 0.4
+
+    # Средние тона (100-180)
+    if abs(s['curve_midtones']) > 1:
+        mask = (lut >= 80) & (lut < 180)
+        lut[mask] = lut[mask] + s['curve_midtones'] * 0.5
+
+    # Света (180-220)
+    if abs(s['curve_highlights']) > 1:
+        mask = (lut >= 150) & (lut < 230)
+        lut[mask] = lut[mask] + s['curve_highlights'] * 0.4
+
+    # Белые (220-255)
+    if abs(s['curve_whites']) > 1:
+        mask = lut >= 200
+        lut[mask] = lut[mask] + s['curve_whites'] * 0.5
+
+    return np.clip(lut, 0, 255).astype(np.uint8)
+
+
+def apply_curve(arr, s):
+    """Тоновая кривая через 1D LUT (вход float32 0..255)"""
+    lut = build_curve_lut(s)
+    return lut[arr.astype(np.uint8)].astype(np.float32)
+
+
+# ============================================================
+# ЦВЕТОВАЯ 3D LUT
+# Все попиксельные цветовые операции (цвет + тоновая кривая) запекаются
+# в одну таблицу COLOR_LUT_SIZE³, которая применяется одним trilinear
+# проходом. Стоимость превью не зависит от числа активных слайдеров.
+# ============================================================
+
+def parse_cube(text):
+    """
+    Разбирает текст 3D LUT в формате .cube (Adobe/Resolve).
+
+    Returns:
+        float32 массив (N, N, N, 3) 0..255, оси [R, G, B], уже приведённый
+        к DOMAIN_MIN/DOMAIN_MAX файла (вход LUT - 0..255)
+
+    Raises:
+        ValueError: файл не 3D LUT или данные не сходятся с LUT_3D_SIZE
+    """
+    size = None
+    domain_min, domain_max = [0.0] * 3, [1.0] * 3
+    rows = []
+    for line in text.splitlines():
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        if not line[0].isalpha():
+            rows.append(line)
+            continue
+        # Ключевое слово отделено любыми пробельными символами (и табуляцией)
+        parts = line.split(None, 1)
+        keyword = parts[0]
+        value = parts[1] if len(parts) > 1 else ''
+        if keyword == 'LUT_3D_SIZE':
+            size = int(value)
+        elif keyword == 'LUT_1D_SIZE':
+            raise ValueError("1D LUT не поддерживается, нужна 3D (LUT_3D_SIZE)")
+        elif keyword == 'DOMAIN_MIN':
+            domain_min = [float(v) for v in value.split()]
+        elif keyword == 'DOMAIN_MAX':
+            domain_max = [float(v) for v in value.split()]
+        elif keyword == 'LUT_3D_INPUT_RANGE':
+            low, high = (float(v) for v in value.split())
+            domain_min, domain_max = [low] * 3, [high] * 3
+        # TITLE и прочие ключевые слова на результат не влияют
+
+    if size is None or size < 2:
+        raise ValueError("В файле нет LUT_3D_SIZE")
+    data = np.array(' '.join(rows).split(), dtype=np.float32)
+    if data.size != size ** 3 * 3:
+        raise ValueError(f"Ожидалось {size ** 3} строк данных, найдено {data.size // 3}")
+
+    # В .cube быстрее всех меняется R: строки идут как [B][G][R]
+    lut = data.reshape(size, size, size, 3).transpose(2, 1, 0, 3) * 255
+
+    # Домен входа отличен от 0..1 - пересэмплируем LUT на решётку 0..1
+    domain_min = np.float32(domain_min)
+    domain_max = np.float32(domain_max)
+    if np.any(domain_min != 0) or np.any(domain_max != 1):
+        grid = np.linspace(0, 1, size, dtype=np.float32)
+        lattice = np.stack(np.meshgrid(grid, grid, grid, indexing='ij'), axis=-1)
+        lattice = (lattice - domain_min) / (domain_max - domain_min) * 255
+        lut = sample_lut3d(lattice, lut)
+
+    return np.ascontiguousarray(lut, dtype=np.float32)
+
+
+@lru_cache(maxsize=8)
+def _load_cube_lut(path, mtime):
+    with open(path, encoding='utf-8', errors='replace') as f:
+        lut = parse_cube(f.read())
+    lut.setflags(write=False)
+    logger.info(f"Loaded LUT {os.path.basename(path)}: {lut.shape[0]}^3")
+    return lut
+
+
+def load_cube_lut(path):
+    """
+    Загружает .cube LUT (разбирается один раз, затем из кэша; изменение
+    файла на диске - по mtime - сбрасывает кэш).
+
+    Returns:
+        float32 массив (N, N, N, 3) 0..255, оси [R, G, B]
+    """
+    return _load_cube_lut(os.path.abspath(path), os.stat(path).st_mtime)
+
+
+# LUT, о пропаже которых уже предупредили (чтобы не повторять в каждом рендере)
+_missing_luts = set()
+
+
+def cube_lut_key(s):
+    """Ключ .cube LUT настроек: (путь, mtime) или None (не задана или файла нет)"""
+    if not needs_lut(s):
+        return None
+    path = os.path.abspath(s['lut_path'])
+    try:
+        return path, os.stat(path).st_mtime
+    except OSError:
+        if path not in _missing_luts:
+            _missing_luts.add(path)
+            logger.warning(f"LUT not found, skipped: {path}")
+        return None
+
+
+def sample_lut3d(points, lut):
+    """
+    Trilinear-выборка из 3D LUT для произвольных float точек (numpy).
+
+    Для запекания LUT в LUT (решётки до 65³ точек); кадры - через apply_lut3d.
+
+    Args:
+        points: float массив (..., 3) 0..255
+        lut: (N, N, N, 3), оси [R, G, B]
+    """
+    size = lut.shape[0]
+    pos = np.clip(points, 0, 255) * np.float32((size - 1) / 255.0)
+    index = np.minimum(pos.astype(np.int32), size - 2)
+    frac = (pos - index).astype(np.float32)
+    r, g, b = index[..., 0], index[..., 1], index[..., 2]
+    fr, fg, fb = frac[..., 0:1], frac[..., 1:2], frac[..., 2:3]
+
+    def along_r(gi, bi):
+        return lut[r, gi, bi] * (1 - fr) + lut[r + 1, gi, bi] * fr
+
+    low_b = along_r(g, b) * (1 - fg) + along_r(g + 1, b) * fg
+    high_b = along_r(g, b + 1) * (1 - fg) + along_r(g + 1, b + 1) * fg
+    return low_b * (1 - fb) + high_b * fb
+
+
+def color_lut_key(s):
+    """Ключ кэша LUT: только параметры, влияющие на цвет (и файл .cube)"""
+    cube = cube_lut_key(s)
+    return (tuple(float(s[k]) for k in COLOR_LUT_KEYS) +
+            (cube, float(s['lut_strength']) if cube else 0.0))
+
+
+@lru_cache(maxsize=8)
+def _build_color_lut(key, size):
+    """Запекает цвет, кривую и .cube LUT в LUT (size, size, size, 3) float32 0..255"""
+    s = normalize_settings(dict(zip(COLOR_LUT_KEYS, key)))
+    cube, strength = key[len(COLOR_LUT_KEYS):]
+
+    # Решётка входных цветов: ось 0 - R, ось 1 - G, ось 2 - B
+    grid = np.linspace(0, 255, size, dtype=np.float32)
+    r, g, b = np.meshgrid(grid, grid, grid, indexing='ij')
+    lattice = np.stack([r, g, b], axis=-1).reshape(size * size, size, 3)
+
+    if needs_color(s):
+        lattice = apply_color(lattice, s)
+    if needs_curve(s):
+        lattice = apply_curve(lattice, s)
+    if cube:
+        # Творческий look - после базовых коррекций, смешивается по силе
+        graded = sample_lut3d(lattice, _load_cube_lut(*cube))
+        lattice = lattice + (graded - lattice) * np.float32(strength / 100)
+
+    lut = np.ascontiguousarray(lattice.reshape(size, size, size, 3), dtype=np.float32)
+    lut.setflags(write=False)
+    return lut
+
+
+def build_color_lut(s, size=COLOR_LUT_SIZE):
+    """
+    Возвращает кэшированную цветовую 3D LUT для настроек.
+
+    LUT перестраивается только при изменении цветовых параметров;
+    одна и та же таблица используется для превью и полного разрешения.
+    С .cube LUT решётка не грубее, чем в файле.
+    """
+    key = color_lut_key(s)
+    cube = key[len(COLOR_LUT_KEYS)]
+    if cube:
+        size = max(size, _load_cube_lut(*cube).shape[0])
+    return _build_color_lut(key, size)
+
+
+@lru_cache(maxsize=4)
+def _lut_axis_tables(size):
+    """
+    Таблицы для значений uint8 (0..255) по осям LUT.
+
+    Returns:
+        (lookup, weight_r): lookup (256, 1, 3) для cv2.LUT с каналами
+        [смещение R-плитки в атласе, позиция по G, позиция по B],
+        weight_r (256,) - вес верхнего узла по оси R
+    """
+    pos = np.arange(256, dtype=np.float32) * ((size - 1) / 255.0)
+    index_r = np.minimum(pos.astype(np.int32), size - 2)
+    weight_r = (pos - index_r).astype(np.float32)
+    lookup = np.stack([(index_r * size).astype(np.float32), pos, pos], axis=-1)
+    return lookup.reshape(256, 1, 3), weight_r
+
+
+def apply_lut3d(arr, lut):
+    """
+    Применяет 3D LUT с trilinear-интерполяцией (векторизованно).
+
+    LUT раскладывается в 2D атлас (строки - G, столбцы - плитки R по B),
+    билинейная интерполяция по G/B делается cv2.remap для двух соседних
+    плиток R, затем они смешиваются по весу R.
+
+    Args:
+        arr: массив (H, W, 3) со значениями 0..255 (uint8 или float)
+        lut: (N, N, N, 3) float32, оси [R, G, B]
+
+    Returns:
+        float32 массив (H, W, 3) 0..255
+    """
+    if arr.dtype != np.uint8:
+        arr = np.clip(arr, 0, 255).astype(np.uint8)
+
+    size = lut.shape[0]
+    atlas = np.ascontiguousarray(lut.transpose(1, 0, 2, 3).reshape(size, size * size, 3))
+    lookup, weight_r = _lut_axis_tables(size)
+
+    h, w = arr.shape[:2]
+    out = np.empty((h, w, 3), dtype=np.float32)
+
+    # Построчные блоки: временные массивы ограничены LUT_CHUNK_ROWS строками
+    for y0 in range(0, h, LUT_CHUNK_ROWS):
+        block = arr[y0:y0 + LUT_CHUNK_ROWS]
+        tile_x, pos_g, pos_b = cv2.split(cv2.LUT(block, lookup))
+        map_x = cv2.add(tile_x, pos_b)
+
+        # Две соседние плитки R
+        low = cv2.remap(atlas, map_x, pos_g, cv2.INTER_LINEAR)
+        map_x += size
+        high = cv2.remap(atlas, map_x, pos_g, cv2.INTER_LINEAR)
+
+        # low + (high - low) * weight_r
+        fr = weight_r[block[:, :, 0]]
+        cv2.subtract(high, low, dst=high)
+        cv2.multiply(high, cv2.merge([fr, fr, fr]), dst=high)
+        cv2.add(low, high, dst=out[y0:y0 + LUT_CHUNK_ROWS])
+
+    return out
+
+
+def frame_bounds(arr, frame=None):
+    """
+    Положение arr в кадре: (y0, высота кадра, x0, ширина кадра).
+
+    frame - None (arr - весь кадр), (y0, высота кадра) для полосы
+    (develop_strips) или (y0, высота, x0, ширина) для прямоугольника
+    (частичный пересчёт превью в DevelopPipeline)
+    """
+    h, w = arr.shape[:2]
+    if frame is None:
+        return 0, h, 0, w
+    if len(frame) == 2:
+        return frame[0], frame[1], 0, w
+    return frame
+
+
+def apply_vignette(arr, s, frame=None):
+    """
+    Виньетка (затемнение/осветление краёв).
+
+    frame - положение arr в кадре (см. frame_bounds)
+    """
+    vignette = s['vignette']
+    h, w = arr.shape[:2]
+    y0, frame_h, x0, frame_w = frame_bounds(arr, frame)
+    # Квадрат нормированного радиуса - из общего кэша (один на размер кадра)
+    radius2 = radius_plane(frame_w, frame_h, y0, x0, h, w)
+
+    # vignette > 0 - затемнение по краям, < 0 - осветление
+    factor = 1 - radius2 * np.float32(vignette / 100)
+
+    arr = arr * factor[:, :, np.newaxis]
+    return np.clip(arr, 0, 255)
+
+
+# ============================================================
+# ЛОКАЛЬНЫЕ КОРРЕКЦИИ (МАСКИ)
+# ============================================================
+
+def feather_mask(mask, feather):
+    """Размывает края маски (feather) в разрешении самой маски"""
+    if feather <= 0:
+        return mask
+    # Размер ядра должен быть нечётным
+    kernel_size = feather * 2 + 1
+    # Sigma пропорционален feather для более заметного эффекта
+    sigma = feather * 0.5
+    return cv2.GaussianBlur(mask, (kernel_size, kernel_size), sigma)
+
+
+class TiledMask:
+    """
+    Маска кисти: покрытие uint8 в плитках MASK_TILE x MASK_TILE, которые
+    существуют только там, где рисовали.
+
+    Даже закрашенная целиком занимает вчетверо меньше float32, пустая -
+    почти ничего; дёшево копируется в библиотеку и в процессы экспорта.
+    В float32 0..1 разворачивается по требованию (to_array, через кэш
+    feathered_mask).
+
+    Кисть рисует из UI-потока, пока поток рендера читает ту же маску,
+    поэтому плитки меняются и читаются под замком маски.
+    """
+
+    def __init__(self, h, w):
+        self.shape = (h, w)
+        self.tiles = {}  # (ty, tx) -> uint8 (MASK_TILE, MASK_TILE)
+        self.version = 0
+        self._changes = []  # [(версия, (y1, y2, x1, x2))] последних мазков
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Замок не передаётся в процессы экспорта
+        with self._lock:
+            state = dict(self.__dict__, tiles=dict(self.tiles), _changes=list(self._changes))
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def paint(self, y1, y2, x1, x2, values, erase=False):
+        """
+        Кисть (максимум) или ластик (вычитание) в прямоугольнике [y1, y2) x [x1, x2).
+
+        values - покрытие 0..1 формы (y2 - y1, x2 - x1)
+        """
+        values = np.clip(values * 255 + 0.5, 0, 255).astype(np.uint8)
+        with self._lock:
+            self._paint(y1, y2, x1, x2, values, erase)
+
+    def _paint(self, y1, y2, x1, x2, values, erase):
+        t = MASK_TILE
+        for ty in range(y1 // t, (y2 - 1) // t + 1):
+            for tx in range(x1 // t, (x2 - 1) // t + 1):
+                top, left = ty * t, tx * t
+                a0, a1 = max(y1, top), min(y2, top + t)
+                b0, b1 = max(x1, left), min(x2, left + t)
+                src = values[a0 - y1:a1 - y1, b0 - x1:b1 - x1]
+
+                tile = self.tiles.get((ty, tx))
+                if tile is None:
+                    if erase or not src.any():
+                        continue
+                    tile = self.tiles[(ty, tx)] = np.zeros((t, t), dtype=np.uint8)
+                dst = tile[a0 - top:a1 - top, b0 - left:b1 - left]
+
+                if erase:
+                    np.subtract(dst, np.minimum(dst, src), out=dst)
+                    if not tile.any():
+                        del self.tiles[(ty, tx)]
+                else:
+                    np.maximum(dst, src, out=dst)
+
+        self.version += 1
+        self._changes.append((self.version, (y1, y2, x1, x2)))
+        del self._changes[:-MASK_CHANGE_LOG]
+
+    def dirty_since(self, version):
+        """
+        Прямоугольник, покрывающий все мазки после версии version.
+
+        Returns:
+            (y1, y2, x1, x2) или None, если журнал столько не помнит
+        """
+        with self._lock:
+            current = self.version
+            changes = [rect for v, rect in self._changes if v > version]
+        if version >= current or len(changes) != current - version:
+            return None
+        return (min(r[0] for r in changes), max(r[1] for r in changes),
+                min(r[2] for r in changes), max(r[3] for r in changes))
+
+    def max(self):
+        """Максимальное покрытие 0..1"""
+        with self._lock:
+            if not self.tiles:
+                return 0.0
+            return max(int(tile.max()) for tile in self.tiles.values()) / 255
+
+    def to_array(self, rect=None):
+        """
+        Плотная float32 маска 0..1 размера shape или только её
+        прямоугольник rect = (y0, y1, x0, x1)
+        """
+        h, w = self.shape
+        y0, y1, x0, x1 = rect or (0, h, 0, w)
+        t = MASK_TILE
+        out = np.zeros((y1 - y0, x1 - x0), dtype=np.float32)
+        with self._lock:
+            for (ty, tx), tile in self.tiles.items():
+                top, left = ty * t, tx * t
+                a0, a1 = max(y0, top), min(y1, top + t)
+                b0, b1 = max(x0, left), min(x1, left + t)
+                if a0 >= a1 or b0 >= b1:
+                    continue
+                np.multiply(tile[a0 - top:a1 - top, b0 - left:b1 - left], np.float32(1 / 255),
+                            out=out[a0 - y0:a1 - y0, b0 - x0:b1 - x0], casting='unsafe')
+        return out
+
+    def copy(self):
+        mask = TiledMask(*self.shape)
+        with self._lock:
+            mask.tiles = {key: tile.copy() for key, tile in self.tiles.items()}
+            mask.version = self.version
+        return mask
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            return sum(tile.nbytes for tile in self.tiles.values())
+
+
+class GradientMask:
+    """
+    Градиентная маска: несколько параметров в долях кадра вместо растра.
+
+    linear - полная сила в точке start, ноль в точке end, плавный переход
+    между ними (небо, земля). radial - эллипс center с полуосями radius
+    (доли ширины и высоты): полная сила внутри, спад к краю на долю
+    softness радиуса; invert - наоборот, снаружи (виньетка).
+
+    Значения считаются по требованию прямо в разрешении рендера
+    (evaluate) - маска ничего не хранит и не пересэмплируется.
+    """
+
+    KINDS = ('linear', 'radial')
+    PARAMS = ('start', 'end', 'center', 'radius', 'softness', 'invert')
+
+    def __init__(self, kind, start=(0.5, 0.0), end=(0.5, 0.5), center=(0.5, 0.5),
+                 radius=(0.3, 0.3), softness=0.5, invert=False):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown gradient kind: {kind}")
+        self.kind = kind
+        self.start = tuple(start)
+        self.end = tuple(end)
+        self.center = tuple(center)
+        self.radius = tuple(radius)
+        self.softness = softness
+        self.invert = invert
+        self.version = 0
+
+    def update(self, **params):
+        """Меняет параметры (start, end, center, radius, softness, invert) и версию"""
+        for name, value in params.items():
+            if name not in self.PARAMS:
+                raise AttributeError(name)
+            setattr(self, name, tuple(value) if isinstance(value, list) else value)
+        self.version += 1
+
+    def copy(self):
+        mask = GradientMask(self.kind, self.start, self.end, self.center, self.radius,
+                            self.softness, self.invert)
+        mask.version = self.version
+        return mask
+
+    def max(self):
+        """Максимальное покрытие 0..1"""
+        if self.kind == 'radial' and not self.invert and min(self.radius) <= 0:
+            return 0.0
+        return 1.0
+
+    def bbox(self, w, h):
+        """
+        Часть кадра (w, h), где маска не нулевая.
+
+        Returns:
+            (y0, y1, x0, x1) в пикселях кадра
+        """
+        if self.kind == 'linear' or self.invert:
+            return 0, h, 0, w
+        cx, cy = self.center
+        rx, ry = self.radius
+        return (max(0, int((cy - ry) * h) - 1), min(h, int(np.ceil((cy + ry) * h)) + 1),
+                max(0, int((cx - rx) * w) - 1), min(w, int(np.ceil((cx + rx) * w)) + 1))
+
+    def evaluate(self, w, h, x0=0, y0=0, cols=None, rows=None):
+        """
+        Прямоугольник [y0, y0 + rows) x [x0, x0 + cols) маски в кадре (w, h).
+
+        Returns:
+            float32 массив (rows, cols) 0..1
+        """
+        cols = w - x0 if cols is None else cols
+        rows = h - y0 if rows is None else rows
+        # Центры пикселей в долях кадра
+        xs = (np.arange(x0, x0 + cols, dtype=np.float32) + 0.5) / w
+        ys = ((np.arange(y0, y0 + rows, dtype=np.float32) + 0.5) / h)[:, np.newaxis]
+
+        if self.kind == 'linear':
+            # Проекция на отрезок start -> end; по x в единицах высоты,
+            # чтобы переход шёл перпендикулярно отрезку на любом формате кадра
+            aspect = w / h
+            dx = (self.end[0] - self.start[0]) * aspect
+            dy = self.end[1] - self.start[1]
+            length2 = max(dx * dx + dy * dy, 1e-12)
+            t = ((xs - self.start[0]) * (aspect * dx / length2) +
+                 (ys - self.start[1]) * (dy / length2))
+        else:
+            rx, ry = (max(r, 1e-6) for r in self.radius)
+            distance = np.sqrt(((xs - self.center[0]) / rx) ** 2 + ((ys - self.center[1]) / ry) ** 2)
+            softness = min(max(self.softness, 1e-3), 1.0)
+            t = (distance - (1 - softness)) / softness
+
+        t = np.clip(t, 0, 1)
+        # smoothstep: без излома на границах перехода
+        mask = 1 - t * t * (3 - 2 * t)
+        if self.invert:
+            mask = 1 - mask
+        return np.ascontiguousarray(np.broadcast_to(mask, (rows, cols)), dtype=np.float32)
+
+
+# Кэш растушёванных масок: (id массива, версия, feather) -> (массив, результат).
+# Массив хранится в записи, чтобы его id не мог достаться другому массиву.
+# Общий для потока рендера и UI (оверлей), поэтому под замком.
+_feather_cache = {}
+_feather_cache_lock = threading.Lock()
+
+
+def feathered_mask(mask_data):
+    """
+    Растушёванная маска из кэша (для коррекций и оверлея редактора).
+
+    Кисть меняет mask_data['array'] на месте и увеличивает
+    mask_data['version'], поэтому маска размывается заново только после
+    изменения - не при каждом движении слайдера или перерисовке.
+    TiledMask разворачивается в float32 здесь же и тоже кэшируется;
+    после мазка заново размывается только задетый им прямоугольник
+    (с радиусом растушёвки) поверх прошлой версии из кэша.
+
+    Returns:
+        float32 массив (только для чтения, если взят из кэша)
+    """
+    array = mask_data['array']
+    feather = int(mask_data.get('feather', 0))
+    if isinstance(array, GradientMask):
+        # Градиент и так плавный; считается в разрешении рендера
+        return array
+    if feather <= 0 and not isinstance(array, TiledMask):
+        return array
+
+    key = (id(array), mask_data.get('version', 0), feather)
+    with _feather_cache_lock:
+        entry = _feather_cache.pop(key, None)
+        if entry is not None and entry[0] is array:
+            # Порядок вставки = порядок использования (LRU)
+            _feather_cache[key] = entry
+            return entry[1]
+        # Последняя закэшированная версия этой же маски (до мазков)
+        previous = max(((k[1], e[1]) for k, e in _feather_cache.items()
+                        if k[0] == key[0] and k[2] == feather and e[0] is array and k[1] < key[1]),
+                       key=lambda item: item[0], default=None)
+
+    rect = None
+    if isinstance(array, TiledMask) and previous is not None:
+        rect = array.dirty_since(previous[0])
+
+    if rect is not None:
+        # Растушёвка меняет маску в радиусе ядра от мазка и читает ещё
+        # столько же вокруг
+        mask_h, mask_w = array.shape
+        y0, y1 = max(0, rect[0] - feather), min(mask_h, rect[1] + feather)
+        x0, x1 = max(0, rect[2] - feather), min(mask_w, rect[3] + feather)
+        top, bottom = max(0, y0 - feather), min(mask_h, y1 + feather)
+        left, right = max(0, x0 - feather), min(mask_w, x1 + feather)
+        patch = feather_mask(array.to_array((top, bottom, left, right)), feather)
+        result = previous[1].copy()
+        result[y0:y1, x0:x1] = patch[y0 - top:y1 - top, x0 - left:x1 - left]
+    else:
+        dense = array.to_array() if isinstance(array, TiledMask) else array
+        result = feather_mask(dense, feather)
+    result.setflags(write=False)
+    with _feather_cache_lock:
+        _feather_cache[key] = (array, result)
+        while len(_feather_cache) > FEATHER_CACHE_SIZE:
+            del _feather_cache[next(iter(_feather_cache))]
+    return result
+
+
+def masks_key(masks):
+    """Ключ кэша стадии тона для списка масок: массивы, их версии и параметры"""
+    return tuple((id(m['array']), m.get('version', 0)) + tuple(m.get(k, 0) for k in MASK_KEYS)
+                 for m in masks)
+
+
+def masks_dirty_rect(old_key, masks, w, h):
+    """
+    Часть кадра (w, h), которую изменили мазки кисти с тех пор, как у
+    масок был ключ old_key (masks_key).
+
+    Returns:
+        (y0, y1, x0, x1) или None, если изменилось что-то кроме мазков по
+        TiledMask (параметры, состав масок) и нужен полный пересчёт
+    """
+    new_key = masks_key(masks)
+    if len(old_key) != len(new_key):
+        return None
+
+    rect = None
+    for old, new, mask_data in zip(old_key, new_key, masks):
+        if old == new:
+            continue
+        array = mask_data['array']
+        if old[0] != new[0] or old[2:] != new[2:] or not isinstance(array, TiledMask):
+            return None
+        changed = array.dirty_since(old[1])
+        if changed is None:
+            return None
+
+        # Растушёвка расширяет мазок на радиус ядра, +1 на интерполяцию масштаба
+        pad = int(mask_data.get('feather', 0)) + 1
+        mask_h, mask_w = array.shape
+        sy, sx = h / mask_h, w / mask_w
+        changed = (max(0, int((changed[0] - pad) * sy)), min(h, int(np.ceil((changed[1] + pad) * sy))),
+                   max(0, int((changed[2] - pad) * sx)), min(w, int(np.ceil((changed[3] + pad) * sx))))
+        if rect is not None:
+            changed = (min(rect[0], changed[0]), max(rect[1], changed[1]),
+                       min(rect[2], changed[2]), max(rect[3], changed[3]))
+        rect = changed
+    return rect
+
+
+def mask_bbox(mask):
+    """
+    Ограничивающий прямоугольник ненулевой части маски.
+
+    Значения ниже MASK_BBOX_THRESHOLD не учитываются - это хвосты
+    растушёвки, меняющие результат меньше чем на уровень яркости.
+
+    Returns:
+        (y0, y1, x0, x1) или None, если маска пуста
+    """
+    rows = np.flatnonzero(mask.max(axis=1) > MASK_BBOX_THRESHOLD)
+    if not rows.size:
+        return None
+    cols = np.flatnonzero(mask[rows[0]:rows[-1] + 1].max(axis=0) > MASK_BBOX_THRESHOLD)
+    return rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+
+
+def resize_mask_region(mask, w, frame_h, x0, y0, cols, rows):
+    """
+    Прямоугольник [y0, y0 + rows) x [x0, x0 + cols) маски, растянутой
+    до (w, frame_h).
+
+    Совпадает с cv2.resize всей маски, но не создаёт её целиком.
+    """
+    mask_h, mask_w = mask.shape[:2]
+    if (mask_h, mask_w) == (frame_h, w):
+        return mask[y0:y0 + rows, x0:x0 + cols]
+    sx, sy = mask_w / w, mask_h / frame_h
+    M = np.float32([[sx, 0, (x0 + 0.5) * sx - 0.5],
+                    [0, sy, (y0 + 0.5) * sy - 0.5]])
+    return cv2.warpAffine(mask, M, (cols, rows),
+                          flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                          borderMode=cv2.BORDER_REPLICATE)
+
+
+def mask_corrections(arr, mask_data):
+    """
+    Все коррекции одной маски в полную силу (без смешивания с маской).
+
+    Returns:
+        новый float32 массив или None, если маска ничего не меняет
+    """
+    corrected = None
+    # Яркость считается один раз (по первой коррекции, которой она нужна)
+    # и дальше пересчитывается по формулам коррекций, а не по пикселям
+    lum = None
+    gain = 1.0
+
+    # Экспозиция
+    exp = mask_data['exposure']
+    if abs(exp) > 0.01:
+        gain = 2 ** exp
+        corrected = arr * gain
+
+    # Хайлайты (света)
+    highlights = mask_data.get('highlights', 0)
+    if abs(highlights) > 1:
+        x = arr if corrected is None else corrected
+        lum = luminance(arr) * np.float32(gain)
+        scale = 1 + highlights / 100 * np.clip((lum - 150) / 80, 0, 1)
+        corrected = x * scale[:,:,np.newaxis]
+        lum *= scale
+
+    # Тени
+    shadows = mask_data.get('shadows', 0)
+    if abs(shadows) > 1:
+        x = arr if corrected is None else corrected
+        if lum is None:
+            lum = luminance(arr) * np.float32(gain)
+        scale = 1 + shadows / 100 * np.clip((80 - lum) / 60, 0, 1)
+        corrected = x * scale[:,:,np.newaxis]
+        lum *= scale
+
+    # Температура
+    temp = mask_data['temperature']
+    if abs(temp) > 1:
+        if corrected is None:
+            corrected = arr.copy()
+        corrected[:,:,0] += temp * 0.6
+        corrected[:,:,2] -= temp * 0.6
+        if lum is not None:
+            lum += temp * 0.6 * (LUMA_WEIGHTS[0, 0] - LUMA_WEIGHTS[0, 2])
+
+    # Насыщенность
+    sat = mask_data['saturation']
+    if abs(sat - 1.0) > 0.01:
+        x = arr if corrected is None else corrected
+        if lum is None:
+            lum = luminance(x)
+        lum = lum[:,:,np.newaxis]
+        corrected = lum + (x - lum) * sat
+
+    return corrected
+
+
+def apply_local_adjustments(arr, masks, frame=None):
+    """
+    Применяет локальные коррекции по маскам.
+
+    Работа идёт только внутри ограничивающего прямоугольника маски
+    (mask_bbox), а все её коррекции смешиваются с кадром одним проходом -
+    цена растёт с закрашенной площадью, а не с размером кадра.
+
+    Маски хранятся в разрешении превью; при другом разрешении
+    они масштабируются к размеру arr. GradientMask вычисляется сразу
+    в разрешении кадра.
+
+    Args:
+        arr: float32 массив (H, W, 3)
+        masks: список dict {array (TiledMask, GradientMask или float32), exposure, highlights,
+               shadows, temperature, saturation, feather, enabled}
+        frame: положение arr в кадре (см. frame_bounds)
+    """
+    h, w = arr.shape[:2]
+    frame_y0, frame_h, frame_x0, frame_w = frame_bounds(arr, frame)
+    # Смешивание идёт на месте - arr может быть исходником
+    arr = np.array(arr, dtype=np.float32)
+
+    for mask_data in active_masks(masks):
+        mask = feathered_mask(mask_data)
+        if isinstance(mask, GradientMask):
+            bbox = mask.bbox(frame_w, frame_h)
+            y0, y1 = max(0, bbox[0] - frame_y0), min(h, bbox[1] - frame_y0)
+            x0, x1 = max(0, bbox[2] - frame_x0), min(w, bbox[3] - frame_x0)
+        else:
+            bbox = mask_bbox(mask)
+            if bbox is None:
+                continue
+
+            # Прямоугольник в координатах arr (+1 пиксель маски на интерполяцию)
+            mask_h, mask_w = mask.shape[:2]
+            sx, sy = frame_w / mask_w, frame_h / mask_h
+            y0 = max(0, int((bbox[0] - 1) * sy) - frame_y0)
+            y1 = min(h, int(np.ceil((bbox[1] + 1) * sy)) - frame_y0)
+            x0 = max(0, int((bbox[2] - 1) * sx) - frame_x0)
+            x1 = min(w, int(np.ceil((bbox[3] + 1) * sx)) - frame_x0)
+        if y1 <= y0 or x1 <= x0:
+            continue
+
+        region = arr[y0:y1, x0:x1]
+        corrected = mask_corrections(region, mask_data)
+        if corrected is None:
+            continue
+
+        if isinstance(mask, GradientMask):
+            m = mask.evaluate(frame_w, frame_h, frame_x0 + x0, frame_y0 + y0, x1 - x0, y1 - y0)
+        else:
+            m = resize_mask_region(mask, frame_w, frame_h, frame_x0 + x0, frame_y0 + y0,
+                                   x1 - x0, y1 - y0)
+        corrected -= region
+        corrected *= m[:,:,np.newaxis]
+        region += corrected
+
+    return np.clip(arr, 0, 255).astype(np.float32, copy=False)
+
+
+# ============================================================
+# ДЕТАЛИЗАЦИЯ
+# ============================================================
+
+def apply_detail(arr, s, pixel_scale=1.0):
+    """
+    Шумоподавление, резкость и clarity.
+
+    Args:
+        arr: uint8 массив (H, W, 3)
+        s: полный dict настроек
+        pixel_scale: масштаб относительно превью (радиусы фильтров растут вместе с ним)
+
+    Returns:
+        uint8 массив
+    """
+    for _, detail_pass in detail_passes(s, pixel_scale):
+        arr = detail_pass(arr)
+    return arr
+
+
+def pyramid_blur(arr, sigma):
+    """
+    Гауссово размытие за O(пикселей) при любом sigma.
+
+    Кадр уменьшается cv2.pyrDown, пока sigma на уровне не станет
+    2-4 px, там размывается остаток, затем cv2.pyrUp возвращает размер.
+    Каждый pyrDown/pyrUp сам размывает с sigma 1 px своего уровня - эта
+    дисперсия вычитается из остатка, поэтому итог близок к GaussianBlur.
+    """
+    if sigma < PYRAMID_BLUR_MIN_SIGMA:
+        return cv2.GaussianBlur(arr, (0, 0), sigma)
+
+    levels = 0
+    while sigma / 2 ** (levels + 1) >= 2:
+        levels += 1
+    # Дисперсия ядер pyrDown + pyrUp, в пикселях исходника
+    pyramid_var = 2 * (4 ** levels - 1) / 3
+    residual = np.sqrt(max(sigma * sigma - pyramid_var, 0.25)) / 2 ** levels
+
+    sizes = []
+    small = arr
+    for _ in range(levels):
+        sizes.append((small.shape[1], small.shape[0]))
+        small = cv2.pyrDown(small)
+    small = cv2.GaussianBlur(small, (0, 0), residual)
+    for size in reversed(sizes):
+        small = cv2.pyrUp(small, dstsize=size)
+    return small
+
+
+def guided_denoise(arr, radius, eps):
+    """
+    Шумоподавление самонаправленным guided filter (He et al.) по каналам.
+
+    Сохраняет края как bilateral, но состоит только из box-фильтров,
+    поэтому цена O(пикселей) при любом радиусе. При больших радиусах
+    коэффициенты считаются на уменьшенном кадре (fast guided filter).
+
+    Args:
+        arr: uint8 массив (H, W, 3)
+        radius: радиус окна, px
+        eps: регуляризация (дисперсия шума в долях 0..1)
+
+    Returns:
+        uint8 массив
+    """
+    h, w = arr.shape[:2]
+    image = arr.astype(np.float32) * (1.0 / 255)
+
+    # Шаг уменьшения - степень двойки, делитель STRIP_ALIGN: так сетка
+    # совпадает у полосы и всего кадра
+    sub = 1
+    while sub < STRIP_ALIGN // 2 and radius // (sub * 2) >= 4:
+        sub *= 2
+
+    small = image
+    if sub > 1:
+        # Дополняем до кратного sub, чтобы уменьшение было ровно в sub раз
+        padded = cv2.copyMakeBorder(image, 0, -h % sub, 0, -w % sub, cv2.BORDER_REFLECT)
+        small = cv2.resize(padded, None, fx=1 / sub, fy=1 / sub, interpolation=cv2.INTER_AREA)
+
+    r = max(1, radius // sub)
+    ksize = (2 * r + 1, 2 * r + 1)
+    mean = cv2.boxFilter(small, -1, ksize)
+    var = cv2.boxFilter(small * small, -1, ksize) - mean * mean
+    a = var / (var + eps)
+    b = mean - a * mean
+    mean_a = cv2.boxFilter(a, -1, ksize)
+    mean_b = cv2.boxFilter(b, -1, ksize)
+
+    if sub > 1:
+        size = (padded.shape[1], padded.shape[0])
+        mean_a = cv2.resize(mean_a, size, interpolation=cv2.INTER_LINEAR)[:h, :w]
+        mean_b = cv2.resize(mean_b, size, interpolation=cv2.INTER_LINEAR)[:h, :w]
+
+    out = mean_a * image + mean_b
+    return np.clip(out * 255 + 0.5, 0, 255).astype(np.uint8)
+
+
+def blur_halo(sigma):
+    """Ореол (строк с каждой стороны) для pyramid_blur с данным sigma"""
+    # Гауссово ядро OpenCV для uint8 - около 3 sigma, берём 4 с запасом;
+    # плюс поддержка ядер пирамиды
+    return int(np.ceil(4 * sigma)) + STRIP_ALIGN // 2
+
+
+def detail_passes(s, pixel_scale=1.0):
+    """
+    Фильтры детализации в порядке применения.
+
+    Returns:
+        список (ореол, функция uint8 -> uint8); ореол - сколько соседних
+        строк нужно фильтру с каждой стороны полосы, чтобы результат
+        полосы совпал с обработкой всего кадра (develop_strips)
+    """
+    denoise = s['denoise']
+    sharpness = s['sharpness']
+    clarity = s['clarity']
+    passes = []
+
+    # Шумоподавление (Guided Filter)
+    if denoise > 1 and s['denoise_mode'] == 'guided':
+        # Тот же радиус и порог краёв, что у bilateral, но без ограничения
+        # диаметра: цена guided filter от радиуса не зависит
+        radius = max(1, int((int(denoise / 10) + 3) * pixel_scale) // 2)
+        eps = (denoise / 2 / 255) ** 2
+        passes.append((2 * radius + STRIP_ALIGN, lambda a: guided_denoise(a, radius, eps)))
+
+    # Шумоподавление (Bilateral Filter)
+    elif denoise > 1:
+        d = int((int(denoise / 10) + 3) * pixel_scale)
+        d = min(d, 31)  # Больший диаметр слишком дорог по времени
+        sigma = denoise / 2
+        # При d <= 0 OpenCV берёт радиус 1.5 * sigmaSpace
+        halo = d // 2 if d > 0 else int(round(sigma * pixel_scale * 1.5))
+        passes.append((halo + 1, lambda a: cv2.bilateralFilter(a, d, sigma, sigma * pixel_scale)))
+
+    # Базовые слои резкости и clarity - pyramid_blur: цена не зависит
+    # от радиуса, который при экспорте растёт вместе с pixel_scale
+
+    # Резкость (Unsharp Mask)
+    if sharpness > 1:
+        sigma_sharp = 3 * pixel_scale
+        amount_sharp = sharpness / 100
+        passes.append((blur_halo(sigma_sharp),
+                       lambda a: cv2.addWeighted(a, 1 + amount_sharp,
+                                                 pyramid_blur(a, sigma_sharp),
+                                                 -amount_sharp, 0)))
+
+    # Clarity (локальный контраст)
+    if abs(clarity) > 1:
+        sigma_clarity = 50 * pixel_scale
+        amount_clarity = clarity / 200
+        passes.append((blur_halo(sigma_clarity),
+                       lambda a: cv2.addWeighted(a, 1 + amount_clarity,
+                                                 pyramid_blur(a, sigma_clarity),
+                                                 -amount_clarity, 0)))
+
+    return passes
+
+
+# ============================================================
+# ГЕОМЕТРИЯ
+# ============================================================
+
+def build_rotation_homography(yaw_deg, pitch_deg, roll_deg, w, h):
+    """
+    Строит гомографию в стиле GIMP EZ-Perspective.
+
+    GIMP применяет вращения ПОСЛЕДОВАТЕЛЬНО с коррекцией после каждого:
+    1. Pitch (up/down) + коррекция масштаба
+    2. Yaw (left/right) + коррекция масштаба
+    3. Roll (rotation) - без коррекции
+    """
+    # Фокусное расстояние (как в GIMP)
+    image_diagonal = np.sqrt(w*w + h*h)
+    diagonal_35mm = np.sqrt(36*36 + 24*24)
+    focal_length_mm = 50
+    z_fix = image_diagonal * focal_length_mm / diagonal_35mm
+
+    cx, cy = w / 2.0, h / 2.0
+
+    def proj_point(ud, lr, rot, x_in, y_in):
+        """Трансформация одной точки через 3D вращение"""
+        x, y, z = x_in, y_in, z_fix
+
+        # Вращение X (pitch)
+        x, y, z = (x,
+                  np.cos(ud)*y - np.sin(ud)*z,
+                  np.sin(ud)*y + np.cos(ud)*z)
+        # Вращение Y (yaw)
+        x, y, z = (np.cos(lr)*x - np.sin(lr)*z,
+                  y,
+                  np.sin(lr)*x + np.cos(lr)*z)
+        # Вращение Z (roll)
+        x, y, z = (np.cos(rot)*x - np.sin(rot)*y,
+                  np.sin(rot)*x + np.cos(rot)*y,
+                  z)
+
+        if abs(z) < 1e-10:
+            z = 1e-10
+        scale = z_fix / z
+        return x * scale, y * scale
+
+    # Начальные углы (относительно центра)
+    frame = [
+        (-cx, -cy),      # UL
+        (w - cx, -cy),   # UR
+        (-cx, h - cy),   # LL
+        (w - cx, h - cy) # LR
+    ]
+
+    ud = np.radians(pitch_deg)
+    lr = np.radians(yaw_deg)
+    rot = np.radians(roll_deg)
+
+    # === ШАГ 1: Pitch (up/down) с коррекцией ===
+    if abs(pitch_deg) > 0.01:
+        frame_ud = [proj_point(ud, 0, 0, x, y) for x, y in frame]
+
+        # Коррекция: вычисляем сдвиг и масштаб по центральной горизонтальной линии
+        scx, shift_y = proj_point(ud, 0, 0, 100, 0)
+
+        # Убираем вертикальный сдвиг и масштабируем чтобы сохранить размер
+        frame_ud = [(x, y - shift_y) for x, y in frame_ud]
+        scale = 100 / scx if abs(scx) > 1e-6 else 1.0
+        frame = [(x * scale, y * scale) for x, y in frame_ud]
+
+    # === ШАГ 2: Yaw (left/right) с коррекцией ===
+    if abs(yaw_deg) > 0.01:
+        frame_lr = [proj_point(0, lr, 0, x, y) for x, y in frame]
+
+        # Коррекция: вычисляем сдвиг и масштаб по центральной вертикальной линии
+        shift_x, scy = proj_point(0, lr, 0, 0, 100)
+
+        frame_lr = [(x - shift_x, y) for x, y in frame_lr]
+        scale = 100 / scy if abs(scy) > 1e-6 else 1.0
+        frame = [(x * scale, y * scale) for x, y in frame_lr]
+
+    # === ШАГ 3: Roll (rotation) - без коррекции ===
+    if abs(roll_deg) > 0.01:
+        frame = [proj_point(0, 0, rot, x, y) for x, y in frame]
+
+    # Переводим обратно в абсолютные координаты
+    corners_dst = [(x + cx, y + cy) for x, y in frame]
+
+    # Матрица гомографии
+    src_pts = np.array([[0, 0], [w, 0], [0, h], [w, h]], dtype=np.float32)
+    dst_pts = np.array(corners_dst, dtype=np.float32)
+
+    H = cv2.getPerspectiveTransform(src_pts, dst_pts)
+    return H.astype(np.float32)
+
+
+def normalize_homography(H, w, h):
+    """
+    Нормализует гомографию, фиксируя центр изображения (Center Preservation).
+    Это предотвращает 'улет' изображения при поворотах.
+    """
+    cx, cy = w / 2.0, h / 2.0
+    center_pt = np.array([cx, cy, 1.0])
+
+    # Где оказывается центр после трансформации
+    transformed_center = H @ center_pt
+    transformed_center /= transformed_center[2]
+
+    # Сдвиг, возвращающий центр на место
+    tx = cx - transformed_center[0]
+    ty = cy - transformed_center[1]
+
+    T = np.array([
+        [1, 0, tx],
+        [0, 1, ty],
+        [0, 0, 1]
+    ], dtype=np.float32)
+
+    return T @ H
+
+
+def build_geometry_homography(s, w, h, pixel_scale=1.0):
+    """
+    Полная матрица геометрии: перспектива -> aspect -> scale -> shift.
+
+    Матрица используется с WARP_INVERSE_MAP (отображает координаты
+    результата в координаты исходника).
+    """
+    rotation = s['rotation']
+    vertical = s['vertical']
+    horizontal = s['horizontal']
+
+    if DARKTABLE_ASHIFT_AVAILABLE and s.get('perspective_algo') == "Darktable (ashift)":
+        # Точный алгоритм Darktable
+        dt = DarktableAshift(w, h)
+        H = dt.get_homography(rotation=rotation, vertical=vertical, horizontal=horizontal,
+                              shear=0, orthocorr=0, aspect=1.0, forward=False)
+        H = np.asarray(H, dtype=np.float32)
+    else:
+        # Стандартный алгоритм через yaw/pitch/roll
+        pitch_deg = vertical * 0.3   # верх/низ (keystone по вертикали)
+        yaw_deg = horizontal * 0.3   # лево/право (keystone по горизонтали)
+        roll_deg = rotation          # Z-ось (поворот)
+
+        H = build_rotation_homography(yaw_deg, pitch_deg, roll_deg, w, h)
+        H = normalize_homography(H, w, h)
+
+    cx, cy = w / 2, h / 2
+
+    # Aspect ratio (растяжение по горизонтали/вертикали)
+    aspect = s['aspect']
+    if abs(aspect) > 0.5:
+        a = 1.0 + aspect / 100.0 * 0.3
+        A = np.array([
+            [a, 0, cx - cx*a],
+            [0, 1/a, cy - cy/a],
+            [0, 0, 1]
+        ], dtype=np.float32)
+        H = A @ H
+
+    # Scale: слайдер 0..200 мапим в Zoom 1.0..5.0
+    scale_val = s['scale']
+    if scale_val > 0.01:
+        zoom = 1.0 + (scale_val / 50.0)
+        k = 1.0 / zoom  # H maps Dst->Src, so k<1 means Zoom In
+        S = np.array([
+            [k, 0, cx - cx*k],
+            [0, k, cy - cy*k],
+            [0, 0, 1]
+        ], dtype=np.float32)
+        H = S @ H
+
+    # Сдвиг X/Y (в пикселях превью)
+    shift_x = s['shift_x'] * pixel_scale
+    shift_y = s['shift_y'] * pixel_scale
+    if abs(shift_x) > 0.5 or abs(shift_y) > 0.5:
+        T = np.array([
+            [1, 0, shift_x],
+            [0, 1, shift_y],
+            [0, 0, 1]
+        ], dtype=np.float32)
+        H = T @ H
+
+    return H
+
+
+# Цвета клеток шахматного фона для пустых областей после трансформации
+CHECKER_COLORS = ((80, 80, 90), (50, 50, 60))
+
+
+@lru_cache(maxsize=4)
+def checkerboard(h, w, cell=16, colors=CHECKER_COLORS):
+    """
+    Шахматный фон (H, W, 3) uint8, кэшируется по размеру.
+
+    Строится векторизованно по индексам клеток, без циклов по пикселям.
+    Возвращаемый массив только для чтения.
+    """
+    rows = (np.arange(h) // cell)[:, np.newaxis]
+    cols = (np.arange(w) // cell)[np.newaxis, :]
+    parity = ((rows + cols) % 2).astype(np.uint8)
+    board = np.asarray(colors, dtype=np.uint8)[parity]
+    board.setflags(write=False)
+    return board
+
+
+def geometry_key(s):
+    """Ключ кэша геометрии: только геометрические параметры"""
+    return tuple(s[k] for k in GEOMETRY_KEYS)
+
+
+def distortion_params(s, w, h):
+    """(k1, f, cx, cy) радиальной дисторсии объектива или None"""
+    distortion = s['distortion']
+    if abs(distortion) <= 1:
+        return None
+    k1 = distortion / 5000  # Масштабируем для плавности
+    return k1, float(max(w, h)), w / 2, h / 2
+
+
+def chromatic_scales(s):
+    """
+    Радиальные масштабы каналов R и B для поперечной хроматической
+    аберрации (G - опорный) или None.
+    """
+    chromatic = s['chromatic']
+    if abs(chromatic) <= 0.5:
+        return None
+    k = chromatic / 10000  # ±50 -> ±0.5% радиуса, несколько px на краю кадра
+    return 1 + k, 1 - k
+
+
+def source_coords(X, Y, H, distortion):
+    """
+    Точки результата -> точки исходника: гомография, затем модель дисторсии k1.
+
+    X, Y - float64 массивы координат результата
+    """
+    if H is not None:
+        z = H[2, 0] * X + H[2, 1] * Y + H[2, 2]
+        z[np.abs(z) < 1e-10] = 1e-10
+        X, Y = ((H[0, 0] * X + H[0, 1] * Y + H[0, 2]) / z,
+                (H[1, 0] * X + H[1, 1] * Y + H[1, 2]) / z)
+    if distortion is not None:
+        k1, f, cx, cy = distortion
+        x = (X - cx) / f
+        y = (Y - cy) / f
+        radial = 1 + k1 * (x * x + y * y)
+        X = x * radial * f + cx
+        Y = y * radial * f + cy
+    return X, Y
+
+
+def geometry_coords(s, w, h, pixel_scale=1.0, y0=0, y1=None, step=1):
+    """
+    Единая карта координат геометрии для строк [y0, y1) результата.
+
+    Дисторсия, хроматические аберрации, перспектива (GIMP/Darktable),
+    aspect, масштаб и сдвиг сводятся в одну карту, поэтому каждый пиксель
+    пересэмплируется один раз.
+
+    Args:
+        step: шаг сетки расчёта (>1 - черновик: карта считается на редкой
+              сетке и растягивается билинейно; все преобразования гладкие)
+
+    Returns:
+        None (геометрия тождественна) или список float32 карт (map_x, map_y):
+        одна на все каналы или три (R, G, B) при коррекции ХА
+    """
+    if y1 is None:
+        y1 = h
+    rows = y1 - y0
+
+    H = build_geometry_homography(s, w, h, pixel_scale)
+    if np.allclose(H, np.eye(3)):
+        H = None
+    distortion = distortion_params(s, w, h)
+    chromatic = chromatic_scales(s)
+    if H is None and distortion is None and chromatic is None:
+        return None
+
+    if step > 1:
+        # Узлы редкой сетки там, где их ожидает cv2.resize INTER_LINEAR
+        grid_w = max(2, -(-w // step))
+        grid_h = max(2, -(-rows // step))
+        xs = (np.arange(grid_w) + 0.5) * (w / grid_w) - 0.5
+        ys = y0 + (np.arange(grid_h) + 0.5) * (rows / grid_h) - 0.5
+    else:
+        xs = np.arange(w, dtype=np.float64)
+        ys = np.arange(y0, y1, dtype=np.float64)
+    X, Y = source_coords(*np.meshgrid(xs, ys), H, distortion)
+
+    if chromatic is None:
+        coords = [(X, Y)]
+    else:
+        # Каналы R и B масштабируются радиально от центра кадра
+        cx, cy = w / 2, h / 2
+        coords = [(cx + (X - cx) * scale, cy + (Y - cy) * scale)
+                  for scale in (chromatic[0], 1.0, chromatic[1])]
+
+    result = []
+    for map_x, map_y in coords:
+        map_x = map_x.astype(np.float32)
+        map_y = map_y.astype(np.float32)
+        if step > 1:
+            map_x = cv2.resize(map_x, (w, rows), interpolation=cv2.INTER_LINEAR)
+            map_y = cv2.resize(map_y, (w, rows), interpolation=cv2.INTER_LINEAR)
+        result.append((map_x, map_y))
+    return result
+
+
+def remap_coords(arr, coords, border_value):
+    """
+    cv2.remap по карте geometry_coords (общей или поканальной).
+
+    При поканальных картах все каналы (включая альфу RGBA) берутся по
+    карте G, затем R и B пересэмплируются по своим картам.
+    """
+    out = cv2.remap(arr, *coords[len(coords) // 2], cv2.INTER_LINEAR,
+                    borderMode=cv2.BORDER_CONSTANT, borderValue=border_value)
+    if len(coords) == 3:
+        for channel, index in ((0, 0), (2, 2)):
+            out[:, :, channel] = cv2.remap(cv2.extractChannel(arr, channel), *coords[index],
+                                           cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT,
+                                           borderValue=0)
+    return out
+
+
+def build_geometry_maps(s, w, h, pixel_scale=1.0, checker=False, step=1):
+    """
+    Подготавливает всё, что для геометрии зависит только от параметров
+    и размера кадра (не от пикселей): карту координат в формате
+    fixed-point OpenCV (быстрее в remap), шахматный фон и маску покрытия
+    кадра (255 - пиксель целиком из снимка, меньше - край или фон).
+
+    Returns:
+        dict {coords, background, coverage}
+    """
+    maps = {'coords': None, 'background': None, 'coverage': None}
+
+    coords = geometry_coords(s, w, h, pixel_scale, step=step)
+    if coords is None:
+        return maps
+    maps['coords'] = [cv2.convertMaps(map_x, map_y, cv2.CV_16SC2) for map_x, map_y in coords]
+
+    if checker:
+        maps['background'] = checkerboard(h, w)
+        # Покрытие зависит только от карты (общей или G, как альфа в
+        # apply_geometry) - один remap плоскости на ключ геометрии
+        coverage_coords = maps['coords'][len(maps['coords']) // 2]
+        maps['coverage'] = cv2.remap(np.full((h, w), 255, np.uint8), *coverage_coords, cv2.INTER_LINEAR,
+                                     borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+
+    return maps
+
+
+def apply_geometry(arr, s, pixel_scale=1.0, checker=False, maps=None):
+    """
+    Геометрия одним cv2.remap: дисторсия, хром. аберрации, перспектива,
+    aspect, масштаб и сдвиг.
+
+    Args:
+        arr: uint8 массив (H, W, 3)
+        s: полный dict настроек
+        pixel_scale: масштаб относительно превью
+        checker: заполнять пустые области шахматным фоном (для превью),
+                 иначе они остаются чёрными
+        maps: готовый результат build_geometry_maps (из кэша), если есть
+    """
+    h, w = arr.shape[:2]
+    if maps is None:
+        maps = build_geometry_maps(s, w, h, pixel_scale, checker)
+
+    coords = maps['coords']
+    if coords is None:
+        return arr
+
+    background = maps['background']
+    if background is None:
+        return remap_coords(arr, coords, (0, 0, 0))
+
+    # Один проход по RGBA: альфа-канал несёт маску покрытия
+    rgba = cv2.cvtColor(arr, cv2.COLOR_RGB2RGBA)
+    warped = remap_coords(rgba, coords, (0, 0, 0, 0))
+    return composite_over(warped, background)
+
+
+def composite_over(rgba, background):
+    """
+    Накладывает RGBA (после warp с прозрачной границей) на фон.
+
+    Цвет у краёв уже умножен на покрытие (интерполяция с нулевой
+    границей), поэтому смешивание целочисленное:
+    out = rgb + background * (255 - alpha) / 255.
+    """
+    inv_alpha = 255 - rgba[:, :, 3:4].astype(np.uint16)
+    out = rgba[:, :, :3] + (background * inv_alpha + 127) // 255
+    return np.minimum(out, 255).astype(np.uint8)
+
+
+# ============================================================
+# ПОЛНЫЙ КОНВЕЙЕР
+# ============================================================
+
+def apply_tone(arr, s, masks=None, frame=None):
+    """
+    Стадия тона: цветовая LUT, виньетка и локальные коррекции.
+
+    frame - положение arr в кадре (см. frame_bounds)
+
+    Returns:
+        uint8 массив (H, W, 3)
+    """
+    if needs_color(s) or needs_curve(s) or needs_lut(s):
+        # Цвет, кривая и .cube LUT - один проход по запечённой 3D LUT
+        arr = apply_lut3d(arr, build_color_lut(s))
+    else:
+        arr = np.asarray(arr, dtype=np.float32)
+
+    if needs_vignette(s):
+        arr = apply_vignette(arr, s, frame)
+    if masks:
+        arr = apply_local_adjustments(arr, masks, frame)
+
+    return np.clip(arr, 0, 255).astype(np.uint8)
+
+
+def develop(arr, settings, masks=None, pixel_scale=1.0, checker=False):
+    """
+    Проявка изображения по настройкам (без кэша, для экспорта).
+
+    Args:
+        arr: массив (H, W, 3) uint8 или float32 в диапазоне 0..255
+        settings: dict настроек (недостающие берутся из DEFAULT_SETTINGS)
+        masks: список масок локальных коррекций (в разрешении превью)
+        pixel_scale: масштаб arr относительно превью редактора
+        checker: шахматный фон в пустых областях после геометрии
+
+    Returns:
+        uint8 массив (H, W, 3)
+    """
+    s = normalize_settings(settings)
+
+    result = apply_tone(arr, s, active_masks(masks))
+    if needs_detail(s):
+        result = apply_detail(result, s, pixel_scale)
+    if needs_geometry(s):
+        result = apply_geometry(result, s, pixel_scale, checker=checker)
+
+    return result
+
+
+def develop_strips(arr, settings, masks=None, pixel_scale=1.0, strip_rows=STRIP_ROWS):
+    """
+    Проявка полосами - для полного разрешения (сохранение и экспорт).
+
+    Результат совпадает с develop() пиксель в пиксель,
+    но float32 временные массивы ограничены размером полосы, а не кадра:
+    - тон поточечный и пишется на место исходника;
+    - детализация берёт полосу с ореолом соседних строк (detail_passes);
+    - геометрия строит карту (geometry_coords) только для строк полосы
+      и читает лишь ту часть исходника, в которую она попадает.
+    В памяти остаются только uint8 кадры: исходник и результат.
+
+    Args:
+        arr: uint8 массив (H, W, 3); изменяется на месте
+        settings, masks, pixel_scale: как в develop()
+        strip_rows: высота полосы
+
+    Returns:
+        uint8 массив (H, W, 3)
+    """
+    s = normalize_settings(settings)
+    h, w = arr.shape[:2]
+
+    # Feather масок - один раз в разрешении превью, а не в каждой полосе
+    masks = [dict(m, array=feathered_mask(m), feather=0) for m in active_masks(masks)]
+
+    # 1. Тон: поточечно, прямо в буфер исходника
+    if needs_color(s) or needs_curve(s) or needs_lut(s) or needs_vignette(s) or masks:
+        for y0 in range(0, h, strip_rows):
+            y1 = min(y0 + strip_rows, h)
+            arr[y0:y1] = apply_tone(arr[y0:y1], s, masks, frame=(y0, h))
+
+    # 2. Детализация: каждый фильтр - своим проходом полосами с его ореолом
+    #    (чтобы дорогой bilateral не пересчитывался в большом ореоле clarity)
+    spare = None
+    for halo, detail_pass in detail_passes(s, pixel_scale):
+        # Полоса не меньше двух ореолов: иначе перекрытие умножает работу фильтра
+        rows = -(-max(strip_rows, 2 * halo) // STRIP_ALIGN) * STRIP_ALIGN
+        out = spare if spare is not None else np.empty_like(arr)
+        for y0 in range(0, h, rows):
+            y1 = min(y0 + rows, h)
+            top = max(0, (y0 - halo) // STRIP_ALIGN * STRIP_ALIGN)
+            bottom = min(h, y1 + halo)
+            out[y0:y1] = detail_pass(arr[top:bottom])[y0 - top:y1 - top]
+        arr, spare = out, arr
+    del spare
+
+    # 3. Геометрия: координаты исходника только для строк полосы
+    if needs_geometry(s):
+        out = None
+        for y0 in range(0, h, strip_rows):
+            y1 = min(y0 + strip_rows, h)
+            coords = geometry_coords(s, w, h, pixel_scale, y0, y1)
+            if coords is None:
+                break
+            if out is None:
+                out = np.zeros_like(arr)
+
+            # Строки исходника, в которые попадает полоса (+1 на интерполяцию)
+            ys = np.concatenate([map_y[(map_x > -1) & (map_x < w) & (map_y > -1) & (map_y < h)]
+                                 for map_x, map_y in coords])
+            if not ys.size:
+                continue
+            top = max(0, int(np.floor(ys.min())))
+            bottom = min(h, int(np.ceil(ys.max())) + 2)
+
+            for _, map_y in coords:
+                map_y -= top
+            # Те же fixed-point карты, что и в develop(): пиксели совпадают
+            coords = [cv2.convertMaps(map_x, map_y, cv2.CV_16SC2) for map_x, map_y in coords]
+            out[y0:y1] = remap_coords(arr[top:bottom], coords, (0, 0, 0))
+        if out is not None:
+            arr = out
+
+    return arr
+
+
+class DevelopPipeline:
+    """
+    Конвейер проявки с кэшем результатов стадий (для превью редактора).
+
+    Стадии: тон -> детализация -> геометрия. Результат каждой стадии
+    запоминается по ключу (версия входа, собственные параметры стадии),
+    поэтому, например, движение слайдера поворота переиспользует
+    готовый результат тона и детализации, а движение цветового
+    слайдера - готовые карты геометрии.
+
+    Пиксели совпадают с develop(): используются те же функции стадий.
+    """
+
+    def __init__(self):
+        self._source = None
+        self._source_version = 0
+        self._version = 0
+        self._stages = {}          # имя стадии -> (ключ, версия результата, результат)
+        self._geometry_maps = None  # (ключ, maps)
+        # Версия последнего результата render() и что в нём изменилось:
+        # (версия результата, от которого он отличается только
+        # прямоугольником, прямоугольник) или None - изменилось всё
+        self.result_version = 0
+        self.last_dirty = None
+        # Маска покрытия последнего результата (шахматный фон геометрии
+        # в нём не снимок) или None - снимок занимает весь кадр
+        self.coverage = None
+
+    def _next_version(self):
+        self._version += 1
+        return self._version
+
+    def _stage(self, name, key, compute):
+        """
+        Возвращает (версия, результат) стадии, пересчитывая только при смене ключа.
+        key=None означает, что результат не кэшируется.
+        """
+        cached = self._stages.get(name)
+        if key is not None and cached is not None and cached[0] == key:
+            return cached[1], cached[2]
+        result = compute()
+        version = self._next_version()
+        self._stages[name] = (key, version, result)
+        return version, result
+
+    def _patch_stage(self, name, key, rect, compute):
+        """
+        Обновляет в результате стадии только прямоугольник rect = (y0, y1, x0, x1);
+        compute() возвращает его новые пиксели.
+        """
+        y0, y1, x0, x1 = rect
+        result = self._stages[name][2].copy()
+        result[y0:y1, x0:x1] = compute()
+        version = self._next_version()
+        self._stages[name] = (key, version, result)
+        return version, result
+
+    def _get_geometry_maps(self, s, w, h, pixel_scale, checker, step):
+        key = (w, h, geometry_key(s), pixel_scale, checker, step)
+        if self._geometry_maps is None or self._geometry_maps[0] != key:
+            self._geometry_maps = (key, build_geometry_maps(s, w, h, pixel_scale, checker, step))
+        return self._geometry_maps[1]
+
+    def clear(self):
+        """Сбрасывает все кэши (например, при загрузке другого фото)"""
+        self._source = None
+        self._stages = {}
+        self._geometry_maps = None
+
+    def render(self, arr, settings, masks=None, pixel_scale=1.0, checker=False, draft=False):
+        """
+        Проявка с переиспользованием результатов неизменившихся стадий.
+
+        Исходник отслеживается по идентичности объекта: новый массив
+        (другое фото, коррекция объектива) сбрасывает зависящие стадии.
+
+        draft=True - во время движения слайдера: карта геометрии считается
+        на редкой сетке (DRAFT_MAP_STEP).
+
+        Если с прошлого раза изменились только мазки кисти, тон и
+        детализация пересчитываются лишь в задетом прямоугольнике, а он
+        сам возвращается в last_dirty (для частичного обновления экрана).
+        """
+        if arr is not self._source:
+            self._source = arr
+            self._source_version = self._next_version()
+
+        s = normalize_settings(settings)
+        masks = active_masks(masks)
+        h, w = arr.shape[:2]
+
+        # Маски меняются кистью на месте - их изменения видны по версиям
+        tone_key = (self._source_version, color_lut_key(s), s['vignette'], masks_key(masks))
+        cached = self._stages.get('tone')
+        dirty = None
+        if cached is not None and cached[0] != tone_key and cached[0][:3] == tone_key[:3]:
+            dirty = masks_dirty_rect(cached[0][3], masks, w, h)
+
+        if dirty is None:
+            version, result = self._stage('tone', tone_key,
+                                          lambda: apply_tone(arr, s, masks))
+        else:
+            y0, y1, x0, x1 = dirty
+            # base - версия результата, поверх которого обновлён прямоугольник
+            base = cached[1]
+            version, result = self._patch_stage(
+                'tone', tone_key, dirty,
+                lambda: apply_tone(arr[y0:y1, x0:x1], s, masks, frame=(y0, h, x0, w)))
+
+        if needs_detail(s):
+            detail_params = (tuple(s[k] for k in DETAIL_KEYS), pixel_scale)
+            detail_key = (version,) + detail_params
+            cached = self._stages.get('detail')
+            src = result
+            if dirty is not None and cached is not None and cached[0] == (base,) + detail_params:
+                base = cached[1]
+                dirty = self._patch_detail(src, s, pixel_scale, detail_key, dirty)
+            else:
+                dirty = None
+            if dirty is None:
+                version, result = self._stage('detail', detail_key,
+                                              lambda: apply_detail(src, s, pixel_scale))
+            else:
+                version, result = self._stages['detail'][1:]
+
+        self.coverage = None
+        if needs_geometry(s):
+            h, w = result.shape[:2]
+            step = DRAFT_MAP_STEP if draft else 1
+            maps = self._get_geometry_maps(s, w, h, pixel_scale, checker, step)
+            self.coverage = maps['coverage']
+            geometry_key_full = (version, geometry_key(s), pixel_scale, checker, step)
+            src = result
+            version, result = self._stage('geometry', geometry_key_full,
+                                          lambda: apply_geometry(src, s, pixel_scale, checker, maps))
+            # Карта геометрии разносит прямоугольник по кадру
+            dirty = None
+
+        self.last_dirty = None if dirty is None else (base, dirty)
+        self.result_version = version
+        return result
+
+    def _patch_detail(self, src, s, pixel_scale, key, rect):
+        """
+        Частичный пересчёт детализации после изменения тона в rect.
+
+        Фильтры разносят изменение на свой ореол, поэтому переписывается
+        rect, расширенный на ореол, а считается он с ещё одним ореолом
+        вокруг (начало выровнено на STRIP_ALIGN, как в develop_strips) -
+        пиксели совпадают с пересчётом всего кадра.
+
+        Returns:
+            переписанный прямоугольник или None, если с ореолами он почти
+            весь кадр
+        """
+        h, w = src.shape[:2]
+        halo = sum(pass_halo for pass_halo, _ in detail_passes(s, pixel_scale))
+        y0, y1 = max(0, rect[0] - halo), min(h, rect[1] + halo)
+        x0, x1 = max(0, rect[2] - halo), min(w, rect[3] + halo)
+        top = max(0, (y0 - halo) // STRIP_ALIGN * STRIP_ALIGN)
+        left = max(0, (x0 - halo) // STRIP_ALIGN * STRIP_ALIGN)
+        bottom, right = min(h, y1 + halo), min(w, x1 + halo)
+        if (bottom - top) * (right - left) > h * w // 2:
+            return None
+
+        self._patch_stage('detail', key, (y0, y1, x0, x1),
+                          lambda: apply_detail(src[top:bottom, left:right], s, pixel_scale)
+                          [y0 - top:y1 - top, x0 - left:x1 - left])
+        return y0, y1, x0, x1
+
+def develop_file(path, settings, masks=None, preview_max=PREVIEW_MAX):
+    """
+    Проявка файла в полном разрешении (для сохранения и экспорта).
+
+    Returns:
+        PIL.Image в режиме RGB
+    """
+    with Image.open(path) as img:
+        w, h = img.size
+    # Исходник передаётся без лишней ссылки: develop_strips переиспользует его буфер
+    result = develop_strips(load_image_array(path), settings, masks=masks,
+                            pixel_scale=pixel_scale_for(w, h, preview_max))
+    return Image.fromarray(result)
+
+
+# ============================================================
+# АНАЛИЗ КАДРА (ГИСТОГРАММА, КЛИППИНГ)
+# ============================================================
+
+def compute_histogram(arr, samples=HISTOGRAM_SAMPLES, coverage=None):
+    """
+    Гистограмма каналов и яркости по прореженной выборке кадра.
+
+    Берётся каждый step-й пиксель по обеим осям (около samples штук),
+    все четыре гистограммы считаются одним np.bincount - доли
+    миллисекунды на кадр превью. coverage - маска покрытия
+    (DevelopPipeline.coverage): пиксели фона и краёв не учитываются.
+
+    Returns:
+        int массив (4, 256): R, G, B, яркость (Rec. 601)
+    """
+    h, w = arr.shape[:2]
+    step = max(1, int(np.ceil(np.sqrt(h * w / samples))))
+    sample = arr[::step, ::step, :3].reshape(-1, 3).astype(np.uint16)
+    if coverage is not None:
+        sample = sample[coverage[::step, ::step].ravel() == 255]
+    luma = (sample[:, 0] * 77 + sample[:, 1] * 150 + sample[:, 2] * 29) >> 8
+    # Каналы и яркость - в своих диапазонах индексов: 0-255, 256-511, ...
+    sample += np.array([0, 256, 512], dtype=np.uint16)
+    counts = np.bincount(np.concatenate([sample.ravel(), luma + 768]), minlength=1024)
+    return counts.reshape(4, 256)
+
+
+def clipping_map(arr, coverage=None):
+    """
+    Карта клиппинга кадра: 0 - нет, 1 - тени (все каналы 0),
+    2 - света (хотя бы один канал 255). Вне покрытия coverage
+    (фон геометрии) клиппинг не отмечается.
+
+    Returns:
+        uint8 массив (H, W)
+    """
+    rgb = np.ascontiguousarray(arr[:, :, :3])
+    # inRange отмечает пиксели, у которых все каналы в диапазоне
+    not_highlights = cv2.inRange(rgb, (0, 0, 0), (254, 254, 254))
+    shadows = cv2.inRange(rgb, (0, 0, 0), (0, 0, 0))
+    result = cv2.bitwise_not(not_highlights) & 2
+    result |= shadows & 1
+    if coverage is not None:
+        result &= cv2.compare(coverage, 255, cv2.CMP_EQ)
+    return result
+
+
+# ============================================================
+# ФОНОВЫЙ РЕНДЕР
+# ============================================================
+
+class RenderWorker:
+    """
+    Фоновый поток рендера превью: последний запрос побеждает.
+
+    submit() не блокирует вызывающий (UI) поток: ожидающий запрос
+    заменяется новым, поэтому поток не тратит время на устаревшие
+    настройки. Уже запущенный рендер дорабатывает (OpenCV его не прервать),
+    а его результат помечен поколением, по которому UI отбрасывает
+    кадры старше уже показанного.
+
+    on_result(generation, result, error) вызывается из потока рендера -
+    UI должен сам перенести его в главный поток (self.after). Если job
+    упал, result - None, а error - исключение (иначе error - None):
+    UI должен показать ошибку, а не ждать кадр.
+    """
+
+    def __init__(self, on_result):
+        self._on_result = on_result
+        self._cond = threading.Condition()
+        self._pending = None
+        self._generation = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def generation(self):
+        """Поколение последнего запроса"""
+        return self._generation
+
+    def submit(self, job):
+        """
+        Ставит job (callable без аргументов) в очередь вместо ожидающего.
+
+        Returns:
+            поколение запроса
+        """
+        with self._cond:
+            self._generation += 1
+            self._pending = (self._generation, job)
+            self._cond.notify()
+            return self._generation
+
+    def discard(self):
+        """
+        Отменяет ожидающий запрос и делает устаревшими все выданные
+        (например, при загрузке другого фото).
+
+        Returns:
+            новое поколение - результаты с меньшим поколением не актуальны
+        """
+        with self._cond:
+            self._generation += 1
+            self._pending = None
+            return self._generation
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None:
+                    self._cond.wait()
+                generation, job = self._pending
+                self._pending = None
+
+            try:
+                result = job()
+            except Exception as e:
+                logger.error(f"Render error: {e}")
+                self._on_result(generation, None, e)
+                continue
+
+            self._on_result(generation, result, None)
+
+
+class ThumbnailLoader:
+    """
+    Фоновое декодирование миниатюр (filmstrip редактора).
+
+    schedule() заменяет очередь целиком, поэтому при быстрой прокрутке
+    декодируются только миниатюры, видимые сейчас.
+
+    on_result(path, image) вызывается из фонового потока - UI должен сам
+    перенести его в главный поток (self.after).
+
+    cache_file(path) - файл, в котором миниатюра хранится между запусками
+    (catalog.Catalog.thumbnail_file), или None - без кэша на диске.
+
+    Файлы, которые не удалось декодировать, запоминаются и больше не
+    ставятся в очередь (иначе каждое обновление окна filmstrip
+    декодировало бы их заново).
+    """
+
+    def __init__(self, on_result, size, cache_file=None):
+        self._on_result = on_result
+        self._size = size
+        self._cache_file = cache_file
+        self._cond = threading.Condition()
+        self._queue = []
+        self._failed = set()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def schedule(self, paths):
+        """Задаёт пути для декодирования (в порядке важности) вместо прежних"""
+        with self._cond:
+            self._queue = [path for path in paths if path not in self._failed]
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                path = self._queue.pop(0)
+
+            try:
+                cached = self._cache_file(path) if self._cache_file else None
+                if cached and os.path.exists(cached):
+                    with Image.open(cached) as img:
+                        image = img.convert("RGB")
+                else:
+                    image = load_thumbnail(path, self._size)
+                    if cached:
+                        image.save(cached, quality=90)
+            except Exception as e:
+                logger.error(f"Filmstrip thumbnail error ({os.path.basename(path)}): {e}")
+                with self._cond:
+                    self._failed.add(path)
+                continue
+
+            self._on_result(path, image)
+
+
+class Prefetcher:
+    """
+    Фоновая подготовка соседних фото библиотеки, чтобы навигация
+    показывала готовый кадр без декодирования в UI.
+
+    Для каждого фото окна готовится превью (load_preview), а если у фото
+    есть сохранённые настройки - и проявленное превью вместе с конвейером,
+    который его построил (его кэш стадий затем переиспользует редактор).
+    Фото обрабатываются в одном потоке по порядку важности; записи вне
+    окна выбрасываются.
+    """
+
+    def __init__(self, preview_max=PREVIEW_MAX):
+        self._preview_max = preview_max
+        self._cond = threading.Condition()
+        self._queue = []      # [(path, settings, masks)] ещё не готовые
+        self._window = set()  # пути текущего окна
+        self._entries = {}    # path -> dict {preview, array, pipeline, image, render_key}
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def render_key(settings, masks):
+        """По чему проверяется, что проявленное превью актуально (None - без настроек)"""
+        if not settings:
+            return None
+        return normalize_settings(settings), masks_key(active_masks(masks))
+
+    def schedule(self, items):
+        """
+        Задаёт окно предзагрузки.
+
+        Args:
+            items: список (path, settings, masks) в порядке важности
+        """
+        with self._cond:
+            self._window = {path for path, _, _ in items}
+            for path in list(self._entries):
+                if path not in self._window:
+                    del self._entries[path]
+
+            self._queue = []
+            for path, settings, masks in items:
+                entry = self._entries.get(path)
+                if entry is None or entry['render_key'] != self.render_key(settings, masks):
+                    self._queue.append((path, settings, masks))
+            self._cond.notify()
+
+    def take(self, path):
+        """
+        Готовая запись для path или None.
+
+        Returns:
+            dict {preview (uint8), array (float32), size (размер оригинала),
+            pipeline, image (проявленное превью uint8 или None), render_key}
+        """
+        with self._cond:
+            return self._entries.get(path)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                path, settings, masks = self._queue.pop(0)
+                entry = self._entries.get(path)
+
+            try:
+                if entry is None:
+                    preview, size = load_preview(path, self._preview_max)
+                    entry = {'preview': preview, 'array': preview.astype(np.float32), 'size': size,
+                             'pipeline': None, 'image': None, 'render_key': None}
+                key = self.render_key(settings, masks)
+                if key is not None and entry['render_key'] != key:
+                    # Новый конвейер: прежний мог уже перейти к редактору
+                    pipeline = DevelopPipeline()
+                    image = pipeline.render(entry['array'], settings, masks=masks, checker=True)
+                    entry = dict(entry, pipeline=pipeline, image=image, render_key=key)
+            except Exception as e:
+                logger.error(f"Prefetch error ({os.path.basename(path)}): {e}")
+                continue
+
+            with self._cond:
+                # Окно могло сдвинуться, пока фото готовилось
+                if path in self._window:
+                    self._entries[path] = entry
+
+
+# ============================================================
+# ПАКЕТНЫЙ ЭКСПОРТ
+# ============================================================
+
+def export_workers():
+    """Число процессов экспорта: все ядра, кроме одного (для UI)"""
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+def _init_export_worker():
+    # Параллелизм даёт пул процессов - внутренние потоки OpenCV
+    # только конкурировали бы с соседними процессами за ядра
+    cv2.setNumThreads(1)
+
+
+def export_file(job):
+    """
+    Проявляет и сохраняет один файл (выполняется в процессе пула).
+
+    Args:
+        job: dict с ключами path, output, settings, masks, preview_max, quality
+
+    Returns:
+        путь сохранённого файла
+    """
+    image = develop_file(job['path'], job['settings'], masks=job.get('masks'),
+                         preview_max=job.get('preview_max', PREVIEW_MAX))
+    image.save(job['output'], quality=job.get('quality', 95))
+    return job['output']
+
+
+class BatchExporter:
+    """
+    Экспорт списка файлов в полном разрешении на пуле процессов.
+
+    Работает в фоновом потоке; колбэки вызываются из него, UI должен
+    перенести их в главный поток (self.after):
+        on_progress(done, total, eta_seconds, path)
+        on_done(exported, errors, cancelled)
+    """
+
+    def __init__(self, jobs, on_progress=None, on_done=None, workers=None):
+        self.jobs = list(jobs)
+        self.workers = workers or export_workers()
+        self._on_progress = on_progress
+        self._on_done = on_done
+        self._cancel = threading.Event()
+        self._futures = {}
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        """Отменяет ещё не начатые файлы (начатые дорабатывают)"""
+        self._cancel.set()
+        for future in list(self._futures):
+            future.cancel()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        total = len(self.jobs)
+        exported = 0
+        errors = 0
+        start = time.time()
+
+        executor = ProcessPoolExecutor(max_workers=min(self.workers, max(total, 1)),
+                                       initializer=_init_export_worker)
+        try:
+            futures = {executor.submit(export_file, job): job for job in self.jobs}
+            self._futures = futures
+            if self._cancel.is_set():
+                self.cancel()
+
+            done = 0
+            for future in as_completed(futures):
+                job = futures[future]
+                if future.cancelled():
+                    continue
+                done += 1
+                try:
+                    future.result()
+                    exported += 1
+                except Exception as e:
+                    errors += 1
+                    logger.error(f"Export error for {job['path']}: {e}")
+
+                if self._on_progress:
+                    # Отменённые файлы не в счёт: ни в готовых, ни в оставшихся
+                    remaining = sum(1 for f in futures if not f.done())
+                    elapsed = time.time() - start
+                    eta = elapsed / done * remaining
+                    self._on_progress(done, total, eta, job['path'])
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        if self._on_done:
+            self._on_done(exported, errors, self._cancel.is_set())
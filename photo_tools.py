@@ -42,6 +42,7 @@ except ImportError:
 import fal_client
 import webview
 import threading
+import multiprocessing
 import cv2
 import webbrowser
 import subprocess
@@ -85,12 +86,10 @@ try:
 except ImportError:
     PERSPECTIVE_ENGINE_AVAILABLE = False
 
-# Точная реализация Darktable ashift
-try:
-    from darktable_perspective import DarktableAshift
-    DARKTABLE_ASHIFT_AVAILABLE = True
-except ImportError:
-    DARKTABLE_ASHIFT_AVAILABLE = False
+# Движок проявки (общий для превью и экспорта)
+import develop_engine
+# Каталог библиотеки редактора (настройки, EXIF, миниатюры)
+import catalog
 
 # Логирование в файл и консоль
 import logging
@@ -3054,12 +3053,15 @@ class PhotoToolsApp(ctk.CTk):
         logger.info(f"Sending {len(photo_paths)} photos to editor")
         
         # Очищаем библиотеку редактора и добавляем выбранные фото
+        # (с настройками из каталога, если фото уже обрабатывали)
+        self._flush_catalog_settings()
+        saved = self.editor_catalog.get_settings(photo_paths) if self.editor_catalog else {}
         self.editor_library = []
         self.editor_current_index = 0  # Сбрасываем индекс
         for path in photo_paths:
             self.editor_library.append({
                 'path': path,
-                'settings': None,
+                'settings': saved.get(path),
                 'selected': False
             })
         
@@ -3730,13 +3732,17 @@ end tell
         import tempfile
         import datetime
         
-        if not self.editor_original_image and not getattr(self, 'editor_image_path', None):
+        if self.editor_original_array is None and not getattr(self, 'editor_image_path', None):
             messagebox.showinfo("Polarr", "Сначала загрузите фотографию в редактор")
             return
         
-        # Убеждаемся, что актуальные правки применены
-        self.editor_apply_adjustments_fast()
-        current_image = getattr(self, 'editor_current_image', None)
+        # Кадр с актуальными правками проявляется здесь же: превью рендерится
+        # в фоне, и editor_current_image может быть ещё прежним или черновым
+        try:
+            current_image = self.editor_apply_adjustments()
+        except Exception as err:
+            logger.warning(f"Failed to render image for Polarr: {err}")
+            current_image = None
         
         image_path = None
         original_path = getattr(self, 'editor_image_path', None)
@@ -3782,6 +3788,7 @@ end tell
     
     # ==================== EDITOR TAB (Lightroom-style) ====================
     def create_editor_tab(self):
+        import tkinter as tk
         tab = self.tab_editor
         tab.grid_columnconfigure(0, weight=0)  # Панель слайдеров
         tab.grid_columnconfigure(1, weight=1)  # Canvas превью
@@ -3789,26 +3796,53 @@ end tell
         
         # ВАЖНО: Инициализируем переменные редактора ДО создания слайдеров
         self.editor_image_path = None
-        self.editor_original_image = None  # Полное разрешение
+        self.editor_original_image = None  # Полное разрешение (только для фото, открытого через «Открыть»)
+        self.editor_original_size = None  # (w, h) оригинала - файл для этого не держится открытым
         self.editor_preview_image = None   # Уменьшенная версия для preview (быстрее)
         self.editor_current_image = None
         self.editor_photo = None
         self.editor_guides = []
         self.editor_show_guides = False
         self.editor_show_grid = False
+        self.editor_show_clipping = False  # Оверлей клиппинга (света/тени)
+        self.editor_clipping = None  # Карта клиппинга показанного кадра (develop_engine.clipping_map)
         self.editor_guide_start = None
         # Система масок (Lightroom-style)
         self.editor_masks = []  # [{name, array, exposure, temperature, saturation, feather}, ...]
         self.editor_current_mask_index = -1  # Индекс текущей маски
-        self.editor_mask_mode = None  # 'drawing' или None
+        self.editor_mask_mode = None  # 'drawing', 'gradient' или None
         self.editor_mask_drawing = False
+        self.editor_gradient_start = None  # Точка нажатия при протяжке градиентной маски
         self.editor_show_mask_overlay = True  # Показывать красный оверлей
         self.editor_img_offset = (0, 0)
         self.editor_img_size = (0, 0)
         self.editor_preview_max = 800  # Уменьшено для скорости (было 1200)
         self.editor_checkerboard_image = None  # Кэш шахматного фона
+        self.editor_canvas_items = None  # Постоянные элементы canvas (создаются один раз)
+        self._editor_display_key = None  # (кадр, видимая область) последнего отображённого bitmap
+        self._mask_overlay_photo = None  # Bitmap оверлея текущей маски
+        self._mask_overlay_shown = None  # (маска, feather, видимая область, версия) этого bitmap
+        self._checkerboard_item_size = None
+        self._editor_tile_cache = {}  # Тайлы увеличенного кадра для панорамирования
+        self.editor_tile_size = 256  # Сторона тайла, px на canvas
+        self.editor_tile_cache_max = 64  # Тайлов в кэше (несколько экранов)
         self.editor_debounce_id = None  # Для debounce слайдеров
         self.editor_original_array = None  # NumPy массив оригинала (для скорости)
+        self.editor_pyramid = {}  # Пирамида превью {длинная сторона: массив}
+        # (кадр, (w, h) на экране): кадр уровня пирамиды показывается размером основного превью
+        self.editor_current_display_size = None
+        self.editor_pipelines = {}  # Кэш стадий проявки для каждого уровня пирамиды
+        self.editor_refine_id = None  # Отложенное уточнение превью после движения слайдера
+        self.editor_refine_delay = 150  # мс без движения до рендера в полном качестве превью
+        # Рендер превью в фоновом потоке; кадр возвращается в UI через after()
+        self.editor_render_worker = develop_engine.RenderWorker(
+            lambda generation, result, error: self.after(
+                0, lambda: self._on_render_done(generation, result, error)))
+        self.editor_shown_generation = 0  # Поколение последнего показанного кадра
+        self.editor_shown_frame = None  # (уровень пирамиды, версия результата конвейера, кадр)
+        # Соседние фото библиотеки декодируются и проявляются заранее в фоне
+        self.editor_prefetcher = develop_engine.Prefetcher(self.editor_preview_max)
+        self.editor_prefetch_radius = develop_engine.PREFETCH_RADIUS
         
         # Новые переменные
         self.editor_wb_picker_mode = False  # Режим выбора точки для баланса белого
@@ -3823,6 +3857,17 @@ end tell
         
         # Библиотека фото (Lightroom-style)
         self.editor_library = []  # [{path, settings, thumbnail}, ...]
+        # Каталог: настройки и сведения о фото между запусками (None - недоступен)
+        try:
+            self.editor_catalog = catalog.Catalog(
+                os.path.join(self.autosave_folder, "catalog.sqlite"),
+                os.path.join(self.autosave_folder, "thumbnails"))
+        except Exception as e:
+            logger.error(f"Catalog unavailable: {e}")
+            self.editor_catalog = None
+        self.editor_catalog_pending = {}  # path -> настройки, ещё не записанные в каталог
+        self.editor_catalog_flush_id = None
+        self.editor_catalog_flush_delay = 2000  # мс: записи в каталог копятся и идут одной транзакцией
         self.editor_current_index = 0
         
         # Заголовок
@@ -3849,10 +3894,12 @@ end tell
                      width=80, height=32, font=ctk.CTkFont(size=11),
                      fg_color=COLORS["success"], hover_color=COLORS["success_hover"],
                      corner_radius=8).pack(side="left", padx=2)
-        ctk.CTkButton(btn_frame, text="📤 Экспорт", command=self.editor_export_all,
+        self.editor_export_btn = ctk.CTkButton(btn_frame, text="📤 Экспорт", command=self.editor_export_all,
                      width=70, height=32, font=ctk.CTkFont(size=11),
                      fg_color=COLORS["teal"], hover_color="#0D9488",
-                     corner_radius=8).pack(side="left", padx=2)
+                     corner_radius=8)
+        self.editor_export_btn.pack(side="left", padx=2)
+        self.editor_exporter = None  # Фоновый пакетный экспорт (develop_engine.BatchExporter)
         ctk.CTkButton(btn_frame, text="🔄 Сброс", command=self.editor_reset,
                      width=70, height=32, font=ctk.CTkFont(size=11),
                      fg_color=COLORS["warning"], hover_color=COLORS["warning_hover"],
@@ -3866,6 +3913,22 @@ end tell
         left_panel = ctk.CTkScrollableFrame(tab, width=280, fg_color=COLORS["bg_secondary"], corner_radius=GLASS_CORNER_RADIUS)
         left_panel.grid(row=1, column=0, padx=(10, 5), pady=5, sticky="ns")
         
+        # --- Гистограмма (считается в потоке рендера для каждого кадра) ---
+        self.editor_histogram_canvas = tk.Canvas(left_panel, width=256, height=80,
+                                                 bg=COLORS["bg_tertiary"], highlightthickness=0)
+        self.editor_histogram_canvas.pack(pady=(10, 2), padx=10)
+        self.editor_histogram_items = {
+            'luma': self.editor_histogram_canvas.create_polygon(0, 0, 0, 0, fill="#555555", outline=""),
+            'r': self.editor_histogram_canvas.create_line(0, 0, 0, 0, fill="#ff4d4d"),
+            'g': self.editor_histogram_canvas.create_line(0, 0, 0, 0, fill="#4dff4d"),
+            'b': self.editor_histogram_canvas.create_line(0, 0, 0, 0, fill="#4d8cff"),
+        }
+        self.clipping_btn = ctk.CTkButton(left_panel, text="⚠️ Показать клиппинг", command=self.editor_toggle_clipping,
+                     height=28, font=ctk.CTkFont(size=11),
+                     fg_color=COLORS["bg_tertiary"], hover_color=COLORS["border"],
+                     corner_radius=8)
+        self.clipping_btn.pack(fill="x", padx=10, pady=2)
+        
         # --- Базовые настройки ---
         ctk.CTkLabel(left_panel, text="📊 Базовые", font=ctk.CTkFont(size=14, weight="bold"),
                     text_color=COLORS["text_primary"]).pack(pady=(10, 5), anchor="w", padx=10)
@@ -3959,7 +4022,8 @@ end tell
                     text_color=COLORS["text_secondary"]).pack(side="left", padx=(0, 5))
         
         algo_values = ["GIMP"]
-        if DARKTABLE_ASHIFT_AVAILABLE:
+        # Точный алгоритм Darktable ashift - в движке проявки
+        if develop_engine.DARKTABLE_ASHIFT_AVAILABLE:
             algo_values.append("Darktable (ashift)")
         
         self.perspective_algo = ctk.CTkOptionMenu(algo_frame, 
@@ -3986,6 +4050,25 @@ end tell
                      corner_radius=8)
         self.mask_brush_btn.pack(fill="x")
         
+        # Градиентные маски: задаются протяжкой по кадру, хранят только параметры
+        gradient_btn_frame = ctk.CTkFrame(left_panel, fg_color="transparent")
+        gradient_btn_frame.pack(pady=(0, 5), padx=10, fill="x")
+        
+        ctk.CTkButton(gradient_btn_frame, text="📏 Линейный",
+                     command=lambda: self.editor_new_gradient_mask("linear"),
+                     height=28, font=ctk.CTkFont(size=11),
+                     fg_color=COLORS["bg_tertiary"], hover_color=COLORS["border"],
+                     corner_radius=6).pack(side="left", fill="x", expand=True, padx=(0, 2))
+        ctk.CTkButton(gradient_btn_frame, text="⭕ Радиальный",
+                     command=lambda: self.editor_new_gradient_mask("radial"),
+                     height=28, font=ctk.CTkFont(size=11),
+                     fg_color=COLORS["bg_tertiary"], hover_color=COLORS["border"],
+                     corner_radius=6).pack(side="left", fill="x", expand=True, padx=2)
+        ctk.CTkButton(gradient_btn_frame, text="◐", command=self.editor_invert_gradient_mask,
+                     width=28, height=28, font=ctk.CTkFont(size=11),
+                     fg_color=COLORS["bg_tertiary"], hover_color=COLORS["border"],
+                     corner_radius=6).pack(side="left", padx=(2, 0))
+        
         # Список масок
         ctk.CTkLabel(left_panel, text="Маски:", font=ctk.CTkFont(size=11),
                     text_color=COLORS["text_secondary"]).pack(pady=(5, 2), anchor="w", padx=10)
@@ -4071,16 +4154,55 @@ end tell
         self.editor_curve_highlights = self._create_slider(left_panel, "Света (кривая)", -50, 50, 0)
         self.editor_curve_whites = self._create_slider(left_panel, "Белые", -50, 50, 0)
         
+        # --- Творческая LUT (.cube от колористов) ---
+        ctk.CTkLabel(left_panel, text="🎞️ LUT", font=ctk.CTkFont(size=14, weight="bold"),
+                    text_color=COLORS["text_primary"]).pack(pady=(15, 5), anchor="w", padx=10)
+        
+        lut_row = ctk.CTkFrame(left_panel, fg_color="transparent")
+        lut_row.pack(fill="x", padx=10, pady=2)
+        
+        ctk.CTkButton(lut_row, text="📂 .cube", command=self.editor_load_lut,
+                     width=80, height=28, font=ctk.CTkFont(size=11),
+                     fg_color=COLORS["secondary"], hover_color=COLORS["secondary_hover"],
+                     corner_radius=8).pack(side="left", padx=(0, 2))
+        ctk.CTkButton(lut_row, text="✕", command=self.editor_clear_lut,
+                     width=28, height=28, font=ctk.CTkFont(size=11),
+                     fg_color=COLORS["bg_tertiary"], hover_color=COLORS["border"],
+                     corner_radius=8).pack(side="left", padx=2)
+        self.editor_lut_label = ctk.CTkLabel(lut_row, text="Нет", font=ctk.CTkFont(size=10),
+                                             text_color=COLORS["text_secondary"])
+        self.editor_lut_label.pack(side="left", padx=5)
+        self.editor_lut_path = None  # Путь к .cube (в настройках - 'lut_path')
+        
+        self.editor_lut_strength = self._create_slider(left_panel, "Сила LUT", 0, 100, 100)
+        
         # --- Резкость и шумоподавление ---
         ctk.CTkLabel(left_panel, text="🔍 Детализация", font=ctk.CTkFont(size=14, weight="bold"),
                     text_color=COLORS["text_primary"]).pack(pady=(15, 5), anchor="w", padx=10)
         
         self.editor_sharpness = self._create_slider(left_panel, "Резкость", 0, 200, 0)
         self.editor_denoise = self._create_slider(left_panel, "Шумоподавление", 0, 100, 0)
+        
+        # Режим шумоподавления: Bilateral (исходный) или быстрый Guided filter
+        denoise_mode_frame = ctk.CTkFrame(left_panel, fg_color="transparent")
+        denoise_mode_frame.pack(fill="x", padx=10, pady=2)
+        
+        ctk.CTkLabel(denoise_mode_frame, text="Режим:", font=ctk.CTkFont(size=10),
+                    text_color=COLORS["text_secondary"]).pack(side="left", padx=(0, 5))
+        
+        self.editor_denoise_modes = {"Bilateral": "bilateral", "Guided (быстрый)": "guided"}
+        self.editor_denoise_mode = ctk.CTkOptionMenu(denoise_mode_frame,
+                                           values=list(self.editor_denoise_modes),
+                                           font=ctk.CTkFont(size=10),
+                                           fg_color=COLORS["bg_secondary"],
+                                           button_color=COLORS["primary"],
+                                           width=120,
+                                           command=lambda _: self._apply_adjustments_debounced())
+        self.editor_denoise_mode.pack(side="left")
+        self.editor_denoise_mode.set("Bilateral")
         self.editor_clarity = self._create_slider(left_panel, "Clarity", -100, 100, 0)
         
         # === ПРАВАЯ ПАНЕЛЬ - CANVAS ===
-        import tkinter as tk
         canvas_frame = ctk.CTkFrame(tab, fg_color=COLORS["bg_tertiary"], corner_radius=GLASS_CORNER_RADIUS)
         canvas_frame.grid(row=1, column=1, padx=(5, 10), pady=5, sticky="nsew")
         
@@ -4097,7 +4219,29 @@ end tell
         self.filmstrip_canvas = tk.Canvas(self.filmstrip_frame, bg=COLORS["bg_secondary"], 
                                           height=70, highlightthickness=0)
         self.filmstrip_canvas.pack(fill="both", expand=True)
-        self.filmstrip_thumbnails = []  # Хранит PhotoImage объекты
+        # Filmstrip виртуальный: элементы canvas есть только у видимых слотов
+        # (плюс запас), миниатюры декодируются в фоне
+        self.filmstrip_thumb_size = 60
+        self.filmstrip_padding = 5
+        self.filmstrip_margin = 10  # Слотов за краями видимой области
+        self.filmstrip_items = {}  # индекс -> (миниатюра, рамка) на canvas
+        self.filmstrip_thumbnails = {}  # path -> PhotoImage (LRU)
+        self.filmstrip_thumbnails_max = 512
+        self.filmstrip_loader = develop_engine.ThumbnailLoader(
+            lambda path, image: self.after(0, lambda: self._on_filmstrip_thumbnail(path, image)),
+            self.filmstrip_thumb_size,
+            cache_file=self.editor_catalog.thumbnail_file if self.editor_catalog else None)
+        
+        # Одна привязка на canvas вместо привязок к каждой миниатюре:
+        # индекс фото определяется по координате клика
+        self.filmstrip_canvas.bind("<Button-1>",
+                                   lambda e: self._filmstrip_event(e, self._filmstrip_click))
+        # ПКМ для контекстного меню (Button-2 для Mac, Button-3 для Windows/Linux)
+        for sequence in ("<Button-2>", "<Button-3>", "<Control-Button-1>"):
+            self.filmstrip_canvas.bind(sequence,
+                                       lambda e: self._filmstrip_event(e, self._filmstrip_right_click))
+        self.filmstrip_canvas.bind("<MouseWheel>", self._filmstrip_scroll)
+        self.filmstrip_canvas.bind("<Configure>", lambda e: self._render_filmstrip_window())
         
         # Привязка событий для рисования гайдов
         self.editor_canvas.bind("<Button-1>", self.editor_canvas_click)
@@ -4251,9 +4395,9 @@ end tell
                 value_label.configure(text=f"{val:.1f}")
             else:
                 value_label.configure(text=f"{int(val)}")
-            # Обновляем текущую маску и применяем превью
+            # Обновляем текущую маску и применяем превью (прогрессивно, как основные слайдеры)
             self._update_current_mask_settings()
-            self._apply_masks_preview()
+            self._apply_adjustments_debounced()
         
         slider.configure(command=update_mask_value)
         return slider
@@ -4269,13 +4413,14 @@ end tell
         
         new_mask = {
             'name': mask_name,
-            'array': np.zeros((h, w), dtype=np.float32),
+            'array': develop_engine.TiledMask(h, w),
             'exposure': 0.0,
             'highlights': 0,
             'shadows': 0,
             'temperature': 0,
             'saturation': 1.0,
-            'feather': 30
+            'feather': 30,
+            'version': 0  # Увеличивается после каждого мазка кисти (кэш растушёвки)
         }
         
         self.editor_masks.append(new_mask)
@@ -4287,6 +4432,110 @@ end tell
         self._reset_mask_sliders()
         logger.info(f"New mask created: {mask_name}")
     
+    def editor_new_gradient_mask(self, kind):
+        """
+        Создаёт градиентную маску (develop_engine.GradientMask).
+        
+        Линейная задаётся протяжкой от полной силы к нулю, радиальная -
+        от центра к краю эллипса.
+        """
+        if self.editor_original_array is None:
+            messagebox.showwarning("Внимание", "Сначала загрузите изображение")
+            return
+        
+        gradient = develop_engine.GradientMask(kind)
+        names = {"linear": "Линейный", "radial": "Радиальный"}
+        new_mask = {
+            'name': f"{names[kind]} {len(self.editor_masks) + 1}",
+            'array': gradient,
+            'exposure': 0.0,
+            'highlights': 0,
+            'shadows': 0,
+            'temperature': 0,
+            'saturation': 1.0,
+            'feather': 0,  # Плавность задаёт сам градиент
+            'version': gradient.version
+        }
+        
+        self.editor_masks.append(new_mask)
+        self.editor_current_mask_index = len(self.editor_masks) - 1
+        self.editor_mask_mode = 'gradient'
+        self.editor_canvas.configure(cursor="crosshair")
+        
+        self._update_masks_list()
+        self._reset_mask_sliders()
+        self.mask_feather.set(0)
+        self.editor_display_image()
+        logger.info(f"New gradient mask created: {new_mask['name']}")
+    
+    def _current_gradient_mask(self):
+        """Текущая маска, если она градиентная, иначе None"""
+        if 0 <= self.editor_current_mask_index < len(self.editor_masks):
+            mask_data = self.editor_masks[self.editor_current_mask_index]
+            if isinstance(mask_data['array'], develop_engine.GradientMask):
+                return mask_data
+        return None
+    
+    def editor_invert_gradient_mask(self):
+        """Инвертирует текущую градиентную маску (радиальная - эффект снаружи)"""
+        mask_data = self._current_gradient_mask()
+        if mask_data is None:
+            return
+        self._save_to_history()
+        gradient = mask_data['array']
+        gradient.update(invert=not gradient.invert)
+        mask_data['version'] = gradient.version
+        self._save_to_history()
+        self._apply_masks_preview()
+    
+    def _drag_gradient_mask(self, x, y):
+        """Протяжка по canvas задаёт текущий градиент (от точки нажатия до x, y)"""
+        mask_data = self._current_gradient_mask()
+        if mask_data is None or self.editor_gradient_start is None:
+            return
+        if self.editor_img_size[0] == 0 or self.editor_img_size[1] == 0:
+            return
+        
+        # Координаты в долях кадра - маска не зависит от разрешения
+        img_w, img_h = self.editor_img_size
+        x0, y0 = self.editor_gradient_start
+        start = ((x0 - self.editor_img_offset[0]) / img_w, (y0 - self.editor_img_offset[1]) / img_h)
+        end = ((x - self.editor_img_offset[0]) / img_w, (y - self.editor_img_offset[1]) / img_h)
+        
+        gradient = mask_data['array']
+        if gradient.kind == 'linear':
+            gradient.update(start=start, end=end)
+        else:
+            # Круг на экране: радиус - расстояние протяжки
+            distance = np.hypot(x - x0, y - y0)
+            gradient.update(center=start, radius=(distance / img_w, distance / img_h))
+        mask_data['version'] = gradient.version
+        self._apply_masks_preview()
+    
+    def _draw_gradient_handles(self, img_x, img_y, img_w, img_h):
+        """Рисует параметры текущей градиентной маски: отрезок или эллипс"""
+        canvas = self.editor_canvas
+        canvas.delete("gradient_handle")
+        mask_data = self._current_gradient_mask()
+        if mask_data is None or not mask_data.get('visible', True):
+            return
+        
+        gradient = mask_data['array']
+        if gradient.kind == 'linear':
+            sx, sy = img_x + gradient.start[0] * img_w, img_y + gradient.start[1] * img_h
+            ex, ey = img_x + gradient.end[0] * img_w, img_y + gradient.end[1] * img_h
+            canvas.create_line(sx, sy, ex, ey, fill="#ffffff", width=1, dash=(4, 2), tags="gradient_handle")
+            for px, py in ((sx, sy), (ex, ey)):
+                canvas.create_oval(px - 4, py - 4, px + 4, py + 4, outline="#ffffff",
+                                   fill="#ff6666", tags="gradient_handle")
+        else:
+            cx, cy = img_x + gradient.center[0] * img_w, img_y + gradient.center[1] * img_h
+            rx, ry = gradient.radius[0] * img_w, gradient.radius[1] * img_h
+            canvas.create_oval(cx - rx, cy - ry, cx + rx, cy + ry, outline="#ffffff",
+                               dash=(4, 2), tags="gradient_handle")
+            canvas.create_oval(cx - 4, cy - 4, cx + 4, cy + 4, outline="#ffffff",
+                               fill="#ff6666", tags="gradient_handle")
+    
     def _update_masks_list(self):
         """Обновляет список масок в UI с кнопкой удаления"""
         # Очищаем список
@@ -4394,8 +4643,12 @@ end tell
             self.editor_mask_mode = 'drawing'
             self.editor_canvas.configure(cursor="circle")
             
-            # Загружаем настройки маски в слайдеры
             mask = self.editor_masks[index]
+            if isinstance(mask['array'], develop_engine.GradientMask):
+                self.editor_mask_mode = 'gradient'
+                self.editor_canvas.configure(cursor="crosshair")
+            
+            # Загружаем настройки маски в слайдеры
             self.mask_exposure.set(mask['exposure'])
             self.mask_highlights.set(mask.get('highlights', 0))
             self.mask_shadows.set(mask.get('shadows', 0))
@@ -4427,89 +4680,10 @@ end tell
             mask['feather'] = int(self.mask_feather.get())
     
     def _apply_masks_preview(self):
-        """Применяет все маски для превью"""
+        """Применяет все маски для превью (маски — стадия общего конвейера проявки)"""
         if self.editor_original_array is None:
             return
-        
-        # Начинаем с оригинала
-        arr = self.editor_original_array.copy()
-        
-        # Применяем каждую маску
-        for mask_data in self.editor_masks:
-            # Пропускаем отключённые маски
-            if not mask_data.get('enabled', True):
-                continue
-            
-            mask = mask_data['array'].copy()  # Копируем чтобы не изменять оригинал
-            if np.max(mask) < 0.01:
-                continue  # Пустая маска
-            
-            # Применяем feather (размытие краёв)
-            feather = mask_data.get('feather', 0)
-            if feather > 0:
-                try:
-                    import cv2
-                    # Размер ядра должен быть нечётным
-                    kernel_size = feather * 2 + 1
-                    if kernel_size % 2 == 0:
-                        kernel_size += 1
-                    # Sigma пропорционален feather для более заметного эффекта
-                    sigma = feather * 0.5
-                    mask = cv2.GaussianBlur(mask, (kernel_size, kernel_size), sigma)
-                    logger.debug(f"Applied feather {feather} to mask, kernel={kernel_size}")
-                except Exception as e:
-                    logger.error(f"Feather error: {e}")
-            
-            mask_3d = mask[:,:,np.newaxis]
-            
-            # Экспозиция
-            exp = mask_data['exposure']
-            if abs(exp) > 0.01:
-                factor = 2 ** exp
-                corrected = arr * factor
-                arr = arr * (1 - mask_3d) + corrected * mask_3d
-            
-            # Хайлайты (света)
-            highlights = mask_data.get('highlights', 0)
-            if abs(highlights) > 1:
-                lum = 0.299 * arr[:,:,0] + 0.587 * arr[:,:,1] + 0.114 * arr[:,:,2]
-                # Маска светов (яркость > 180)
-                highlight_mask = np.clip((lum - 150) / 80, 0, 1)[:,:,np.newaxis]
-                factor = 1 + highlights / 100
-                corrected = arr * factor
-                combined_mask = mask_3d * highlight_mask
-                arr = arr * (1 - combined_mask) + corrected * combined_mask
-            
-            # Тени
-            shadows = mask_data.get('shadows', 0)
-            if abs(shadows) > 1:
-                lum = 0.299 * arr[:,:,0] + 0.587 * arr[:,:,1] + 0.114 * arr[:,:,2]
-                # Маска теней (яркость < 80)
-                shadow_mask = np.clip((80 - lum) / 60, 0, 1)[:,:,np.newaxis]
-                factor = 1 + shadows / 100
-                corrected = arr * factor
-                combined_mask = mask_3d * shadow_mask
-                arr = arr * (1 - combined_mask) + corrected * combined_mask
-            
-            # Температура
-            temp = mask_data['temperature']
-            if abs(temp) > 1:
-                corrected = arr.copy()
-                corrected[:,:,0] = corrected[:,:,0] + temp * 0.6
-                corrected[:,:,2] = corrected[:,:,2] - temp * 0.6
-                arr = arr * (1 - mask_3d) + corrected * mask_3d
-            
-            # Насыщенность
-            sat = mask_data['saturation']
-            if abs(sat - 1.0) > 0.01:
-                lum = 0.299 * arr[:,:,0] + 0.587 * arr[:,:,1] + 0.114 * arr[:,:,2]
-                lum = lum[:,:,np.newaxis]
-                corrected = lum + (arr - lum) * sat
-                arr = arr * (1 - mask_3d) + corrected * mask_3d
-        
-        arr = np.clip(arr, 0, 255)
-        self.editor_current_image = Image.fromarray(arr.astype(np.uint8))
-        self.editor_display_image()
+        self._do_apply_adjustments()
     
     def editor_delete_current_mask(self):
         """Удаляет текущую маску"""
@@ -4541,7 +4715,8 @@ end tell
             
             # Загружаем оригинал
             self.editor_original_image = Image.open(path).convert("RGB")
-            orig_w, orig_h = self.editor_original_image.size
+            self.editor_original_size = self.editor_original_image.size
+            orig_w, orig_h = self.editor_original_size
             
             # Создаём preview версию для быстрой работы
             if max(orig_w, orig_h) > self.editor_preview_max:
@@ -4555,27 +4730,21 @@ end tell
             # Конвертируем в numpy для быстрой обработки
             self.editor_original_array = np.array(self.editor_preview_image, dtype=np.float32)
             
+            self._discard_pending_renders()
             self.editor_current_image = self.editor_preview_image.copy()
             self.editor_reset_sliders()
+            self.editor_masks = []
+            self.editor_current_mask_index = -1
+            self.editor_mask_mode = None
+            # История undo - у каждого снимка своя (в ней его маски)
+            self.editor_history = []
+            self.editor_history_index = -1
+            self._update_masks_list()
             self.editor_display_image()
     
     def editor_reset_sliders(self):
         """Сброс всех слайдеров к значениям по умолчанию"""
-        self.editor_exposure.set(0.0)
-        self.editor_contrast.set(1.0)
-        self.editor_highlights.set(0)
-        self.editor_shadows.set(0)
-        self.editor_brightness.set(1.0)
-        self.editor_saturation.set(1.0)
-        self.editor_temperature.set(0)
-        self.editor_tint.set(0)
-        self.editor_vertical.set(0)
-        self.editor_horizontal.set(0)
-        self.editor_rotation.set(0)
-        self.editor_shift_x.set(0)
-        self.editor_shift_y.set(0)
-        self.editor_aspect.set(0)
-        self.editor_scale.set(0)
+        self._load_settings(develop_engine.DEFAULT_SETTINGS)
     
     def _calculate_auto_scale(self, H, w, h):
         """
@@ -4668,8 +4837,9 @@ end tell
     
     def editor_reset(self):
         """Полный сброс редактора"""
-        if self.editor_original_image:
-            self.editor_current_image = self.editor_original_image.copy()
+        if self.editor_preview_image is not None:
+            self._discard_pending_renders()
+            self.editor_current_image = self.editor_preview_image.copy()
             self.editor_reset_sliders()
             self.editor_guides = []
             self.editor_masks = []
@@ -4694,13 +4864,21 @@ end tell
             'aspect': self.editor_aspect.get(),
             'scale': self.editor_scale.get(),
         }
+        # Маски сравниваются по версиям (растёт с каждым мазком) и параметрам
+        masks_key = [(m.get('version', 0),) + tuple(m.get(k, 0) for k in develop_engine.MASK_KEYS)
+                     for m in self.editor_masks]
         
         # Проверяем, отличается ли от последнего состояния
         if self.editor_history:
             last = self.editor_history[self.editor_history_index] if self.editor_history_index >= 0 else None
-            if last and all(abs(state[k] - last[k]) < 0.001 for k in state):
+            if (last and all(abs(state[k] - last[k]) < 0.001 for k in state)
+                    and masks_key == last.get('masks_key')):
                 return  # Не сохраняем дубликаты
         
+        # Кисть меняет массив маски на месте, поэтому в истории - копии
+        state['masks'] = [dict(m, array=m['array'].copy()) for m in self.editor_masks]
+        state['masks_key'] = masks_key
+        
         # Удаляем будущие состояния если мы в середине истории
         if self.editor_history_index < len(self.editor_history) - 1:
             self.editor_history = self.editor_history[:self.editor_history_index + 1]
@@ -4745,6 +4923,14 @@ end tell
         self.editor_rotation.set(state['rotation'])
         self.editor_aspect.set(state['aspect'])
         self.editor_scale.set(state['scale'])
+        if 'masks' in state:
+            # Копии, чтобы следующие мазки не меняли состояние в истории
+            self.editor_masks = [dict(m, array=m['array'].copy()) for m in state['masks']]
+            self.editor_current_mask_index = min(self.editor_current_mask_index, len(self.editor_masks) - 1)
+            if self.editor_current_mask_index < 0:
+                self.editor_mask_mode = None
+                self.editor_canvas.configure(cursor="")
+            self._update_masks_list()
         # Применяем без сохранения в историю
         self._apply_adjustments_no_history()
     
@@ -4756,16 +4942,8 @@ end tell
             self._checkerboard_size == (canvas_w, canvas_h)):
             return self.editor_checkerboard_photo
         
-        # Создаём новое изображение шахматного фона
-        cell_size = 16
-        colors = [(58, 58, 58), (42, 42, 42)]
-        
-        # Создаём через numpy (быстрее)
-        arr = np.zeros((canvas_h, canvas_w, 3), dtype=np.uint8)
-        for row in range(0, canvas_h, cell_size):
-            for col in range(0, canvas_w, cell_size):
-                color = colors[(row // cell_size + col // cell_size) % 2]
-                arr[row:row+cell_size, col:col+cell_size] = color
+        # Создаём новое изображение шахматного фона (векторизованно)
+        arr = develop_engine.checkerboard(canvas_h, canvas_w, colors=((58, 58, 58), (42, 42, 42)))
         
         img = Image.fromarray(arr)
         self.editor_checkerboard_image = img
@@ -4774,22 +4952,187 @@ end tell
         
         return self.editor_checkerboard_photo
     
-    def editor_display_image(self):
-        """Отображение текущего изображения на canvas с поддержкой zoom"""
+    def _ensure_editor_canvas_items(self):
+        """
+        Создаёт постоянные элементы canvas редактора (один раз).
+        
+        Кадры и оверлеи затем только обновляются (itemconfigure/coords/paste).
+        Если canvas был очищен через delete("all"), элементы создаются заново.
+        """
+        items = self.editor_canvas_items
+        if items and self.editor_canvas.type(items['image']):
+            return items
+        
+        canvas = self.editor_canvas
+        canvas.delete("placeholder")
+        corner_color = "#ffffff"
+        grid_color = "#ffffff"
+        grid_color_light = "#666666"
+        
+        items = {
+            'checkerboard': canvas.create_image(0, 0, anchor="nw", tags="checkerboard"),
+            'image': canvas.create_image(0, 0, anchor="nw", tags="image"),
+            # Рамка вокруг изображения (двойная для контраста)
+            'border_outer': canvas.create_rectangle(0, 0, 0, 0, outline="#000000", width=2, tags="border_outer"),
+            'border_inner': canvas.create_rectangle(0, 0, 0, 0, outline="#00ff00", width=2, tags="border_inner"),
+            # Угловые маркеры (как в Lightroom): по две линии на угол
+            'corners': [canvas.create_line(0, 0, 0, 0, fill=corner_color, width=2, tags="corner")
+                        for _ in range(8)],
+            'info_shadow': canvas.create_text(0, 0, anchor="ne", font=(FONT_FAMILY, 11, "bold"),
+                                              fill="#000000", tags="info_shadow"),
+            'info_label': canvas.create_text(0, 0, anchor="ne", font=(FONT_FAMILY, 11, "bold"),
+                                             fill="#ffffff", tags="info_label"),
+            # Сетка: 2+2 линии правила третей и 2 центральные
+            'grid': [canvas.create_line(0, 0, 0, 0, fill=grid_color_light, width=1, tags="grid")
+                     for _ in range(4)] +
+                    [canvas.create_line(0, 0, 0, 0, fill=grid_color, width=1, dash=(4, 4), tags="grid")
+                     for _ in range(2)],
+            'clipping_overlay': canvas.create_image(0, 0, anchor="nw", state="hidden", tags="clipping_overlay"),
+            'mask_overlay': canvas.create_image(0, 0, anchor="nw", state="hidden", tags="mask_overlay"),
+        }
+        self.editor_canvas_items = items
+        self.editor_photo = None
+        self._editor_display_key = None
+        self._clipping_overlay_photo = None
+        self._clipping_overlay_key = None
+        self._mask_overlay_photo = None
+        self._mask_overlay_shown = None
+        self._checkerboard_item_size = None
+        return items
+    
+    def _set_editor_display_bitmap(self, img, x, y, new_w, new_h, canvas_w, canvas_h, dirty=None):
+        """
+        Обновляет отображаемый кадр: в bitmap попадает только видимая на
+        canvas часть изображения, поэтому цена не растёт вместе с zoom.
+        
+        Пересэмплирование выполняется только при смене кадра (по
+        идентичности), размера отображения или видимой области.
+        dirty - (y0, y1, x0, x1) в пикселях img: новый кадр отличается от
+        показанного только им, и обновляется только эта часть bitmap.
+        
+        Returns:
+            (x, y) - позиция bitmap на canvas или None, если кадр не виден
+        """
+        # Видимая часть в координатах отображённого изображения
+        left, top = max(0, -x), max(0, -y)
+        right, bottom = min(new_w, canvas_w - x), min(new_h, canvas_h - y)
+        if right <= left or bottom <= top:
+            return None
+        
+        zoomed = self.editor_zoom_level != 1.0
+        key = (new_w, new_h, zoomed, left, top, right, bottom)
+        cached = self._editor_display_key
+        if cached is not None and cached[0] is img and cached[1] == key:
+            return x + left, y + top
+        
+        if (dirty is not None and cached is not None and cached[1] == key and not zoomed and
+                self.editor_photo is not None):
+            self._paste_editor_display_rect(img, new_w, new_h, dirty)
+            self._editor_display_key = (img, key)
+            return x + left, y + top
+        
+        if (left, top, right, bottom) == (0, 0, new_w, new_h):
+            # Изображение видно целиком - один resize всего кадра
+            resample = Image.Resampling.BILINEAR if zoomed else Image.Resampling.LANCZOS
+            bitmap = img.resize((new_w, new_h), resample)
+        else:
+            bitmap = self._render_viewport_tiles(img, new_w, new_h, left, top, right, bottom)
+        
+        if self.editor_photo is not None and (self.editor_photo.width(), self.editor_photo.height()) == bitmap.size:
+            # Тот же размер - обновляем пиксели существующего PhotoImage на месте
+            self.editor_photo.paste(bitmap)
+        else:
+            self.editor_photo = ImageTk.PhotoImage(bitmap)
+            self.editor_canvas.itemconfigure(self.editor_canvas_items['image'], image=self.editor_photo)
+        self._editor_display_key = (img, key)
+        return x + left, y + top
+    
+    def _paste_editor_display_rect(self, img, new_w, new_h, dirty):
+        """
+        Пересэмплирует и копирует в показанный PhotoImage только часть
+        кадра, покрывающую прямоугольник dirty (в пикселях img).
+        """
+        scale_x = new_w / img.width
+        scale_y = new_h / img.height
+        y0, y1, x0, x1 = dirty
+        # Запас на носитель фильтра LANCZOS (3 px отображения)
+        margin = 4
+        dx0 = max(0, int(x0 * scale_x) - margin)
+        dy0 = max(0, int(y0 * scale_y) - margin)
+        dx1 = min(new_w, int(np.ceil(x1 * scale_x)) + margin)
+        dy1 = min(new_h, int(np.ceil(y1 * scale_y)) + margin)
+        if dx1 <= dx0 or dy1 <= dy0:
+            return
+        
+        # С box PIL берёт пиксели вокруг прямоугольника - как при resize всего кадра
+        patch = img.resize((dx1 - dx0, dy1 - dy0), Image.Resampling.LANCZOS,
+                           box=(dx0 / scale_x, dy0 / scale_y, dx1 / scale_x, dy1 / scale_y))
+        patch_photo = ImageTk.PhotoImage(patch)
+        self.editor_canvas.tk.call(str(self.editor_photo), 'copy', str(patch_photo), '-to', dx0, dy0)
+    
+    def _render_viewport_tiles(self, img, new_w, new_h, left, top, right, bottom):
+        """
+        Собирает видимую область увеличенного изображения из тайлов.
+        
+        Тайлы выровнены по сетке отображённого изображения и кэшируются,
+        поэтому при панорамировании пересэмплируются только новые края.
+        """
+        cache = self._editor_tile_cache
+        if cache.get('image') is not img or cache.get('size') != (new_w, new_h):
+            cache.clear()
+            cache.update(image=img, size=(new_w, new_h), tiles={})
+        tiles = cache['tiles']
+        
+        tile = self.editor_tile_size
+        scale_x = img.width / new_w
+        scale_y = img.height / new_h
+        viewport = Image.new(img.mode, (right - left, bottom - top))
+        
+        for ty in range(top // tile, (bottom - 1) // tile + 1):
+            for tx in range(left // tile, (right - 1) // tile + 1):
+                tile_img = tiles.pop((tx, ty), None)
+                if tile_img is None:
+                    x0, y0 = tx * tile, ty * tile
+                    x1, y1 = min(x0 + tile, new_w), min(y0 + tile, new_h)
+                    tile_img = img.resize((x1 - x0, y1 - y0), Image.Resampling.BILINEAR,
+                                          box=(x0 * scale_x, y0 * scale_y, x1 * scale_x, y1 * scale_y))
+                # Порядок вставки = порядок использования (LRU)
+                tiles[(tx, ty)] = tile_img
+                viewport.paste(tile_img, (tx * tile - left, ty * tile - top))
+        
+        while len(tiles) > self.editor_tile_cache_max:
+            del tiles[next(iter(tiles))]
+        
+        return viewport
+
+    def editor_display_image(self, dirty=None):
+        """
+        Отображение текущего изображения на canvas с поддержкой zoom.
+        
+        dirty - прямоугольник кадра, которым он отличается от показанного
+        (см. _set_editor_display_bitmap)
+        """
         if not self.editor_current_image:
             return
         
-        self.editor_canvas.delete("all")
+        items = self._ensure_editor_canvas_items()
+        canvas = self.editor_canvas
         
         canvas_w = self.editor_canvas.winfo_width() or 800
         canvas_h = self.editor_canvas.winfo_height() or 500
         
-        # Рисуем шахматный фон (кэшированный)
-        checkerboard = self._get_checkerboard_image(canvas_w, canvas_h)
-        self.editor_canvas.create_image(0, 0, anchor="nw", image=checkerboard, tags="checkerboard")
+        # Шахматный фон (кэшированный), меняется только вместе с размером canvas
+        if self._checkerboard_item_size != (canvas_w, canvas_h):
+            checkerboard = self._get_checkerboard_image(canvas_w, canvas_h)
+            canvas.itemconfigure(items['checkerboard'], image=checkerboard)
+            self._checkerboard_item_size = (canvas_w, canvas_h)
         
         img = self.editor_current_image
         img_w, img_h = img.size
+        # Кадр с меньшего уровня пирамиды показываем размером основного превью
+        display_size = self.editor_current_display_size
+        if display_size is not None and display_size[0] is img:
+            img_w, img_h = display_size[1]
         
         # Базовый масштаб (fit to canvas)
         base_scale = min(canvas_w / img_w, canvas_h / img_h, 1.0)
@@ -4810,35 +5153,33 @@ end tell
             x = int(base_x + self.editor_zoom_offset[0])
             y = int(base_y + self.editor_zoom_offset[1])
         
-        # Создаём превью
-        resample = Image.Resampling.BILINEAR if self.editor_zoom_level != 1.0 else Image.Resampling.LANCZOS
-        preview = img.resize((new_w, new_h), resample)
-        self.editor_photo = ImageTk.PhotoImage(preview)
-        self.editor_canvas.create_image(x, y, anchor="nw", image=self.editor_photo, tags="image")
-        
-        # Рамка вокруг изображения (двойная для контраста)
-        # Внешняя тёмная рамка
-        self.editor_canvas.create_rectangle(x-3, y-3, x+new_w+3, y+new_h+3, 
-                                           outline="#000000", width=2, tags="border_outer")
-        # Внутренняя яркая рамка
-        self.editor_canvas.create_rectangle(x-1, y-1, x+new_w+1, y+new_h+1, 
-                                           outline="#00ff00", width=2, tags="border_inner")
-        
-        # Угловые маркеры (как в Lightroom)
+        # Кадр: только видимая область, пересэмплирование при необходимости
+        position = self._set_editor_display_bitmap(img, x, y, new_w, new_h, canvas_w, canvas_h, dirty)
+        if position:
+            canvas.coords(items['image'], *position)
+            canvas.itemconfigure(items['image'], state="normal")
+        else:
+            canvas.itemconfigure(items['image'], state="hidden")
+        
+        # Рамка
+        canvas.coords(items['border_outer'], x-3, y-3, x+new_w+3, y+new_h+3)
+        canvas.coords(items['border_inner'], x-1, y-1, x+new_w+1, y+new_h+1)
+        
+        # Угловые маркеры
         corner_len = min(30, new_w // 10, new_h // 10)
-        corner_color = "#ffffff"
-        # Верхний левый
-        self.editor_canvas.create_line(x, y, x + corner_len, y, fill=corner_color, width=2, tags="corner")
-        self.editor_canvas.create_line(x, y, x, y + corner_len, fill=corner_color, width=2, tags="corner")
-        # Верхний правый
-        self.editor_canvas.create_line(x + new_w, y, x + new_w - corner_len, y, fill=corner_color, width=2, tags="corner")
-        self.editor_canvas.create_line(x + new_w, y, x + new_w, y + corner_len, fill=corner_color, width=2, tags="corner")
-        # Нижний левый
-        self.editor_canvas.create_line(x, y + new_h, x + corner_len, y + new_h, fill=corner_color, width=2, tags="corner")
-        self.editor_canvas.create_line(x, y + new_h, x, y + new_h - corner_len, fill=corner_color, width=2, tags="corner")
-        # Нижний правый
-        self.editor_canvas.create_line(x + new_w, y + new_h, x + new_w - corner_len, y + new_h, fill=corner_color, width=2, tags="corner")
-        self.editor_canvas.create_line(x + new_w, y + new_h, x + new_w, y + new_h - corner_len, fill=corner_color, width=2, tags="corner")
+        corner_lines = (
+            # Верхний левый
+            (x, y, x + corner_len, y), (x, y, x, y + corner_len),
+            # Верхний правый
+            (x + new_w, y, x + new_w - corner_len, y), (x + new_w, y, x + new_w, y + corner_len),
+            # Нижний левый
+            (x, y + new_h, x + corner_len, y + new_h), (x, y + new_h, x, y + new_h - corner_len),
+            # Нижний правый
+            (x + new_w, y + new_h, x + new_w - corner_len, y + new_h),
+            (x + new_w, y + new_h, x + new_w, y + new_h - corner_len),
+        )
+        for item, line in zip(items['corners'], corner_lines):
+            canvas.coords(item, *line)
         
         # Сохраняем смещение изображения
         self.editor_img_offset = (x, y)
@@ -4850,96 +5191,279 @@ end tell
             info_parts.append(f"{int(self.editor_zoom_level * 100)}%")
         if self.editor_library:
             info_parts.append(f"{self.editor_current_index + 1}/{len(self.editor_library)}")
-        if info_parts:
-            self.editor_canvas.create_text(canvas_w - 10, 10, text=" | ".join(info_parts), anchor="ne",
-                                          font=(FONT_FAMILY, 11, "bold"), fill="#ffffff", tags="info_label")
-            self.editor_canvas.create_text(canvas_w - 11, 11, text=" | ".join(info_parts), anchor="ne",
-                                          font=(FONT_FAMILY, 11, "bold"), fill="#000000", tags="info_shadow")
-        
-        # Рисуем сетку (правило третей + центральные линии)
+        info_state = "normal" if info_parts else "hidden"
+        info_text = " | ".join(info_parts)
+        canvas.itemconfigure(items['info_label'], text=info_text, state=info_state)
+        canvas.coords(items['info_label'], canvas_w - 10, 10)
+        canvas.itemconfigure(items['info_shadow'], text=info_text, state=info_state)
+        canvas.coords(items['info_shadow'], canvas_w - 11, 11)
+        
+        # Сетка (правило третей + центральные линии)
         if self.editor_show_grid:
-            # Цвет сетки
-            grid_color = "#ffffff"
-            grid_color_light = "#666666"
-            
-            # Границы изображения
             left, top = x, y
             right, bottom = x + new_w, y + new_h
-            
-            # Вертикальные линии (правило третей)
-            for i in range(1, 3):
-                lx = left + (new_w * i // 3)
-                self.editor_canvas.create_line(lx, top, lx, bottom, fill=grid_color_light, width=1, tags="grid")
-            
-            # Горизонтальные линии (правило третей)
-            for i in range(1, 3):
-                ly = top + (new_h * i // 3)
-                self.editor_canvas.create_line(left, ly, right, ly, fill=grid_color_light, width=1, tags="grid")
-            
-            # Центральные линии
             cx = left + new_w // 2
             cy = top + new_h // 2
-            self.editor_canvas.create_line(cx, top, cx, bottom, fill=grid_color, width=1, dash=(4, 4), tags="grid")
-            self.editor_canvas.create_line(left, cy, right, cy, fill=grid_color, width=1, dash=(4, 4), tags="grid")
+            grid_lines = (
+                [(left + (new_w * i // 3), top, left + (new_w * i // 3), bottom) for i in range(1, 3)] +
+                [(left, top + (new_h * i // 3), right, top + (new_h * i // 3)) for i in range(1, 3)] +
+                [(cx, top, cx, bottom), (left, cy, right, cy)]
+            )
+            for item, line in zip(items['grid'], grid_lines):
+                canvas.coords(item, *line)
+                canvas.itemconfigure(item, state="normal")
+        else:
+            for item in items['grid']:
+                canvas.itemconfigure(item, state="hidden")
         
-        # Рисуем гайды (конвертируем из нормализованных координат)
+        # Гайды (их число меняется, поэтому пересоздаются - это несколько линий)
+        canvas.delete("guide")
         if self.editor_show_guides:
             for guide in self.editor_guides:
                 nx1, ny1, nx2, ny2 = guide
                 # Конвертируем нормализованные координаты в canvas
                 cx1, cy1, cx2, cy2 = self._image_to_canvas_coords(nx1, ny1, nx2, ny2)
-                self.editor_canvas.create_line(cx1, cy1, cx2, cy2, fill="#00ff00", width=2, tags="guide")
+                canvas.create_line(cx1, cy1, cx2, cy2, fill="#00ff00", width=2, tags="guide")
+            canvas.tag_lower("guide", items['mask_overlay'])
         
-        # Рисуем маску текущей (красный оверлей) если видимость включена
+        # Клиппинг: света красным, тени синим
+        if self.editor_show_clipping and self.editor_clipping is not None:
+            self._draw_clipping_overlay(x, y, new_w, new_h)
+        else:
+            canvas.itemconfigure(items['clipping_overlay'], state="hidden")
+        
+        # Маска текущей (красный оверлей) если видимость включена
+        show_mask = False
         if self.editor_current_mask_index >= 0 and self.editor_current_mask_index < len(self.editor_masks):
             mask = self.editor_masks[self.editor_current_mask_index]
-            if mask.get('visible', True):
-                self._draw_mask_overlay(x, y, new_w, new_h)
+            show_mask = mask.get('visible', True)
+        if show_mask:
+            self._draw_mask_overlay(x, y, new_w, new_h)
+        else:
+            canvas.itemconfigure(items['mask_overlay'], state="hidden")
+        self._draw_gradient_handles(x, y, new_w, new_h)
     
     def _draw_mask_overlay(self, img_x, img_y, img_w, img_h):
-        """Рисует текущую маску как полупрозрачный красный оверлей"""
+        """
+        Рисует текущую маску как полупрозрачный красный оверлей.
+        
+        Bitmap оверлея строится заново только при смене маски (feather),
+        размера отображения или видимой области - перерисовка гайдов,
+        сетки или того же кадра берёт готовый. Пока меняются только мазки
+        кисти, в нём перерисовывается лишь задетый ими прямоугольник.
+        """
         if self.editor_current_mask_index < 0 or self.editor_current_mask_index >= len(self.editor_masks):
             return
         
         mask_data = self.editor_masks[self.editor_current_mask_index]
-        mask_array = mask_data['array'].copy()
         
-        # Применяем feather к оверлею тоже
-        feather = mask_data.get('feather', 0)
-        if feather > 0:
-            try:
-                import cv2
-                kernel_size = feather * 2 + 1
-                if kernel_size % 2 == 0:
-                    kernel_size += 1
-                mask_array = cv2.GaussianBlur(mask_array, (kernel_size, kernel_size), 0)
-            except:
-                pass
+        try:
+            item = self.editor_canvas_items['mask_overlay']
+            
+            # Только видимая на canvas часть (при zoom не строим оверлей больше canvas)
+            canvas_w = self.editor_canvas.winfo_width() or 800
+            canvas_h = self.editor_canvas.winfo_height() or 500
+            left, top = max(0, -img_x), max(0, -img_y)
+            right, bottom = min(img_w, canvas_w - img_x), min(img_h, canvas_h - img_y)
+            if right <= left or bottom <= top:
+                self.editor_canvas.itemconfigure(item, state="hidden")
+                return
+            view_w, view_h = right - left, bottom - top
+            
+            array = mask_data['array']
+            feather = int(mask_data.get('feather', 0))
+            version = mask_data.get('version', 0)
+            view = (img_w, img_h, left, top, view_w, view_h)
+            
+            # Прямоугольник оверлея, который надо перерисовать (всё - по умолчанию)
+            box = (0, view_h, 0, view_w)
+            shown = self._mask_overlay_shown
+            if shown is not None and shown[0] is array and shown[1:3] == (feather, view):
+                if shown[3] == version:
+                    # Ни маска, ни вид не менялись - битмап на холсте актуален
+                    box = None
+                elif isinstance(array, develop_engine.TiledMask):
+                    changed = array.dirty_since(shown[3])
+                    if changed is not None:
+                        # Растушёвка расширяет мазок на радиус ядра, +1 на интерполяцию масштаба
+                        pad = feather + 1
+                        mask_h, mask_w = array.shape
+                        box = (max(0, int((changed[0] - pad) * img_h / mask_h) - top),
+                               min(view_h, int(np.ceil((changed[1] + pad) * img_h / mask_h)) - top),
+                               max(0, int((changed[2] - pad) * img_w / mask_w) - left),
+                               min(view_w, int(np.ceil((changed[3] + pad) * img_w / mask_w)) - left))
+            
+            if box is not None and box[1] > box[0] and box[3] > box[2]:
+                overlay_img = self._build_mask_overlay(mask_data, img_w, img_h,
+                                                       left + box[2], top + box[0],
+                                                       box[3] - box[2], box[1] - box[0])
+                photo = self._mask_overlay_photo
+                if box != (0, view_h, 0, view_w):
+                    # Заменяем пиксели (вместе с альфой), а не накладываем поверх
+                    patch_photo = ImageTk.PhotoImage(overlay_img)
+                    self.editor_canvas.tk.call(str(photo), 'copy', str(patch_photo),
+                                               '-to', box[2], box[0], '-compositingrule', 'set')
+                elif photo is not None and (photo.width(), photo.height()) == overlay_img.size:
+                    # Тот же размер - обновляем пиксели существующего PhotoImage на месте
+                    photo.paste(overlay_img)
+                else:
+                    self._mask_overlay_photo = ImageTk.PhotoImage(overlay_img)
+                    self.editor_canvas.itemconfigure(item, image=self._mask_overlay_photo)
+            self._mask_overlay_shown = (array, feather, view, version)
+            
+            self.editor_canvas.itemconfigure(item, state="normal")
+            self.editor_canvas.coords(item, img_x + left, img_y + top)
+        except Exception as e:
+            self._mask_overlay_shown = None
+            logger.error(f"Mask overlay error: {e}")
+    
+    def _build_mask_overlay(self, mask_data, img_w, img_h, x0, y0, out_w, out_h):
+        """
+        Красный оверлей маски для прямоугольника (x0, y0, out_w, out_h)
+        изображения, показанного размером (img_w, img_h).
+        """
+        import cv2
         
+        # Та же растушёвка, что и в коррекциях (из общего кэша)
+        mask_array = develop_engine.feathered_mask(mask_data)
+        
+        if isinstance(mask_array, develop_engine.GradientMask):
+            # Градиент - сразу в разрешении отображения
+            mask_resized = mask_array.evaluate(img_w, img_h, x0, y0, out_w, out_h)
+        else:
+            # Масштаб + сдвиг за один проход: пиксель оверлея -> пиксель маски
+            mask_h, mask_w = mask_array.shape[:2]
+            sx, sy = mask_w / img_w, mask_h / img_h
+            M = np.float32([[sx, 0, (x0 + 0.5) * sx - 0.5],
+                            [0, sy, (y0 + 0.5) * sy - 0.5]])
+            mask_resized = cv2.warpAffine(mask_array, M, (out_w, out_h),
+                                          flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                                          borderMode=cv2.BORDER_REPLICATE)
+        
+        # Создаём красный оверлей
+        overlay = np.zeros((out_h, out_w, 4), dtype=np.uint8)
+        overlay[:,:,0] = 255  # Red
+        overlay[:,:,3] = (mask_resized * 80).astype(np.uint8)  # Alpha (менее яркий)
+        
+        return Image.fromarray(overlay, mode='RGBA')
+    
+    def _draw_clipping_overlay(self, img_x, img_y, img_w, img_h):
+        """
+        Рисует карту клиппинга показанного кадра: света - красным,
+        тени - синим. Bitmap строится заново только для нового кадра,
+        размера отображения или видимой области.
+        """
         try:
             import cv2
-            mask_resized = cv2.resize(mask_array, (img_w, img_h), interpolation=cv2.INTER_LINEAR)
-            
-            # Создаём красный оверлей
-            overlay = np.zeros((img_h, img_w, 4), dtype=np.uint8)
-            overlay[:,:,0] = 255  # Red
-            overlay[:,:,3] = (mask_resized * 80).astype(np.uint8)  # Alpha (менее яркий)
+            item = self.editor_canvas_items['clipping_overlay']
+            clipping = self.editor_clipping
+            
+            canvas_w = self.editor_canvas.winfo_width() or 800
+            canvas_h = self.editor_canvas.winfo_height() or 500
+            left, top = max(0, -img_x), max(0, -img_y)
+            right, bottom = min(img_w, canvas_w - img_x), min(img_h, canvas_h - img_y)
+            if right <= left or bottom <= top:
+                self.editor_canvas.itemconfigure(item, state="hidden")
+                return
+            view_w, view_h = right - left, bottom - top
+            
+            key = (id(clipping), img_w, img_h, left, top, right, bottom)
+            if key != self._clipping_overlay_key:
+                # Масштаб + сдвиг за один проход; без интерполяции - значения карты это коды
+                map_h, map_w = clipping.shape
+                sx, sy = map_w / img_w, map_h / img_h
+                M = np.float32([[sx, 0, (left + 0.5) * sx - 0.5],
+                                [0, sy, (top + 0.5) * sy - 0.5]])
+                codes = cv2.warpAffine(clipping, M, (view_w, view_h),
+                                       flags=cv2.INTER_NEAREST | cv2.WARP_INVERSE_MAP,
+                                       borderMode=cv2.BORDER_REPLICATE)
+                palette = np.array([[0, 0, 0, 0], [0, 96, 255, 255], [255, 0, 0, 255]], dtype=np.uint8)
+                overlay_img = Image.fromarray(palette[codes], mode='RGBA')
+                
+                photo = self._clipping_overlay_photo
+                if photo is not None and (photo.width(), photo.height()) == overlay_img.size:
+                    photo.paste(overlay_img)
+                else:
+                    self._clipping_overlay_photo = ImageTk.PhotoImage(overlay_img)
+                    self.editor_canvas.itemconfigure(item, image=self._clipping_overlay_photo)
+                self._clipping_overlay_key = key
             
-            overlay_img = Image.fromarray(overlay, mode='RGBA')
-            self._mask_overlay_photo = ImageTk.PhotoImage(overlay_img)
-            self.editor_canvas.create_image(img_x, img_y, anchor="nw", 
-                                           image=self._mask_overlay_photo, tags="mask_overlay")
+            self.editor_canvas.itemconfigure(item, state="normal")
+            self.editor_canvas.coords(item, img_x + left, img_y + top)
         except Exception as e:
-            logger.error(f"Mask overlay error: {e}")
+            logger.error(f"Clipping overlay error: {e}")
+    
+    def _draw_histogram(self, histogram):
+        """
+        Обновляет гистограмму редактора: яркость - серой заливкой,
+        каналы - линиями. Высота нормируется без крайних столбцов, чтобы
+        пик клиппинга не сплющивал остальное.
+        """
+        canvas = self.editor_histogram_canvas
+        items = self.editor_histogram_items
+        height = int(canvas.cget("height"))
+        peak = max(1, histogram[:, 1:-1].max())
+        heights = height - np.minimum(histogram * ((height - 2) / peak), height - 2)
+        xs = np.arange(256)
+        
+        luma = np.column_stack([xs, heights[3]]).ravel().tolist()
+        canvas.coords(items['luma'], 0, height, *luma, 255, height)
+        for channel, name in enumerate(('r', 'g', 'b')):
+            canvas.coords(items[name], *np.column_stack([xs, heights[channel]]).ravel().tolist())
+    
+    def editor_toggle_clipping(self):
+        """Включает/выключает оверлей клиппинга"""
+        self.editor_show_clipping = not self.editor_show_clipping
+        if self.editor_show_clipping:
+            self.clipping_btn.configure(text="⚠️ Скрыть клиппинг", fg_color=COLORS["primary"])
+            # Карту строит поток рендера - кадр из кэша конвейера
+            self._do_apply_adjustments()
+        else:
+            self.clipping_btn.configure(text="⚠️ Показать клиппинг", fg_color=COLORS["bg_tertiary"])
+            self.editor_clipping = None
+            self.editor_display_image()
     
     def _apply_adjustments_no_history(self):
         """Применяет настройки без сохранения в историю (для undo/redo)"""
         self._do_apply_adjustments()
     
     def _apply_adjustments_debounced(self):
-        """Применяет настройки при движении слайдера (без истории для скорости)"""
+        """
+        Применяет настройки при движении слайдера (без истории для скорости).
+        
+        Рендерит наименьший уровень пирамиды, заполняющий canvas, с черновой
+        картой геометрии и откладывает рендер основного превью до остановки слайдера.
+        """
+        if self.editor_original_array is None:
+            return
+        
+        self._do_apply_adjustments(self._preview_level_for_canvas(), draft=True)
+        
+        if self.editor_refine_id:
+            self.after_cancel(self.editor_refine_id)
+        self.editor_refine_id = self.after(self.editor_refine_delay, self._refine_preview)
+    
+    def _refine_preview(self):
+        """Рендер основного превью после остановки слайдера"""
+        self.editor_refine_id = None
         self._do_apply_adjustments()
     
+    def _get_preview_pyramid(self):
+        """Пирамида превью для текущего оригинала (перестраивается при его замене)"""
+        top = max(self.editor_original_array.shape[:2])
+        if self.editor_pyramid.get(top) is not self.editor_original_array:
+            self.editor_pyramid = develop_engine.build_preview_pyramid(self.editor_original_array)
+            self.editor_pipelines = {}
+        return self.editor_pyramid
+    
+    def _preview_level_for_canvas(self):
+        """Уровень пирамиды, которого достаточно для текущего размера canvas и zoom"""
+        canvas_w = self.editor_canvas.winfo_width() or 800
+        canvas_h = self.editor_canvas.winfo_height() or 500
+        h, w = self.editor_original_array.shape[:2]
+        fit = min(canvas_w / w, canvas_h / h, 1.0) * self.editor_zoom_level
+        return develop_engine.pick_pyramid_level(self._get_preview_pyramid(), max(w, h) * fit)
+    
     def editor_apply_adjustments_fast(self):
         """Быстрое применение настроек через NumPy (для preview)"""
         if self.editor_original_array is None:
@@ -4950,135 +5474,12 @@ end tell
         self._do_apply_adjustments()
     
     def _build_rotation_homography(self, yaw_deg, pitch_deg, roll_deg, w, h):
-        """
-        Строит гомографию в стиле GIMP EZ-Perspective.
-        
-        GIMP применяет вращения ПОСЛЕДОВАТЕЛЬНО с коррекцией после каждого:
-        1. Pitch (up/down) + коррекция масштаба
-        2. Yaw (left/right) + коррекция масштаба  
-        3. Roll (rotation) - без коррекции
-        """
-        # Фокусное расстояние (как в GIMP)
-        image_diagonal = np.sqrt(w*w + h*h)
-        diagonal_35mm = np.sqrt(36*36 + 24*24)
-        focal_length_mm = 50
-        z_fix = image_diagonal * focal_length_mm / diagonal_35mm
-        
-        cx, cy = w / 2.0, h / 2.0
-        
-        def proj_point(ud, lr, rot, x_in, y_in):
-            """Трансформация одной точки через 3D вращение"""
-            x, y, z = x_in, y_in, z_fix
-            
-            # Вращение X (pitch)
-            x, y, z = (x, 
-                      np.cos(ud)*y - np.sin(ud)*z,
-                      np.sin(ud)*y + np.cos(ud)*z)
-            # Вращение Y (yaw)
-            x, y, z = (np.cos(lr)*x - np.sin(lr)*z,
-                      y,
-                      np.sin(lr)*x + np.cos(lr)*z)
-            # Вращение Z (roll)
-            x, y, z = (np.cos(rot)*x - np.sin(rot)*y,
-                      np.sin(rot)*x + np.cos(rot)*y,
-                      z)
-            
-            if abs(z) < 1e-10:
-                z = 1e-10
-            scale = z_fix / z
-            return x * scale, y * scale
-        
-        # Начальные углы (относительно центра)
-        frame = [
-            (-cx, -cy),      # UL
-            (w - cx, -cy),   # UR
-            (-cx, h - cy),   # LL
-            (w - cx, h - cy) # LR
-        ]
-        
-        ud = np.radians(pitch_deg)
-        lr = np.radians(yaw_deg)
-        rot = np.radians(roll_deg)
-        
-        # === ШАГ 1: Pitch (up/down) с коррекцией ===
-        if abs(pitch_deg) > 0.01:
-            # Трансформируем углы только по pitch
-            frame_ud = []
-            for x, y in frame:
-                tx, ty = proj_point(ud, 0, 0, x, y)
-                frame_ud.append((tx, ty))
-            
-            # Коррекция: вычисляем сдвиг и масштаб по центральной горизонтальной линии
-            scx, shift_y = proj_point(ud, 0, 0, 100, 0)
-            
-            # Убираем вертикальный сдвиг
-            frame_ud = [(x, y - shift_y) for x, y in frame_ud]
-            
-            # Масштабируем чтобы сохранить размер
-            scale = 100 / scx if abs(scx) > 1e-6 else 1.0
-            frame = [(x * scale, y * scale) for x, y in frame_ud]
-        
-        # === ШАГ 2: Yaw (left/right) с коррекцией ===
-        if abs(yaw_deg) > 0.01:
-            # Трансформируем углы только по yaw
-            frame_lr = []
-            for x, y in frame:
-                tx, ty = proj_point(0, lr, 0, x, y)
-                frame_lr.append((tx, ty))
-            
-            # Коррекция: вычисляем сдвиг и масштаб по центральной вертикальной линии
-            shift_x, scy = proj_point(0, lr, 0, 0, 100)
-            
-            # Убираем горизонтальный сдвиг
-            frame_lr = [(x - shift_x, y) for x, y in frame_lr]
-            
-            # Масштабируем
-            scale = 100 / scy if abs(scy) > 1e-6 else 1.0
-            frame = [(x * scale, y * scale) for x, y in frame_lr]
-        
-        # === ШАГ 3: Roll (rotation) - без коррекции ===
-        if abs(roll_deg) > 0.01:
-            frame_rot = []
-            for x, y in frame:
-                tx, ty = proj_point(0, 0, rot, x, y)
-                frame_rot.append((tx, ty))
-            frame = frame_rot
-        
-        # Переводим обратно в абсолютные координаты
-        corners_dst = [(x + cx, y + cy) for x, y in frame]
-        
-        # Матрица гомографии
-        src_pts = np.array([[0, 0], [w, 0], [0, h], [w, h]], dtype=np.float32)
-        dst_pts = np.array(corners_dst, dtype=np.float32)
-        
-        H = cv2.getPerspectiveTransform(src_pts, dst_pts)
-        return H.astype(np.float32)
+        """Строит гомографию в стиле GIMP EZ-Perspective (см. develop_engine)"""
+        return develop_engine.build_rotation_homography(yaw_deg, pitch_deg, roll_deg, w, h)
     
     def _normalize_homography(self, H, w, h):
-        """
-        Нормализует гомографию, фиксируя центр изображения (Center Preservation).
-        Это предотвращает 'улет' изображения при поворотах.
-        """
-        # Центр изображения
-        cx, cy = w / 2.0, h / 2.0
-        center_pt = np.array([cx, cy, 1.0])
-        
-        # Где оказывается центр после трансформации
-        transformed_center = H @ center_pt
-        transformed_center /= transformed_center[2]
-        
-        # Вычисляем сдвиг, чтобы вернуть центр на место
-        tx = cx - transformed_center[0]
-        ty = cy - transformed_center[1]
-        
-        # Матрица сдвига
-        T = np.array([
-            [1, 0, tx],
-            [0, 1, ty],
-            [0, 0, 1]
-        ], dtype=np.float32)
-        
-        return T @ H
+        """Нормализует гомографию, фиксируя центр изображения (см. develop_engine)"""
+        return develop_engine.normalize_homography(H, w, h)
 
     def _solve_perspective_params(self, guides, w, h):
         """
@@ -5199,8 +5600,7 @@ end tell
         if len(self.editor_guides) < 1:
             return
 
-        w = self.editor_original_image.width if self.editor_original_image else 800
-        h = self.editor_original_image.height if self.editor_original_image else 600
+        w, h = self.editor_original_size or (800, 600)
         
         # Подготовка данных для Solver'а
         # Гайды хранятся в нормализованных координатах (0-1) относительно preview
@@ -5291,320 +5691,90 @@ end tell
         else:
             logger.warning("SciPy not available - cannot optimize guides")
     
-    def _do_apply_adjustments(self):
-        """Внутренняя функция применения настроек (оптимизированная)"""
+    def _do_apply_adjustments(self, level=None, draft=False):
+        """
+        Внутренняя функция применения настроек (кэшированный конвейер develop_engine).
+        
+        level - длинная сторона уровня пирамиды превью (None = основное превью),
+        draft - черновая карта геометрии (во время движения слайдера).
+        """
         if self.editor_original_array is None:
             return
         
-        # Получаем все значения слайдеров
-        exposure = float(self.editor_exposure.get())
-        contrast = float(self.editor_contrast.get())
-        highlights = float(self.editor_highlights.get())
-        shadows = float(self.editor_shadows.get())
-        brightness = float(self.editor_brightness.get())
-        saturation = float(self.editor_saturation.get())
-        temp = float(self.editor_temperature.get())
-        tint = float(self.editor_tint.get())
-        rotation = float(self.editor_rotation.get())
-        vertical = float(self.editor_vertical.get())
-        horizontal = float(self.editor_horizontal.get())
-        aspect = float(self.editor_aspect.get())
-        scale = float(self.editor_scale.get())
-        
-        # Новые параметры Darktable-style
-        distortion = float(self.editor_distortion.get())
-        vignette = float(self.editor_vignette.get())
-        chromatic = float(self.editor_chromatic.get())
-        sharpness = float(self.editor_sharpness.get())
-        denoise = float(self.editor_denoise.get())
-        clarity = float(self.editor_clarity.get())
-        
-        # Тоновая кривая
-        curve_blacks = float(self.editor_curve_blacks.get())
-        curve_shadows = float(self.editor_curve_shadows.get())
-        curve_midtones = float(self.editor_curve_midtones.get())
-        curve_highlights = float(self.editor_curve_highlights.get())
-        curve_whites = float(self.editor_curve_whites.get())
-        
-        # Проверяем нужны ли цветовые коррекции
-        need_color = (abs(exposure) > 0.01 or abs(brightness - 1.0) > 0.01 or 
-                     abs(contrast - 1.0) > 0.01 or abs(saturation - 1.0) > 0.01 or
-                     abs(temp) > 1 or abs(tint) > 1 or abs(highlights) > 1 or abs(shadows) > 1)
-        
-        # Проверяем нужны ли новые эффекты
-        need_lens = abs(distortion) > 1 or abs(vignette) > 1 or abs(chromatic) > 1
-        need_detail = sharpness > 1 or denoise > 1 or abs(clarity) > 1
-        need_curve = (abs(curve_blacks) > 1 or abs(curve_shadows) > 1 or 
-                     abs(curve_midtones) > 1 or abs(curve_highlights) > 1 or abs(curve_whites) > 1)
-        
-        # Проверяем нужны ли геометрические трансформации
-        shift_x = float(self.editor_shift_x.get())
-        shift_y = float(self.editor_shift_y.get())
-        need_geom = (abs(rotation) > 0.1 or abs(vertical) > 0.5 or 
-                    abs(horizontal) > 0.5 or abs(aspect) > 0.5 or scale > 0.5 or
-                    abs(shift_x) > 0.5 or abs(shift_y) > 0.5 or abs(distortion) > 1)
-        
-        if not need_color and not need_geom:
-            # Ничего не изменилось - показываем оригинал
-            self.editor_current_image = Image.fromarray(self.editor_original_array.astype(np.uint8))
-            self.editor_display_image()
+        pyramid = self._get_preview_pyramid()
+        top = max(pyramid)
+        if level is None or level not in pyramid:
+            level = top
+        
+        pipeline = self.editor_pipelines.setdefault(level, develop_engine.DevelopPipeline())
+        source = pyramid[level]
+        settings = self._collect_settings()
+        # Снимок параметров масок: кисть и слайдеры меняют их, пока идёт рендер
+        # (плитки TiledMask читаются под её замком)
+        masks = [dict(mask_data) for mask_data in self.editor_masks]
+        pixel_scale = level / top
+        top_h, top_w = pyramid[top].shape[:2]
+        show_clipping = self.editor_show_clipping
+        
+        def render():
+            arr = pipeline.render(source, settings, masks=masks,
+                                  pixel_scale=pixel_scale, checker=True, draft=draft)
+            # Анализ кадра - здесь же, не в UI-потоке; шахматный фон
+            # геометрии в гистограмму и клиппинг не попадает
+            coverage = pipeline.coverage
+            histogram = develop_engine.compute_histogram(arr, coverage=coverage)
+            clipping = develop_engine.clipping_map(arr, coverage) if show_clipping else None
+            return (Image.fromarray(arr), (level, pipeline.result_version, pipeline.last_dirty),
+                    (top_w, top_h), histogram, clipping)
+        
+        # UI не ждёт рендер: поток возьмёт самый свежий запрос
+        self.editor_render_worker.submit(render)
+    
+    def _on_render_done(self, generation, result, error=None):
+        """Показывает кадр из потока рендера, если он новее уже показанного"""
+        if generation <= self.editor_shown_generation:
             return
-        
-        # Работаем с numpy массивом
-        arr = self.editor_original_array.copy()
-        
-        # === ЦВЕТОВЫЕ КОРРЕКЦИИ (объединённые для скорости) ===
-        if need_color:
-            # Объединяем экспозицию и яркость в один множитель
-            color_mult = 1.0
-            if abs(exposure) > 0.01:
-                color_mult *= (2 ** exposure)
-            if abs(brightness - 1.0) > 0.01:
-                color_mult *= brightness
-            
-            if color_mult != 1.0:
-                arr = arr * color_mult
-            
-            # Контраст
-            if abs(contrast - 1.0) > 0.01:
-                arr = (arr - 128) * contrast + 128
-            
-            # Насыщенность
-            if abs(saturation - 1.0) > 0.01:
-                lum = 0.299 * arr[:,:,0] + 0.587 * arr[:,:,1] + 0.114 * arr[:,:,2]
-                arr = lum[:,:,np.newaxis] + (arr - lum[:,:,np.newaxis]) * saturation
-            
-            # Хайлайты (света)
-            if abs(highlights) > 1:
-                lum = 0.299 * arr[:,:,0] + 0.587 * arr[:,:,1] + 0.114 * arr[:,:,2]
-                highlight_mask = np.clip((lum - 150) / 80, 0, 1)[:,:,np.newaxis]
-                factor = 1 + highlights / 100
-                arr = arr * (1 - highlight_mask) + arr * factor * highlight_mask
-            
-            # Тени
-            if abs(shadows) > 1:
-                lum = 0.299 * arr[:,:,0] + 0.587 * arr[:,:,1] + 0.114 * arr[:,:,2]
-                shadow_mask = np.clip((80 - lum) / 60, 0, 1)[:,:,np.newaxis]
-                factor = 1 + shadows / 100
-                arr = arr * (1 - shadow_mask) + arr * factor * shadow_mask
-            
-            # Температура и тинт (объединённые)
-            if abs(temp) > 1 or abs(tint) > 1:
-                if abs(temp) > 1:
-                    arr[:,:,0] += temp * 0.6
-                    arr[:,:,2] -= temp * 0.6
-                if abs(tint) > 1:
-                    arr[:,:,1] -= tint * 0.5
-                    arr[:,:,0] += tint * 0.2
-                    arr[:,:,2] += tint * 0.2
-            
-            arr = np.clip(arr, 0, 255)
-        
-        # === ТОНОВАЯ КРИВАЯ (Darktable-style) ===
-        if need_curve:
-            # Создаём LUT для кривой
-            lut = np.arange(256, dtype=np.float32)
-            
-            # Применяем точки кривой
-            # Чёрные (0-50)
-            if abs(curve_blacks) > 1:
-                mask = lut < 50
-                lut[mask] = lut[mask] + curve_blacks * 0.5
-            
-            # Тени (50-100)
-            if abs(curve_shadows) > 1:
-                mask = (lut >= 30) & (lut < 100)
-                lut[mask] = lut[mask] + curve_shadows * 0.4
-            
-            # Средние тона (100-180)
-            if abs(curve_midtones) > 1:
-                mask = (lut >= 80) & (lut < 180)
-                lut[mask] = lut[mask] + curve_midtones * 0.5
-            
-            # Света (180-220)
-            if abs(curve_highlights) > 1:
-                mask = (lut >= 150) & (lut < 230)
-                lut[mask] = lut[mask] + curve_highlights * 0.4
-            
-            # Белые (220-255)
-            if abs(curve_whites) > 1:
-                mask = lut >= 200
-                lut[mask] = lut[mask] + curve_whites * 0.5
-            
-            lut = np.clip(lut, 0, 255).astype(np.uint8)
-            arr = lut[arr.astype(np.uint8)]
-        
-        # === ВИНЬЕТКА ===
-        if abs(vignette) > 1:
-            h, w = arr.shape[:2]
-            Y, X = np.ogrid[:h, :w]
-            cx, cy = w / 2, h / 2
-            dist = np.sqrt((X - cx)**2 + (Y - cy)**2)
-            max_dist = np.sqrt(cx**2 + cy**2)
-            vignette_mask = dist / max_dist
-            
-            if vignette > 0:
-                # Затемнение по краям
-                factor = 1 - (vignette_mask ** 2) * (vignette / 100)
-            else:
-                # Осветление по краям
-                factor = 1 + (vignette_mask ** 2) * (abs(vignette) / 100)
-            
-            arr = arr * factor[:, :, np.newaxis]
-            arr = np.clip(arr, 0, 255)
-        
-        img = Image.fromarray(arr.astype(np.uint8))
-        
-        # === РЕЗКОСТЬ И ШУМОПОДАВЛЕНИЕ (через OpenCV) ===
-        if need_detail:
-            arr = np.array(img)
-            
-            # Шумоподавление (Bilateral Filter)
-            if denoise > 1:
-                d = int(denoise / 10) + 3
-                sigma = denoise / 2
-                arr = cv2.bilateralFilter(arr, d, sigma, sigma)
-            
-            # Резкость (Unsharp Mask)
-            if sharpness > 1:
-                blur = cv2.GaussianBlur(arr, (0, 0), 3)
-                amount = sharpness / 100
-                arr = cv2.addWeighted(arr, 1 + amount, blur, -amount, 0)
-            
-            # Clarity (локальный контраст)
-            if abs(clarity) > 1:
-                blur = cv2.GaussianBlur(arr, (0, 0), 50)
-                amount = clarity / 200
-                arr = cv2.addWeighted(arr, 1 + amount, blur, -amount, 0)
-            
-            arr = np.clip(arr, 0, 255)
-            img = Image.fromarray(arr.astype(np.uint8))
-        
-        # === ГЕОМЕТРИЧЕСКИЕ ТРАНСФОРМАЦИИ (только если нужны) ===
-        if not need_geom:
-            self.editor_current_image = img
-            self.editor_display_image()
+        if error is not None:
+            # Кадра не будет: на экране остаётся прежний, ошибку видно в строке состояния
+            self.editor_shown_generation = generation
+            self.status_bar.configure(text=f"⚠️ Ошибка рендера превью: {error}")
             return
-        
-        try:
-            arr = np.array(img)
-            h, w = arr.shape[:2]
-            
-            # === ДИСТОРСИЯ ОБЪЕКТИВА (Darktable-style) ===
-            if abs(distortion) > 1:
-                # Barrel/Pincushion distortion через OpenCV
-                cx, cy = w / 2, h / 2
-                fx = fy = max(w, h)
-                
-                # Матрица камеры
-                K = np.array([[fx, 0, cx],
-                              [0, fy, cy],
-                              [0, 0, 1]], dtype=np.float32)
-                
-                # Коэффициенты дисторсии (k1 - радиальная)
-                k1 = distortion / 5000  # Масштабируем для плавности
-                dist_coeffs = np.array([k1, 0, 0, 0, 0], dtype=np.float32)
-                
-                # Применяем undistort
-                arr = cv2.undistort(arr, K, dist_coeffs)
-            
-            # === ПЕРСПЕКТИВА ===
-            # Используем алгоритм Darktable ashift если доступен
-            if DARKTABLE_ASHIFT_AVAILABLE and hasattr(self, 'perspective_algo') and self.perspective_algo.get() == "Darktable (ashift)":
-                # Точный алгоритм Darktable
-                dt = DarktableAshift(w, h)
-                H = dt.get_homography(rotation=rotation, vertical=vertical, horizontal=horizontal,
-                                     shear=0, orthocorr=0, aspect=1.0, forward=False)
-            else:
-                # Стандартный алгоритм через yaw/pitch/roll
-                pitch_deg = vertical * 0.3   # верх/низ (keystone по вертикали)
-                yaw_deg = horizontal * 0.3   # лево/право (keystone по горизонтали)
-                roll_deg = rotation          # Z-ось (поворот)
-                
-                H = self._build_rotation_homography(yaw_deg, pitch_deg, roll_deg, w, h)
-                
-                # Нормализация (Center Preservation) - чтобы не улетало
-                H = self._normalize_homography(H, w, h)
-            
-            # Aspect ratio (растяжение по горизонтали/вертикали)
-            if abs(aspect) > 0.5:
-                cx, cy = w / 2, h / 2
-                a = 1.0 + aspect / 100.0 * 0.3
-                A = np.array([
-                    [a, 0, cx - cx*a],
-                    [0, 1/a, cy - cy/a],
-                    [0, 0, 1]
-                ], dtype=np.float32)
-                H = A @ H
-            
-            # Scale (масштаб / зум)
-            # Слайдер 0..100 мапим в Zoom 1.0..3.0
-            scale_val = float(self.editor_scale.get())
-            if scale_val > 0.01:
-                cx, cy = w / 2, h / 2
-                zoom = 1.0 + (scale_val / 50.0)  # 0->1.0, 50->2.0, 100->3.0
-                s = 1.0 / zoom  # H maps Dst->Src, so s<1 means Zoom In
-                
-                S = np.array([
-                    [s, 0, cx - cx*s],
-                    [0, s, cy - cy*s],
-                    [0, 0, 1]
-                ], dtype=np.float32)
-                H = S @ H
-            
-            # Сдвиг X/Y (translate) — применяется после основной гомографии
-            # Но так как мы используем WARP_INVERSE_MAP, матрица применяется как dst -> src?
-            # Нет, WARP_INVERSE_MAP означает, что мы подаем matrix src -> dst (forward).
-            # Значит, H - это трансформация, которую мы применяем к картинке.
-            # Если мы хотим сдвинуть картинку ВПРАВО, то пиксель dst(x,y) берется из src(x-dx, y-dy).
-            # Матрица сдвига T(dx, dy) делает x' = x + dx.
-            # С WARP_INVERSE_MAP, это значит dst = T * src.
-            
-            shift_x = float(self.editor_shift_x.get())
-            shift_y = float(self.editor_shift_y.get())
-            if abs(shift_x) > 0.5 or abs(shift_y) > 0.5:
-                T = np.array([
-                    [1, 0, shift_x],
-                    [0, 1, shift_y],
-                    [0, 0, 1]
-                ], dtype=np.float32)
-                H = T @ H
-            
-            # Применяем трансформацию (пустые области = шахматный фон)
-            if not np.allclose(H, np.eye(3)):
-                checker = np.zeros((h, w, 3), dtype=np.uint8)
-                cell = 16
-                for row in range(0, h, cell):
-                    for col in range(0, w, cell):
-                        color = (80, 80, 90) if ((row // cell + col // cell) % 2 == 0) else (50, 50, 60)
-                        checker[row:row+cell, col:col+cell] = color
-                
-                # ВАЖНО: WARP_INVERSE_MAP, так как H у нас - это матрица прямой трансформации (как исправить картинку)
-                result = cv2.warpPerspective(arr, H, (w, h),
-                                             flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
-                                             borderMode=cv2.BORDER_CONSTANT,
-                                             borderValue=(0, 0, 0))
-                
-                mask = cv2.warpPerspective(np.ones((h, w), dtype=np.uint8) * 255, H, (w, h),
-                                          flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
-                                          borderMode=cv2.BORDER_CONSTANT,
-                                          borderValue=0)
-                mask_3d = mask[:, :, np.newaxis] / 255.0
-                arr = (result * mask_3d + checker * (1 - mask_3d)).astype(np.uint8)
-            
-            img = Image.fromarray(arr)
-        
-        except ImportError:
-            # Fallback без OpenCV — только поворот
-            if abs(rotation) > 0.1:
-                img = img.rotate(-rotation, expand=False, resample=Image.Resampling.BILINEAR, fillcolor=(30, 30, 40))
-        
-        self.editor_current_image = img
-        self.editor_display_image()
+        image, (level, version, last_dirty), display_size, histogram, clipping = result
+        
+        # Кадр отличается от показанного только прямоугольником (мазок кисти) -
+        # обновляем на экране только его
+        dirty = None
+        shown = self.editor_shown_frame
+        if (last_dirty is not None and shown is not None and shown[:2] == (level, last_dirty[0]) and
+                shown[2] is self.editor_current_image):
+            dirty = last_dirty[1]
+        
+        self.editor_shown_generation = generation
+        self.editor_shown_frame = (level, version, image)
+        self.editor_current_image = image
+        self.editor_current_display_size = (image, display_size)
+        self.editor_clipping = clipping
+        self._draw_histogram(histogram)
+        self.editor_display_image(dirty=dirty)
+    
+    def _discard_pending_renders(self):
+        """Отбрасывает кадры, заказанные для предыдущего состояния редактора"""
+        self.editor_shown_generation = self.editor_render_worker.discard()
+        self.editor_shown_frame = None
+        self.editor_clipping = None
     
     def editor_apply_adjustments(self):
-        """Полное применение настроек (для сохранения)"""
-        self.editor_apply_adjustments_fast()
+        """
+        Полное применение настроек (для сохранения): синхронная проявка
+        текущего фото в полном разрешении. editor_apply_adjustments_fast
+        только ставит превью в очередь рендера - кадр после него ещё не готов.
+        
+        Returns:
+            PIL.Image или None, если фото не загружено
+        """
+        if not self.editor_image_path:
+            return None
+        return self._render_full_resolution()
     
     def _apply_color_temperature(self, img, temp, tint):
         """Применяет цветовую температуру и тинт"""
@@ -5677,7 +5847,7 @@ end tell
     
     def editor_auto_vertical(self):
         """Полная автоматическая коррекция по 3 осям (Lightroom Full Upright) с использованием Solver"""
-        if not self.editor_original_image:
+        if self.editor_original_array is None:
             messagebox.showwarning("Внимание", "Сначала загрузите изображение")
             return
         
@@ -5806,7 +5976,7 @@ end tell
 
     def editor_auto_lens_correction(self):
         """Автоматическая коррекция объектива через Lensfun (как в Darktable)"""
-        if not self.editor_original_image:
+        if self.editor_original_array is None:
             messagebox.showwarning("Внимание", "Сначала загрузите изображение")
             return
         
@@ -5997,11 +6167,19 @@ end tell
         
         # Режим рисования маски кистью
         if self.editor_mask_mode == "drawing" and self.editor_current_mask_index >= 0:
+            # Состояние до мазка (например, только что созданная маска)
+            self._save_to_history()
             self.editor_mask_drawing = True
             self._draw_mask_brush(event.x, event.y)
             self._apply_masks_preview()
             return
         
+        # Градиентная маска: протяжка от точки нажатия
+        if self.editor_mask_mode == "gradient" and self._current_gradient_mask() is not None:
+            self._save_to_history()
+            self.editor_gradient_start = (event.x, event.y)
+            return
+        
         # Режим рисования гайдов
         if self.editor_show_guides:
             # Проверяем клик по существующему гайду для выбора/удаления
@@ -6046,10 +6224,13 @@ end tell
         # Режим рисования маски кистью
         if self.editor_mask_mode == "drawing" and self.editor_mask_drawing:
             self._draw_mask_brush(event.x, event.y)
-            # Обновляем превью каждые N пикселей для плавности
-            if not hasattr(self, '_last_mask_update') or abs(event.x - self._last_mask_update[0]) > 10 or abs(event.y - self._last_mask_update[1]) > 10:
-                self._last_mask_update = (event.x, event.y)
-                self._apply_masks_preview()
+            # Превью пересчитывается только в прямоугольнике мазков, поэтому
+            # обновляем его на каждое движение (поток рендера берёт последний запрос)
+            self._apply_masks_preview()
+            return
+        
+        if self.editor_mask_mode == "gradient" and self.editor_gradient_start is not None:
+            self._drag_gradient_mask(event.x, event.y)
             return
         
         if self.editor_show_guides and self.editor_guide_start:
@@ -6165,8 +6346,14 @@ end tell
     def editor_canvas_release(self, event):
         """Завершение рисования гайда или маски"""
         # Завершение рисования маски
-        if self.editor_mask_mode == "brush" and self.editor_mask_drawing:
+        if self.editor_mask_mode == "drawing" and self.editor_mask_drawing:
             self.editor_mask_drawing = False
+            self._save_to_history()  # Мазок - один шаг undo
+            return
+        
+        if self.editor_mask_mode == "gradient" and self.editor_gradient_start is not None:
+            self.editor_gradient_start = None
+            self._save_to_history()  # Протяжка - один шаг undo
             return
         
         if self.editor_show_guides and self.editor_guide_start:
@@ -6233,7 +6420,7 @@ end tell
     
     def editor_start_mask(self, mask_type):
         """Начинает режим маски"""
-        if not self.editor_original_image:
+        if self.editor_original_array is None:
             messagebox.showwarning("Внимание", "Сначала загрузите изображение")
             return
         
@@ -6248,15 +6435,15 @@ end tell
             logger.info("Brush mask mode started")
             
         elif mask_type == "highlights":
-            # Автоматическая маска светов (яркость > 180)
-            lum = 0.299 * self.editor_original_array[:,:,0] + 0.587 * self.editor_original_array[:,:,1] + 0.114 * self.editor_original_array[:,:,2]
+            # Автоматическая маска светов (яркость > 180); яркость исходника - из общего кэша
+            lum = develop_engine.source_luminance(self.editor_original_array)
             self.editor_mask_array = np.clip((lum - 150) / 80, 0, 1).astype(np.float32)
             self._show_mask_overlay()
             logger.info("Highlights mask created")
             
         elif mask_type == "shadows":
             # Автоматическая маска теней (яркость < 80)
-            lum = 0.299 * self.editor_original_array[:,:,0] + 0.587 * self.editor_original_array[:,:,1] + 0.114 * self.editor_original_array[:,:,2]
+            lum = develop_engine.source_luminance(self.editor_original_array)
             self.editor_mask_array = np.clip((80 - lum) / 60, 0, 1).astype(np.float32)
             self._show_mask_overlay()
             logger.info("Shadows mask created")
@@ -6304,8 +6491,7 @@ end tell
         
         # Насыщенность
         if abs(saturation - 1.0) > 0.01:
-            lum = 0.299 * arr[:,:,0] + 0.587 * arr[:,:,1] + 0.114 * arr[:,:,2]
-            lum = lum[:,:,np.newaxis]
+            lum = develop_engine.luminance(arr)[:,:,np.newaxis]
             corrected = lum + (arr - lum) * saturation
             arr = arr * (1 - mask_3d) + corrected * mask_3d
         
@@ -6375,13 +6561,12 @@ end tell
         feather = max(1, brush_size // 3)
         brush_mask = np.clip(1 - (dist - brush_size + feather) / feather, 0, 1)
         
-        # Применяем к маске в зависимости от режима
-        if self.mask_brush_mode == "erase":
-            # Ластик: уменьшаем маску
-            mask_array[y1:y2, x1:x2] = np.maximum(0, mask_array[y1:y2, x1:x2] - brush_mask.astype(np.float32))
-        else:
-            # Кисть: увеличиваем маску
-            mask_array[y1:y2, x1:x2] = np.maximum(mask_array[y1:y2, x1:x2], brush_mask.astype(np.float32))
+        # Кисть увеличивает маску, ластик уменьшает (только затронутые плитки)
+        mask_array.paint(y1, y2, x1, x2, brush_mask, erase=self.mask_brush_mode == "erase")
+        
+        # Новая версия - только после изменения массива (кэш растушёвки);
+        # по версии маски конвейер находит прямоугольник мазков для превью
+        mask_data['version'] = mask_array.version
     
     def _editor_right_click(self, event):
         """ПКМ на редакторе - контекстное меню"""
@@ -6411,12 +6596,16 @@ end tell
         try:
             # Сохраняем во временный файл
             import tempfile
+            import datetime
             temp_dir = tempfile.gettempdir()
             timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
             temp_path = os.path.join(temp_dir, f"editor_export_{timestamp}.jpg")
             
-            # Сохраняем текущее изображение (с примененными эффектами)
-            img_to_save = self.editor_current_image
+            # Сохраняем текущее изображение (с примененными эффектами, полное разрешение)
+            if self.editor_image_path:
+                img_to_save = self._render_full_resolution()
+            else:
+                img_to_save = self.editor_current_image
             if img_to_save.mode in ('RGBA', 'LA', 'P'):
                 img_to_save = img_to_save.convert('RGB')
             
@@ -6459,54 +6648,149 @@ end tell
         )
         
         if path:
-            self.editor_current_image.save(path, quality=95)
+            # Сохраняем в полном разрешении (превью уменьшено до editor_preview_max)
+            self._render_full_resolution().save(path, quality=95)
             logger.info(f"Saved edited image: {path}")
             messagebox.showinfo("Сохранено", f"Изображение сохранено:\n{path}")
     
+    def _editor_setting_sliders(self):
+        """Соответствие ключей настроек проявки и слайдеров редактора"""
+        return {
+            'exposure': self.editor_exposure,
+            'contrast': self.editor_contrast,
+            'highlights': self.editor_highlights,
+            'shadows': self.editor_shadows,
+            'brightness': self.editor_brightness,
+            'saturation': self.editor_saturation,
+            'temperature': self.editor_temperature,
+            'tint': self.editor_tint,
+            'vertical': self.editor_vertical,
+            'horizontal': self.editor_horizontal,
+            'rotation': self.editor_rotation,
+            'shift_x': self.editor_shift_x,
+            'shift_y': self.editor_shift_y,
+            'aspect': self.editor_aspect,
+            'scale': self.editor_scale,
+            'distortion': self.editor_distortion,
+            'vignette': self.editor_vignette,
+            'chromatic': self.editor_chromatic,
+            'curve_blacks': self.editor_curve_blacks,
+            'curve_shadows': self.editor_curve_shadows,
+            'curve_midtones': self.editor_curve_midtones,
+            'curve_highlights': self.editor_curve_highlights,
+            'curve_whites': self.editor_curve_whites,
+            'lut_strength': self.editor_lut_strength,
+            'sharpness': self.editor_sharpness,
+            'denoise': self.editor_denoise,
+            'clarity': self.editor_clarity,
+        }
+    
+    def _collect_settings(self):
+        """Собирает настройки проявки из слайдеров в dict для develop_engine"""
+        settings = {key: float(slider.get()) for key, slider in self._editor_setting_sliders().items()}
+        settings['perspective_algo'] = self.perspective_algo.get()
+        settings['denoise_mode'] = self.editor_denoise_modes[self.editor_denoise_mode.get()]
+        settings['lut_path'] = self.editor_lut_path
+        return settings
+    
     def _save_current_settings(self):
-        """Сохраняет текущие настройки в библиотеку"""
+        """
+        Сохраняет текущие настройки (и маски) в библиотеку.
+        
+        В каталог пишутся только настройки, отличающиеся от сохранённых
+        (для нового фото - от настроек по умолчанию): простой просмотр
+        библиотеки ничего не записывает.
+        """
         if not self.editor_image_path:
             return
         
-        settings = {
-            'exposure': self.editor_exposure.get(),
-            'contrast': self.editor_contrast.get(),
-            'brightness': self.editor_brightness.get(),
-            'saturation': self.editor_saturation.get(),
-            'temperature': self.editor_temperature.get(),
-            'tint': self.editor_tint.get(),
-            'vertical': self.editor_vertical.get(),
-            'horizontal': self.editor_horizontal.get(),
-            'rotation': self.editor_rotation.get(),
-            'aspect': self.editor_aspect.get(),
-            'scale': self.editor_scale.get(),
-        }
+        settings = self._collect_settings()
         
         # Ищем в библиотеке
-        for item in self.editor_library:
-            if item['path'] == self.editor_image_path:
-                item['settings'] = settings
-                return
+        item = next((item for item in self.editor_library if item['path'] == self.editor_image_path), None)
+        if item is None:
+            # Добавляем новый
+            item = {'path': self.editor_image_path, 'settings': None}
+            self.editor_library.append(item)
+        item['masks'] = self.editor_masks
+        
+        saved = develop_engine.normalize_settings(item['settings'])
+        changed = any(abs(value - saved[key]) >= 0.001 if isinstance(value, float) else value != saved[key]
+                      for key, value in settings.items())
+        if changed:
+            item['settings'] = settings
+            self._queue_catalog_settings([(self.editor_image_path, settings)])
+    
+    def _queue_catalog_settings(self, items):
+        """
+        Ставит настройки (список (path, settings)) в очередь записи в каталог.
         
-        # Добавляем новый
-        self.editor_library.append({
-            'path': self.editor_image_path,
-            'settings': settings
-        })
+        Очередь пишется одной транзакцией через editor_catalog_flush_delay
+        (листание библиотеки не дёргает SQLite на каждом фото), а также
+        перед чтением каталога и при закрытии окна.
+        """
+        if not self.editor_catalog:
+            return
+        self.editor_catalog_pending.update(items)
+        if self.editor_catalog_flush_id is None:
+            self.editor_catalog_flush_id = self.after(self.editor_catalog_flush_delay,
+                                                      self._flush_catalog_settings)
+    
+    def _flush_catalog_settings(self):
+        """Записывает очередь настроек в каталог"""
+        if self.editor_catalog_flush_id is not None:
+            self.after_cancel(self.editor_catalog_flush_id)
+            self.editor_catalog_flush_id = None
+        if not self.editor_catalog or not self.editor_catalog_pending:
+            return
+        items = list(self.editor_catalog_pending.items())
+        self.editor_catalog_pending = {}
+        try:
+            self.editor_catalog.save_settings(items)
+        except Exception as e:
+            logger.error(f"Catalog save error: {e}")
     
     def _load_settings(self, settings):
-        """Загружает настройки из словаря"""
-        self.editor_exposure.set(settings.get('exposure', 0.0))
-        self.editor_contrast.set(settings.get('contrast', 1.0))
-        self.editor_brightness.set(settings.get('brightness', 1.0))
-        self.editor_saturation.set(settings.get('saturation', 1.0))
-        self.editor_temperature.set(settings.get('temperature', 0))
-        self.editor_tint.set(settings.get('tint', 0))
-        self.editor_vertical.set(settings.get('vertical', 0))
-        self.editor_horizontal.set(settings.get('horizontal', 0))
-        self.editor_rotation.set(settings.get('rotation', 0))
-        self.editor_aspect.set(settings.get('aspect', 0))
-        self.editor_scale.set(settings.get('scale', 100))
+        """Загружает настройки из словаря (недостающие — по умолчанию)"""
+        settings = develop_engine.normalize_settings(settings)
+        for key, slider in self._editor_setting_sliders().items():
+            slider.set(settings[key])
+        if settings['perspective_algo'] in self.perspective_algo.cget("values"):
+            self.perspective_algo.set(settings['perspective_algo'])
+        for label, mode in self.editor_denoise_modes.items():
+            if mode == settings['denoise_mode']:
+                self.editor_denoise_mode.set(label)
+        self._set_editor_lut(settings['lut_path'])
+    
+    def _set_editor_lut(self, path):
+        """Запоминает .cube LUT текущего фото и показывает её имя"""
+        self.editor_lut_path = path
+        self.editor_lut_label.configure(text=os.path.basename(path) if path else "Нет")
+    
+    def editor_load_lut(self):
+        """Выбор .cube LUT: файл разбирается сразу, чтобы ошибка формата была видна при выборе"""
+        path = filedialog.askopenfilename(filetypes=[("3D LUT", "*.cube")])
+        if not path:
+            return
+        try:
+            develop_engine.load_cube_lut(path)
+        except Exception as e:
+            logger.error(f"LUT load error: {e}")
+            messagebox.showerror("LUT", f"Не удалось загрузить LUT:\n{e}")
+            return
+        self._set_editor_lut(path)
+        self.editor_apply_adjustments_fast()
+    
+    def editor_clear_lut(self):
+        """Убирает .cube LUT"""
+        self._set_editor_lut(None)
+        self.editor_apply_adjustments_fast()
+    
+    def _render_full_resolution(self):
+        """Проявляет текущее фото в полном разрешении текущими настройками"""
+        return develop_engine.develop_file(self.editor_image_path, self._collect_settings(),
+                                           masks=self.editor_masks,
+                                           preview_max=self.editor_preview_max)
     
     def editor_load_folder(self):
         """Загрузка папки с фотографиями"""
@@ -6514,21 +6798,26 @@ end tell
         if not folder:
             return
         
-        # Ищем изображения
-        extensions = ('.jpg', '.jpeg', '.png', '.webp', '.tiff')
-        files = sorted([f for f in os.listdir(folder) if f.lower().endswith(extensions)])
+        # Ищем изображения: через каталог (индексированный запрос, заголовки
+        # перечитываются только у новых и изменившихся файлов) или сканированием
+        if self.editor_catalog:
+            self._flush_catalog_settings()
+            photos = self.editor_catalog.open_folder(folder)
+        else:
+            files = sorted([f for f in os.listdir(folder) if f.lower().endswith(catalog.IMAGE_EXTENSIONS)])
+            photos = [{'path': os.path.join(folder, f), 'settings': None} for f in files]
         
-        if not files:
+        if not photos:
             messagebox.showwarning("Пусто", "В папке нет изображений")
             return
         
         # Создаём библиотеку
         self.editor_library = []
         self.editor_selected_indices = set()  # Для мульти-выбора
-        for f in files:
+        for photo in photos:
             self.editor_library.append({
-                'path': os.path.join(folder, f),
-                'settings': None,
+                'path': photo['path'],
+                'settings': photo['settings'],
                 'selected': False
             })
         
@@ -6536,7 +6825,7 @@ end tell
         self._load_library_image(0)
         self._update_filmstrip()
         
-        messagebox.showinfo("Загружено", f"Загружено {len(files)} фотографий\n\n← → навигация\nShift+клик - мульти-выбор\nCmd+A - применить ко всем выбранным")
+        messagebox.showinfo("Загружено", f"Загружено {len(photos)} фотографий\n\n← → навигация\nShift+клик - мульти-выбор\nCmd+A - применить ко всем выбранным")
     
     def _load_library_image(self, index):
         """Загружает изображение из библиотеки по индексу"""
@@ -6549,121 +6838,176 @@ end tell
         self.editor_current_index = index
         item = self.editor_library[index]
         
-        # Загружаем изображение
+        # Загружаем изображение: готовое превью из предзагрузки или с диска
         self.editor_image_path = item['path']
-        self.editor_original_image = Image.open(item['path']).convert("RGB")
-        orig_w, orig_h = self.editor_original_image.size
-        
-        # Preview
-        if max(orig_w, orig_h) > self.editor_preview_max:
-            scale = self.editor_preview_max / max(orig_w, orig_h)
-            new_size = (int(orig_w * scale), int(orig_h * scale))
-            self.editor_preview_image = self.editor_original_image.resize(new_size, Image.Resampling.LANCZOS)
+        entry = self.editor_prefetcher.take(item['path'])
+        if entry is not None:
+            preview, size = entry['preview'], entry['size']
+            self.editor_original_array = entry['array']
         else:
-            self.editor_preview_image = self.editor_original_image
-        
-        self.editor_original_array = np.array(self.editor_preview_image, dtype=np.float32)
-        
-        # Загружаем настройки если есть
+            preview, size = develop_engine.load_preview(item['path'], self.editor_preview_max)
+            self.editor_original_array = preview.astype(np.float32)
+        self.editor_preview_image = Image.fromarray(preview)
+        # Оригинал в памяти не держим (и файл не остаётся открытым): экспорт
+        # читает его с диска сам (develop_engine.develop_file)
+        self.editor_original_image = None
+        self.editor_original_size = size
+        
+        # Загружаем настройки и маски если есть
         if item['settings']:
             self._load_settings(item['settings'])
         else:
             self.editor_reset_sliders()
+        self.editor_masks = item.get('masks') or []
+        self.editor_current_mask_index = -1
+        self.editor_mask_mode = None
+        # История undo - у каждого снимка своя (в ней его маски)
+        self.editor_history = []
+        self.editor_history_index = -1
+        self._update_masks_list()
         
-        self.editor_current_image = self.editor_preview_image.copy()
+        self._discard_pending_renders()
         self.editor_zoom_level = 1.0
         self.editor_zoom_offset = (0, 0)
+        
+        ready = (entry is not None and entry['image'] is not None and
+                 entry['render_key'] == develop_engine.Prefetcher.render_key(item['settings'], self.editor_masks))
+        if ready:
+            # Проявлено заранее: показываем сразу, а конвейер предзагрузки
+            # отдаём превью - рендер ниже возьмёт стадии из его кэша
+            top = max(self._get_preview_pyramid())
+            self.editor_pipelines[top] = entry['pipeline']
+            self.editor_current_image = Image.fromarray(entry['image'])
+            self.editor_display_image()
+        else:
+            self.editor_current_image = self.editor_preview_image.copy()
         self.editor_apply_adjustments_fast()
         
         logger.info(f"Loaded {index+1}/{len(self.editor_library)}: {os.path.basename(item['path'])}")
         self._highlight_filmstrip_selection()
+        self._schedule_prefetch()
+    
+    def _schedule_prefetch(self):
+        """Ставит соседей текущего фото в фоновую подготовку (ближние и следующие - первыми)"""
+        items = []
+        for offset in range(1, self.editor_prefetch_radius + 1):
+            for index in (self.editor_current_index + offset, self.editor_current_index - offset):
+                if 0 <= index < len(self.editor_library):
+                    item = self.editor_library[index]
+                    items.append((item['path'], item['settings'], item.get('masks')))
+        self.editor_prefetcher.schedule(items)
     
     def _update_filmstrip(self):
-        """Обновляет filmstrip с превью всех фотографий"""
-        self.filmstrip_canvas.delete("all")
-        self.filmstrip_thumbnails = []
-        
-        if not self.editor_library:
-            return
-        
-        thumb_size = 60
-        padding = 5
-        x_offset = padding
+        """
+        Обновляет filmstrip после смены библиотеки.
         
-        for i, item in enumerate(self.editor_library):
-            try:
-                # Создаём thumbnail
-                img = Image.open(item['path'])
-                img.thumbnail((thumb_size, thumb_size), Image.Resampling.LANCZOS)
-                
-                # Центрируем по вертикали
-                y_offset = (70 - img.height) // 2
-                
-                photo = ImageTk.PhotoImage(img)
-                self.filmstrip_thumbnails.append(photo)
-                
-                # Рисуем thumbnail
-                self.filmstrip_canvas.create_image(x_offset, y_offset, anchor="nw", 
-                                                   image=photo, tags=f"thumb_{i}")
-                
-                # Рамка (выделение для текущего и мульти-выбора)
-                is_current = (i == self.editor_current_index)
-                is_selected = hasattr(self, 'editor_selected_indices') and i in self.editor_selected_indices
-                
-                if is_current:
-                    border_color = "#00ff00"  # Зелёный для текущего
-                    border_width = 3
-                elif is_selected:
-                    border_color = "#ffaa00"  # Оранжевый для выбранных
-                    border_width = 2
-                else:
-                    border_color = "#444444"
-                    border_width = 1
-                
-                self.filmstrip_canvas.create_rectangle(
-                    x_offset - 2, y_offset - 2,
-                    x_offset + img.width + 2, y_offset + img.height + 2,
-                    outline=border_color, width=border_width, tags=f"border_{i}"
+        Слоты фиксированной ширины: элементы создаются только для видимой
+        части (_render_filmstrip_window), миниатюры приходят из фона.
+        """
+        self.filmstrip_canvas.delete("all")
+        self.filmstrip_items = {}
+        
+        slot = self.filmstrip_thumb_size + self.filmstrip_padding
+        width = self.filmstrip_padding + len(self.editor_library) * slot
+        self.filmstrip_canvas.configure(scrollregion=(0, 0, width, 70))
+        self._render_filmstrip_window()
+    
+    def _filmstrip_slot_x(self, index):
+        """Левый край слота миниатюры index на canvas"""
+        return self.filmstrip_padding + index * (self.filmstrip_thumb_size + self.filmstrip_padding)
+    
+    def _render_filmstrip_window(self):
+        """Создаёт элементы для видимых слотов (+ запас), удаляет ушедшие за край"""
+        canvas = self.filmstrip_canvas
+        count = len(self.editor_library)
+        slot = self.filmstrip_thumb_size + self.filmstrip_padding
+        left = canvas.canvasx(0)
+        right = left + (canvas.winfo_width() or 800)
+        first = max(0, int(left // slot) - self.filmstrip_margin)
+        last = min(count, int(right // slot) + 1 + self.filmstrip_margin)
+        
+        for index in [i for i in self.filmstrip_items if not first <= i < last]:
+            for item in self.filmstrip_items.pop(index):
+                canvas.delete(item)
+        
+        missing = []
+        for index in range(first, last):
+            if index not in self.filmstrip_items:
+                self.filmstrip_items[index] = (
+                    canvas.create_image(0, 0, anchor="nw"),
+                    canvas.create_rectangle(0, 0, 0, 0, fill="#2a2a2a"),
                 )
-                
-                # Клик для выбора (с поддержкой Shift внутри обработчика)
-                self.filmstrip_canvas.tag_bind(f"thumb_{i}", "<Button-1>", 
-                                               lambda e, idx=i: self._filmstrip_click(idx, e))
-                self.filmstrip_canvas.tag_bind(f"border_{i}", "<Button-1>", 
-                                               lambda e, idx=i: self._filmstrip_click(idx, e))
-                
-                # ПКМ для контекстного меню (Button-2 для Mac, Button-3 для Windows/Linux)
-                self.filmstrip_canvas.tag_bind(f"thumb_{i}", "<Button-2>", 
-                                               lambda e, idx=i: self._filmstrip_right_click(idx, e))
-                self.filmstrip_canvas.tag_bind(f"border_{i}", "<Button-2>", 
-                                               lambda e, idx=i: self._filmstrip_right_click(idx, e))
-                self.filmstrip_canvas.tag_bind(f"thumb_{i}", "<Button-3>", 
-                                               lambda e, idx=i: self._filmstrip_right_click(idx, e))
-                self.filmstrip_canvas.tag_bind(f"border_{i}", "<Button-3>", 
-                                               lambda e, idx=i: self._filmstrip_right_click(idx, e))
-                self.filmstrip_canvas.tag_bind(f"thumb_{i}", "<Control-Button-1>", 
-                                               lambda e, idx=i: self._filmstrip_right_click(idx, e))
-                self.filmstrip_canvas.tag_bind(f"border_{i}", "<Control-Button-1>", 
-                                               lambda e, idx=i: self._filmstrip_right_click(idx, e))
-                
-                x_offset += img.width + padding
-                
-            except Exception as e:
-                logger.error(f"Filmstrip thumbnail error: {e}")
-                x_offset += thumb_size + padding
-        
-        # Настраиваем scroll region
-        self.filmstrip_canvas.configure(scrollregion=(0, 0, x_offset, 70))
-        
-        # Scroll колёсиком
-        self.filmstrip_canvas.bind("<MouseWheel>", self._filmstrip_scroll)
+                self._layout_filmstrip_item(index)
+            path = self.editor_library[index]['path']
+            if path not in self.filmstrip_thumbnails:
+                missing.append(path)
+        
+        # Сначала видимые, затем запас
+        visible = set(self.editor_library[i]['path'] for i in range(first, last)
+                      if left <= self._filmstrip_slot_x(i) + slot and self._filmstrip_slot_x(i) <= right)
+        missing.sort(key=lambda path: path not in visible)
+        self.filmstrip_loader.schedule(missing)
+    
+    def _layout_filmstrip_item(self, index):
+        """Расставляет миниатюру и рамку слота (заглушка, пока миниатюры нет)"""
+        canvas = self.filmstrip_canvas
+        image_item, border_item = self.filmstrip_items[index]
+        size = self.filmstrip_thumb_size
+        path = self.editor_library[index]['path']
+        photo = self.filmstrip_thumbnails.pop(path, None)
+        if photo is not None:
+            # Порядок вставки = порядок использования (LRU): видимые не вытесняются
+            self.filmstrip_thumbnails[path] = photo
+        w, h = (photo.width(), photo.height()) if photo is not None else (size, size)
+        
+        # Центрируем по вертикали
+        x = self._filmstrip_slot_x(index)
+        y = (70 - h) // 2
+        canvas.coords(image_item, x, y)
+        canvas.itemconfigure(image_item, image=photo or "")
+        canvas.coords(border_item, x - 2, y - 2, x + w + 2, y + h + 2)
+        # Рамка поверх миниатюры: у заглушки - с серой заливкой
+        canvas.itemconfigure(border_item, fill="" if photo is not None else "#2a2a2a")
+        canvas.tag_raise(border_item, image_item)
+        
+        color, width = self._filmstrip_border_style(index)
+        canvas.itemconfigure(border_item, outline=color, width=width)
+    
+    def _on_filmstrip_thumbnail(self, path, image):
+        """Миниатюра из фонового декодера: в кэш и в видимые слоты с этим файлом"""
+        self.filmstrip_thumbnails[path] = ImageTk.PhotoImage(image)
+        while len(self.filmstrip_thumbnails) > self.filmstrip_thumbnails_max:
+            del self.filmstrip_thumbnails[next(iter(self.filmstrip_thumbnails))]
+        
+        for index in self.filmstrip_items:
+            if index < len(self.editor_library) and self.editor_library[index]['path'] == path:
+                self._layout_filmstrip_item(index)
+    
+    def _filmstrip_event(self, event, handler):
+        """Передаёт событие canvas обработчику с индексом миниатюры под курсором"""
+        x = self.filmstrip_canvas.canvasx(event.x)
+        slot = self.filmstrip_thumb_size + self.filmstrip_padding
+        index = int((x - self.filmstrip_padding) // slot)
+        # Клик между миниатюрами (в отступе) - мимо
+        if not 0 <= index < len(self.editor_library):
+            return
+        if x - self._filmstrip_slot_x(index) > self.filmstrip_thumb_size + 2:
+            return
+        handler(index, event)
+    
+    def _filmstrip_border_style(self, index, with_selection=True):
+        """Цвет и толщина рамки: текущее фото, выбранное (мульти-выбор) или обычное"""
+        if index == self.editor_current_index:
+            return "#00ff00", 3  # Зелёный для текущего
+        if with_selection and index in getattr(self, 'editor_selected_indices', ()):
+            return "#ffaa00", 2  # Оранжевый для выбранных
+        return "#444444", 1
     
     def _highlight_filmstrip_selection(self):
         """Подсвечивает текущее фото в filmstrip"""
-        for i in range(len(self.editor_library)):
-            border_color = "#00ff00" if i == self.editor_current_index else "#444444"
-            border_width = 3 if i == self.editor_current_index else 1
-            self.filmstrip_canvas.itemconfig(f"border_{i}", outline=border_color, width=border_width)
+        for index, (_, border_item) in self.filmstrip_items.items():
+            color, width = self._filmstrip_border_style(index, with_selection=False)
+            self.filmstrip_canvas.itemconfig(border_item, outline=color, width=width)
     
     def _filmstrip_click(self, index, event):
         """Обработка клика на filmstrip с проверкой Shift"""
@@ -6699,21 +7043,9 @@ end tell
     
     def _update_filmstrip_borders(self):
         """Обновляет только рамки в filmstrip (быстрее чем полная перерисовка)"""
-        for i in range(len(self.editor_library)):
-            is_current = (i == self.editor_current_index)
-            is_selected = hasattr(self, 'editor_selected_indices') and i in self.editor_selected_indices
-            
-            if is_current:
-                border_color = "#00ff00"
-                border_width = 3
-            elif is_selected:
-                border_color = "#ffaa00"
-                border_width = 2
-            else:
-                border_color = "#444444"
-                border_width = 1
-            
-            self.filmstrip_canvas.itemconfig(f"border_{i}", outline=border_color, width=border_width)
+        for index, (_, border_item) in self.filmstrip_items.items():
+            color, width = self._filmstrip_border_style(index)
+            self.filmstrip_canvas.itemconfig(border_item, outline=color, width=width)
     
     def editor_apply_to_selected(self):
         """Применяет текущие настройки ко всем выбранным фото и обрабатывает их"""
@@ -6722,23 +7054,7 @@ end tell
             return
         
         # Получаем текущие настройки
-        settings = {
-            'exposure': self.editor_exposure.get(),
-            'contrast': self.editor_contrast.get(),
-            'highlights': self.editor_highlights.get(),
-            'shadows': self.editor_shadows.get(),
-            'brightness': self.editor_brightness.get(),
-            'saturation': self.editor_saturation.get(),
-            'temperature': self.editor_temperature.get(),
-            'tint': self.editor_tint.get(),
-            'vertical': self.editor_vertical.get(),
-            'horizontal': self.editor_horizontal.get(),
-            'rotation': self.editor_rotation.get(),
-            'shift_x': self.editor_shift_x.get(),
-            'shift_y': self.editor_shift_y.get(),
-            'aspect': self.editor_aspect.get(),
-            'scale': self.editor_scale.get(),
-        }
+        settings = self._collect_settings()
         
         # Логируем для отладки
         logger.info(f"Applying settings to {len(self.editor_selected_indices)} photos: {list(self.editor_selected_indices)}")
@@ -6753,6 +7069,9 @@ end tell
                 count += 1
                 logger.info(f"Applied to photo {idx}: {self.editor_library[idx]['path']}")
         
+        self._queue_catalog_settings([(self.editor_library[idx]['path'], settings)
+                                      for idx in applied_indices])
+        
         # Сбрасываем выбор
         self.editor_selected_indices.clear()
         self._update_filmstrip_borders()
@@ -6762,6 +7081,7 @@ end tell
     def _filmstrip_scroll(self, event):
         """Scroll filmstrip колёсиком"""
         self.filmstrip_canvas.xview_scroll(-1 if event.delta > 0 else 1, "units")
+        self._render_filmstrip_window()
     
     def _filmstrip_right_click(self, index, event):
         """ПКМ на filmstrip - контекстное меню"""
@@ -6812,14 +7132,17 @@ end tell
                 
                 if path and os.path.exists(path):
                     try:
-                        img = Image.open(path)
-                        
-                        # Если есть сохранённые настройки - применяем их
+                        # Если есть сохранённые настройки - проявляем во временный файл
                         if item.get('settings'):
-                            # Применяем настройки к изображению
-                            settings = item['settings']
-                            # Здесь можно добавить применение настроек
-                            # Пока просто используем оригинал
+                            img = develop_engine.develop_file(path, item['settings'],
+                                                              masks=item.get('masks'),
+                                                              preview_max=self.editor_preview_max)
+                            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+                            path = os.path.join(tempfile.gettempdir(),
+                                                f"editor_export_{timestamp}_{idx}.jpg")
+                            img.save(path, 'JPEG', quality=95)
+                        else:
+                            img = Image.open(path)
                         
                         # Добавляем в раскадровку
                         self.storyboard_images.append({
@@ -6861,6 +7184,8 @@ end tell
         if self.editor_library:
             self._load_library_image(self.editor_current_index)
         else:
+            self._discard_pending_renders()
+            self.editor_prefetcher.schedule([])
             self.editor_canvas.delete("all")
             self.editor_current_image = None
         
@@ -6875,7 +7200,13 @@ end tell
             self._load_library_image(new_index)
     
     def editor_export_all(self):
-        """Экспорт всех фотографий с применёнными настройками"""
+        """Экспорт всех фотографий с применёнными настройками (в фоне, на всех ядрах)"""
+        # Повторное нажатие во время экспорта - отмена
+        if self.editor_exporter and self.editor_exporter.running:
+            self.editor_exporter.cancel()
+            self.status_bar.configure(text="⏹️ Экспорт: отмена, дожидаемся начатых файлов...")
+            return
+        
         if not self.editor_library:
             messagebox.showwarning("Библиотека пуста", "Сначала загрузите папку с фотографиями")
             return
@@ -6888,75 +7219,55 @@ end tell
         if not folder:
             return
         
-        exported = 0
+        # Те же настройки и маски, что видны в превью, проявляются в полном разрешении
+        jobs = []
         for item in self.editor_library:
             if not item['settings']:
                 continue
-            
-            try:
-                # Загружаем оригинал
-                img = Image.open(item['path']).convert("RGB")
-                arr = np.array(img, dtype=np.float32)
-                s = item['settings']
-                
-                # Применяем настройки
-                if abs(s.get('exposure', 0)) > 0.01:
-                    arr = arr * (2 ** s['exposure'])
-                if abs(s.get('brightness', 1) - 1) > 0.01:
-                    arr = arr * s['brightness']
-                if abs(s.get('contrast', 1) - 1) > 0.01:
-                    arr = (arr - 128) * s['contrast'] + 128
-                if abs(s.get('saturation', 1) - 1) > 0.01:
-                    lum = 0.299 * arr[:,:,0] + 0.587 * arr[:,:,1] + 0.114 * arr[:,:,2]
-                    lum = lum[:,:,np.newaxis]
-                    arr = lum + (arr - lum) * s['saturation']
-                if abs(s.get('temperature', 0)) > 1:
-                    arr[:,:,0] += s['temperature'] * 0.6
-                    arr[:,:,2] -= s['temperature'] * 0.6
-                if abs(s.get('tint', 0)) > 1:
-                    arr[:,:,1] -= s['tint'] * 0.5
-                
-                arr = np.clip(arr, 0, 255)
-                result = Image.fromarray(arr.astype(np.uint8))
-                
-                # Геометрия через OpenCV
-                if any(abs(s.get(k, 0)) > 0.5 for k in ['rotation', 'vertical', 'horizontal']):
-                    import cv2
-                    arr = np.array(result)
-                    h, w = arr.shape[:2]
-                    cx, cy = w/2, h/2
-                    M = np.eye(3, dtype=np.float32)
-                    
-                    if abs(s.get('rotation', 0)) > 0.1:
-                        cos_r = np.cos(np.radians(-s['rotation']))
-                        sin_r = np.sin(np.radians(-s['rotation']))
-                        R = np.array([[cos_r, -sin_r, cx - cx*cos_r + cy*sin_r],
-                                     [sin_r, cos_r, cy - cx*sin_r - cy*cos_r],
-                                     [0, 0, 1]], dtype=np.float32)
-                        M = R @ M
-                    
-                    if abs(s.get('vertical', 0)) > 0.5:
-                        v = s['vertical'] / 100.0 * 0.0015
-                        P = np.array([[1,0,0],[0,1,0],[0,v,1]], dtype=np.float32)
-                        M = P @ M
-                    
-                    if abs(s.get('horizontal', 0)) > 0.5:
-                        hz = s['horizontal'] / 100.0 * 0.0015
-                        P = np.array([[1,0,0],[0,1,0],[hz,0,1]], dtype=np.float32)
-                        M = P @ M
-                    
-                    arr = cv2.warpPerspective(arr, M, (w, h), borderValue=(30,30,40))
-                    result = Image.fromarray(arr)
-                
-                # Сохраняем
-                name = os.path.basename(item['path'])
-                result.save(os.path.join(folder, f"edited_{name}"), quality=95)
-                exported += 1
-                
-            except Exception as e:
-                logger.error(f"Export error for {item['path']}: {e}")
+            name = os.path.basename(item['path'])
+            jobs.append({
+                'path': item['path'],
+                'output': os.path.join(folder, f"edited_{name}"),
+                'settings': dict(item['settings']),
+                'masks': develop_engine.active_masks(item.get('masks')),
+                'preview_max': self.editor_preview_max,
+                'quality': 95,
+            })
         
-        messagebox.showinfo("Экспорт завершён", f"Экспортировано {exported} из {len(self.editor_library)} фотографий")
+        if not jobs:
+            messagebox.showinfo("Экспорт", "Нет фотографий с настройками для экспорта")
+            return
+        
+        total_library = len(self.editor_library)
+        self.editor_exporter = develop_engine.BatchExporter(
+            jobs,
+            on_progress=lambda done, total, eta, path: self.after(
+                0, lambda: self._on_export_progress(done, total, eta, path)),
+            on_done=lambda exported, errors, cancelled: self.after(
+                0, lambda: self._on_export_done(exported, errors, cancelled, total_library)))
+        self.editor_exporter.start()
+        
+        self.editor_export_btn.configure(text="⏹️ Отмена", fg_color=COLORS["danger"],
+                                         hover_color=COLORS["danger_hover"])
+        self.status_bar.configure(
+            text=f"📤 Экспорт {len(jobs)} фото ({self.editor_exporter.workers} процессов)...")
+    
+    def _on_export_progress(self, done, total, eta, path):
+        """Прогресс пакетного экспорта (в главном потоке)"""
+        minutes, seconds = divmod(int(eta), 60)
+        self.status_bar.configure(
+            text=f"📤 Экспорт {done}/{total} ({done * 100 // total}%), осталось ~{minutes}:{seconds:02d} "
+                 f"- {os.path.basename(path)}")
+    
+    def _on_export_done(self, exported, errors, cancelled, total_library):
+        """Завершение пакетного экспорта (в главном потоке)"""
+        self.editor_export_btn.configure(text="📤 Экспорт", fg_color=COLORS["teal"], hover_color="#0D9488")
+        self.status_bar.configure(text=f"✅ Экспортировано {exported} фото" +
+                                       (f", ошибок: {errors}" if errors else "") +
+                                       (" (отменено)" if cancelled else ""))
+        title = "Экспорт отменён" if cancelled else "Экспорт завершён"
+        messagebox.showinfo(title, f"Экспортировано {exported} из {total_library} фотографий" +
+                                   (f"\nОшибок: {errors}" if errors else ""))
     
     def editor_toggle_wb_picker(self):
         """Включает режим выбора точки для баланса белого"""
@@ -11504,6 +11815,15 @@ end tell
         """Обработчик закрытия окна - сохраняем состояние"""
         self.save_autosave()
         
+        # Настройки открытого в редакторе фото - в каталог
+        if getattr(self, 'editor_catalog', None):
+            try:
+                self._save_current_settings()
+                self._flush_catalog_settings()
+                self.editor_catalog.close()
+            except Exception as e:
+                logger.error(f"Catalog save error: {e}")
+        
         # Останавливаем автокликер если запущен
         if hasattr(self, 'ac_stop_all'):
             self.ac_stop_all()
@@ -11532,6 +11852,9 @@ def start_main_app():
 
 
 if __name__ == "__main__":
+    # Процессы пакетного экспорта в собранном приложении (PyInstaller)
+    multiprocessing.freeze_support()
+    
     try:
         logger.info("--- Global Start ---")
         
@@ -0,0 +1,85 @@
+"""Каталог библиотеки: пересканирование папки, миниатюры и настройки"""
+
+import os
+import time
+
+import pytest
+from PIL import Image
+
+import catalog
+
+
+@pytest.fixture
+def library(tmp_path):
+    folder = tmp_path / 'photos'
+    folder.mkdir()
+    for i in range(3):
+        Image.new('RGB', (40, 30)).save(folder / f'{i}.jpg')
+    cat = catalog.Catalog(str(tmp_path / 'catalog.sqlite'), str(tmp_path / 'thumbnails'))
+    yield cat, str(folder)
+    cat.close()
+
+
+def touch_thumbnails(cat, photos):
+    for photo in photos:
+        with open(os.path.join(cat.thumbnail_dir, photo['thumbnail']), 'wb') as f:
+            f.write(b'jpg')
+
+
+def test_open_folder_reads_headers(library):
+    cat, folder = library
+    photos = cat.open_folder(folder)
+    assert [os.path.basename(p['path']) for p in photos] == ['0.jpg', '1.jpg', '2.jpg']
+    assert all((p['width'], p['height'], p['settings']) == (40, 30, None) for p in photos)
+
+
+def test_rescan_picks_up_file_edited_in_place(library):
+    cat, folder = library
+    photos = cat.open_folder(folder)
+    touch_thumbnails(cat, photos)
+    cat.save_settings([(photos[0]['path'], {'exposure': 1.0})])
+
+    # Правка на месте не меняет mtime папки - каталог всё равно её видит
+    folder_mtime = os.stat(folder).st_mtime
+    Image.new('RGB', (80, 60)).save(photos[0]['path'])
+    later = time.time() + 5
+    os.utime(photos[0]['path'], (later, later))
+    os.utime(folder, (folder_mtime, folder_mtime))
+
+    edited = cat.open_folder(folder)[0]
+    assert (edited['width'], edited['height']) == (80, 60)
+    assert edited['settings'] == {'exposure': 1.0}  # настройки пережили правку файла
+    assert edited['thumbnail'] != photos[0]['thumbnail']
+    # Миниатюра прежней версии файла удалена из кэша
+    assert sorted(os.listdir(cat.thumbnail_dir)) == sorted(p['thumbnail'] for p in photos[1:])
+
+
+def test_rescan_drops_removed_files_and_thumbnails(library):
+    cat, folder = library
+    photos = cat.open_folder(folder)
+    touch_thumbnails(cat, photos)
+
+    os.remove(photos[1]['path'])
+    assert [p['path'] for p in cat.open_folder(folder)] == [photos[0]['path'], photos[2]['path']]
+    assert sorted(os.listdir(cat.thumbnail_dir)) == sorted([photos[0]['thumbnail'], photos[2]['thumbnail']])
+
+
+def test_get_settings(library, monkeypatch):
+    cat, folder = library
+    photos = cat.open_folder(folder)
+    cat.save_settings([(photos[0]['path'], {'exposure': 0.5}), (photos[2]['path'], {'contrast': 1.2})])
+
+    # Относительный путь возвращается так, как его передали
+    monkeypatch.chdir(folder)
+    monkeypatch.setattr(catalog, 'QUERY_CHUNK', 2)
+    paths = ['0.jpg', photos[1]['path'], photos[2]['path'], os.path.join(folder, 'missing.jpg')]
+    assert cat.get_settings(paths) == {'0.jpg': {'exposure': 0.5}, photos[2]['path']: {'contrast': 1.2}}
+
+
+def test_save_settings_adds_photo_outside_catalog(library, tmp_path):
+    cat, folder = library
+    path = str(tmp_path / 'single.png')
+    Image.new('RGB', (20, 10)).save(path)
+
+    cat.save_settings([(path, {'exposure': -1.0})])
+    assert cat.get_settings([path]) == {path: {'exposure': -1.0}}
@@ -0,0 +1,58 @@
+"""Цветовая 3D LUT против прямого расчёта apply_color + apply_curve"""
+
+import numpy as np
+import pytest
+
+import develop_engine as de
+
+
+@pytest.fixture(scope='module')
+def image():
+    return np.random.default_rng(0).integers(0, 256, (128, 128, 3), dtype=np.uint8)
+
+
+def direct(arr, s):
+    out = np.asarray(arr, dtype=np.float32)
+    if de.needs_color(s):
+        out = de.apply_color(out, s)
+    if de.needs_curve(s):
+        out = de.apply_curve(out, s)
+    return out
+
+
+def lut_error(image, settings):
+    s = de.normalize_settings(settings)
+    result = de.apply_lut3d(image, de.build_color_lut(s))
+    return np.abs(np.asarray(result, dtype=np.float32) - direct(image, s))
+
+
+def test_linear_settings_are_exact(image):
+    # Экспозиция, контраст и насыщенность линейны - trilinear их не искажает
+    error = lut_error(image, {'exposure': -1.5, 'contrast': 0.6, 'saturation': 0.3})
+    assert error.max() < 0.01
+
+
+@pytest.mark.parametrize('settings', [
+    {'exposure': 0.7, 'contrast': 1.3, 'saturation': 1.4, 'brightness': 1.1,
+     'temperature': 20, 'tint': -10, 'highlights': -40, 'shadows': 30},
+    {'highlights': 80, 'shadows': -70, 'temperature': -50},
+])
+def test_color_sliders_error_bound(image, settings):
+    error = lut_error(image, settings)
+    assert error.mean() < 0.25
+    assert error.max() < 8
+
+
+def test_tone_curve_error_bound(image):
+    # Кривая ступенчатая (диапазоны по порогам), у порогов ошибка
+    # интерполяции сетки 33^3 больше
+    error = lut_error(image, {'contrast': 1.2, 'curve_blacks': 20, 'curve_shadows': 30,
+                              'curve_midtones': 10, 'curve_highlights': -30, 'curve_whites': -20})
+    assert error.mean() < 1.5
+    assert error.max() < 12
+
+
+def test_lut_is_cached_per_color_settings():
+    s = de.normalize_settings({'exposure': 0.5})
+    assert de.build_color_lut(s) is de.build_color_lut(dict(s, sharpness=50))
+    assert de.build_color_lut(s) is not de.build_color_lut(dict(s, exposure=0.6))
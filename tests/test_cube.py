@@ -0,0 +1,63 @@
+"""Разбор .cube 3D LUT"""
+
+import numpy as np
+import pytest
+
+import develop_engine as de
+
+
+def cube_rows(size, func):
+    """Строки данных .cube: быстрее всех меняется R"""
+    grid = np.linspace(0, 1, size)
+    return [' '.join(f'{v:.6f}' for v in func(r, g, b))
+            for b in grid for g in grid for r in grid]
+
+
+def check(r, g, b):
+    return r, 0.5 * g, 1 - b
+
+
+def test_channel_order():
+    text = '\n'.join(['TITLE "order"', 'LUT_3D_SIZE 2'] + cube_rows(2, check))
+    lut = de.parse_cube(text)
+
+    assert lut.shape == (2, 2, 2, 3) and lut.dtype == np.float32
+    for r in (0, 1):
+        for g in (0, 1):
+            for b in (0, 1):
+                np.testing.assert_allclose(lut[r, g, b], np.array(check(r, g, b)) * 255, atol=1e-3)
+
+
+def test_whitespace_and_comments():
+    rows = cube_rows(2, check)
+    text = '\r\n'.join(['# LUT с комментариями', '  TITLE\t"tabs"',
+                        'LUT_3D_SIZE\t2   # размер', 'DOMAIN_MIN\t0 0 0', 'DOMAIN_MAX 1\t1 1', ''] +
+                       [row.replace(' ', '\t') for row in rows[:4]] +
+                       ['   ' + row + '  ' for row in rows[4:]])
+    reference = de.parse_cube('\n'.join(['LUT_3D_SIZE 2'] + rows))
+    np.testing.assert_array_equal(de.parse_cube(text), reference)
+
+
+@pytest.mark.parametrize('header', [
+    ['DOMAIN_MIN 0 0 0', 'DOMAIN_MAX 2 2 2'],
+    ['LUT_3D_INPUT_RANGE 0 2'],
+])
+def test_domain_is_resampled_to_unit_range(header):
+    # Вход 0..2, выход - половина входа: на решётке 0..1 это 0, 0.25, 0.5
+    grid = np.linspace(0, 2, 3)
+    rows = [f'{r / 2} {g / 2} {b / 2}' for b in grid for g in grid for r in grid]
+    lut = de.parse_cube('\n'.join(['LUT_3D_SIZE 3'] + header + rows))
+
+    unit = np.linspace(0, 1, 3)
+    expected = np.stack(np.meshgrid(unit, unit, unit, indexing='ij'), axis=-1) / 2 * 255
+    np.testing.assert_allclose(lut, expected, atol=1e-3)
+
+
+@pytest.mark.parametrize('text, message', [
+    ('LUT_1D_SIZE 4\n0 0 0\n', '1D'),
+    ('0 0 0\n1 1 1\n', 'LUT_3D_SIZE'),
+    ('LUT_3D_SIZE 2\n0 0 0\n1 1 1\n', 'строк'),
+])
+def test_invalid_files(text, message):
+    with pytest.raises(ValueError, match=message):
+        de.parse_cube(text)
@@ -0,0 +1,58 @@
+"""develop_strips (полное разрешение полосами) против develop (весь кадр)"""
+
+import cv2
+import numpy as np
+import pytest
+
+import develop_engine as de
+
+
+@pytest.fixture(scope='module')
+def image():
+    rng = np.random.default_rng(0)
+    base = (rng.random((14, 20, 3)) * 255).astype(np.uint8)
+    image = cv2.resize(base, (1000, 700), interpolation=cv2.INTER_CUBIC)
+    return np.clip(image + rng.normal(0, 6, image.shape), 0, 255).astype(np.uint8)
+
+
+@pytest.fixture(scope='module')
+def masks():
+    # Маска в разрешении превью (вдвое меньше кадра)
+    mask = np.zeros((350, 500), dtype=np.float32)
+    mask[100:250, 150:300] = 1
+    return [{'name': 'm', 'array': mask, 'exposure': 0.8, 'highlights': 0, 'shadows': 0,
+             'temperature': 10, 'saturation': 1.2, 'feather': 20}]
+
+
+def develop_both(image, settings, masks):
+    full = de.develop(image.copy(), settings, masks=masks, pixel_scale=1.25)
+    # Полосы ниже ореола детализации: develop_strips должен сам их увеличить
+    strips = de.develop_strips(image.copy(), settings, masks=masks, pixel_scale=1.25, strip_rows=128)
+    return full, strips
+
+
+@pytest.mark.parametrize('settings', [
+    {'exposure': 0.5, 'vignette': -30, 'sharpness': 60, 'denoise': 40, 'clarity': 30},
+    {'contrast': 1.2, 'sharpness': 40},
+    {'saturation': 1.3, 'clarity': -50},
+])
+def test_tone_and_detail_match_full_frame(image, masks, settings):
+    full, strips = develop_both(image, settings, masks)
+    assert strips.shape == full.shape
+    assert np.array_equal(strips, full)
+
+
+@pytest.mark.parametrize('settings', [
+    {'vertical': 10, 'rotation': 3, 'sharpness': 30},
+    {'distortion': 20, 'chromatic': 30},
+    {'horizontal': -15, 'scale': 10, 'shift_x': 5, 'exposure': 0.3},
+])
+def test_geometry_matches_full_frame(image, masks, settings):
+    full, strips = develop_both(image, settings, masks)
+    assert np.array_equal(strips, full)
+
+
+def test_source_buffer_is_reused(image):
+    arr = image.copy()
+    result = de.develop_strips(arr, {'exposure': 0.3}, strip_rows=128)
+    assert np.shares_memory(result, arr)
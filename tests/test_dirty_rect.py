@@ -0,0 +1,93 @@
+"""Частичный пересчёт после мазка кисти против пересчёта всего кадра"""
+
+import cv2
+import numpy as np
+import pytest
+
+import develop_engine as de
+
+
+@pytest.fixture(scope='module')
+def image():
+    rng = np.random.default_rng(0)
+    base = (rng.random((20, 30, 3)) * 255).astype(np.uint8)
+    image = cv2.resize(base, (800, 533), interpolation=cv2.INTER_LINEAR)
+    return np.clip(image + rng.normal(0, 8, image.shape), 0, 255).astype(np.uint8)
+
+
+def new_mask(feather, shape=(533, 800)):
+    mask = de.TiledMask(*shape)
+    mask.paint(100, 160, 100, 180, np.ones((60, 80), dtype=np.float32))
+    return {'name': 'm', 'array': mask, 'exposure': 1.0, 'highlights': 0, 'shadows': 0,
+            'temperature': 0, 'saturation': 1.0, 'feather': feather, 'version': mask.version}
+
+
+def stroke(mask_data, y, x, erase=False):
+    yy, xx = np.mgrid[0:60, 0:80]
+    values = np.exp(-((yy - 30) ** 2 + (xx - 40) ** 2) / 400).astype(np.float32)
+    mask = mask_data['array']
+    mask.paint(y, y + 60, x, x + 80, values, erase=erase)
+    mask_data['version'] = mask.version
+
+
+@pytest.mark.parametrize('settings', [
+    {},
+    {'sharpness': 50},
+    {'denoise': 40},
+    {'denoise': 40, 'denoise_mode': 'guided'},
+    {'sharpness': 60, 'denoise': 30, 'vignette': -20},
+])
+@pytest.mark.parametrize('feather', [0, 30])
+@pytest.mark.parametrize('where', [(200, 300), (473, 720)])  # середина и угол кадра
+def test_patched_render_matches_full_render(image, settings, feather, where):
+    mask_data = new_mask(feather)
+    pipeline = de.DevelopPipeline()
+    pipeline.render(image, settings, masks=[mask_data])
+
+    stroke(mask_data, *where)
+    patched = pipeline.render(image, settings, masks=[mask_data])
+    assert pipeline.last_dirty is not None
+
+    full = de.DevelopPipeline().render(image, settings, masks=[dict(mask_data)])
+    np.testing.assert_array_equal(patched, full)
+
+    # Вне возвращённого прямоугольника кадр не изменился
+    y0, y1, x0, x1 = pipeline.last_dirty[1]
+    outside = np.ones(full.shape[:2], dtype=bool)
+    outside[y0:y1, x0:x1] = False
+    before = de.DevelopPipeline().render(image, settings, masks=[new_mask(feather)])
+    np.testing.assert_array_equal(full[outside], before[outside])
+
+
+def test_incremental_feather_matches_full_blur():
+    rng = np.random.default_rng(1)
+    mask_data = new_mask(20, shape=(300, 450))
+    de.feathered_mask(mask_data)
+    for i in range(10):
+        stroke(mask_data, rng.integers(0, 240), rng.integers(0, 370), erase=i % 4 == 3)
+        result = de.feathered_mask(mask_data)
+
+    expected = de.feather_mask(mask_data['array'].to_array(), 20)
+    np.testing.assert_allclose(result, expected, atol=1e-6)
+
+
+def test_masks_dirty_rect():
+    mask_data = new_mask(10)
+    old_key = de.masks_key([mask_data])
+
+    # Ничего не изменилось - пустой список изменений не даёт прямоугольника
+    assert de.masks_dirty_rect(old_key, [mask_data], 800, 533) is None
+
+    stroke(mask_data, 200, 300)
+    y0, y1, x0, x1 = de.masks_dirty_rect(old_key, [mask_data], 800, 533)
+    assert (y0, x0) <= (200 - 10, 300 - 10) and (y1, x1) >= (260 + 10, 380 + 10)
+
+    # Кадр вдвое больше маски - прямоугольник масштабируется
+    y0, y1, x0, x1 = de.masks_dirty_rect(old_key, [mask_data], 1600, 1066)
+    assert y0 <= 2 * 190 and x0 <= 2 * 290 and y1 >= 2 * 270 and x1 >= 2 * 390
+
+    # Изменение параметров или состава масок - полный пересчёт
+    assert de.masks_dirty_rect(old_key, [dict(mask_data, exposure=0.5)], 800, 533) is None
+    assert de.masks_dirty_rect(old_key, [mask_data, new_mask(10)], 800, 533) is None
+    assert de.masks_dirty_rect(old_key, [dict(mask_data, array=mask_data['array'].copy())],
+                               800, 533) is None
@@ -0,0 +1,55 @@
+"""TiledMask: кисть/ластик по плиткам, копии и передача в процессы экспорта"""
+
+import pickle
+import threading
+
+import numpy as np
+
+import develop_engine as de
+
+
+def painted_mask():
+    mask = de.TiledMask(300, 500)
+    values = np.full((120, 200), 0.6, dtype=np.float32)
+    mask.paint(100, 220, 250, 450, values)  # через границы плиток
+    return mask
+
+
+def test_paint_matches_dense_array():
+    mask = painted_mask()
+    dense = np.zeros((300, 500), dtype=np.float32)
+    dense[100:220, 250:450] = 0.6
+
+    np.testing.assert_allclose(mask.to_array(), dense, atol=1 / 255)
+    assert abs(mask.max() - 0.6) < 1 / 255
+    # Память только под задетые плитки
+    assert 0 < mask.nbytes < dense.nbytes / 4
+
+
+def test_erase_drops_empty_tiles():
+    mask = painted_mask()
+    mask.paint(0, 300, 0, 500, np.ones((300, 500), dtype=np.float32), erase=True)
+    assert mask.tiles == {}
+    assert mask.max() == 0.0
+    assert not mask.to_array().any()
+
+
+def test_pickle_round_trip():
+    mask = painted_mask()
+    restored = pickle.loads(pickle.dumps(mask))
+
+    assert restored.shape == mask.shape
+    np.testing.assert_array_equal(restored.to_array(), mask.to_array())
+    # Замок пересоздан, копия рисуется независимо от оригинала
+    assert isinstance(restored._lock, type(threading.Lock()))
+    restored.paint(0, 10, 0, 10, np.ones((10, 10), dtype=np.float32))
+    assert not mask.to_array()[:10, :10].any()
+
+
+def test_copy_is_independent():
+    mask = painted_mask()
+    copy = mask.copy()
+    mask.paint(100, 220, 250, 450, np.ones((120, 200), dtype=np.float32), erase=True)
+
+    assert mask.max() == 0.0
+    assert abs(copy.max() - 0.6) < 1 / 255